@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+import sys
+import os
+import time
+import glob
+import json
+import Queue
+import getopt
+import platform
+import resource
+import multiprocessing
+
+sys.path.extend(('.', 'lib'))
+
+from data_comparison_helper import DataComparator
+from run_metrics import RunMetrics
+from generate_dumps import DumpGenerator
+
+""" Seconds between checks that a benchmark case process is still alive """
+CASE_POLL_SECONDS=5
+
+""" RunMetrics stages summed into each benchmark stage """
+STAGES={"parse":("list files","parse source","parse target"),
+        "diff":("diff","replica counts"),
+        "report":("report",)}
+
+""" The usage method"""
+def usage(error=None):
+    print """\
+    Benchmarks the parse, diff and report stages of the comparison tool on
+    synthetic dumps and saves the timings, throughput and peak RSS as JSON
+
+    Syntax: benchmark.py -w workDir -k keys[,keys...] [options]
+    Example: benchmark.py -w /tmp/bench -k 1000000,10000000 -o results.json
+
+    [Required Parameters]
+    -w      :: Work directory for the generated dumps
+    -k      :: Comma separated list of key counts to benchmark
+    [Optional Parameters]
+    -m        :: Comma separated list of modes, cbt and/or view (default cbt,view)
+    -n        :: Number of files (nodes) per side (default 4)
+    -j        :: Number of worker processes parsing the dumps (default 1)
+    -o        :: Write the results to this JSON file
+    --baseline :: Compare with the results JSON of an earlier run
+    --missing, --drift, --changed, --duplicate :: Injected discrepancy rates
+               (default 0.001 each)
+    -h      :: Help, will list the usage
+    """
+    if error:
+        print error
+
+""" Peak resident set size of this process in MB """
+def peakRssMB():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024.0
+
+""" Run compareDataInfoInCSVFormat and print its report """
+def benchmarkCSV(srcDir,tgtDir,jobs=1):
+    diffs=DataComparator.compareDataInfoInCSVFormat(srcDir,tgtDir,jobs)
+    with DataComparator.metrics.stage("report"):
+        DataComparator.printResultOfCSVFormatAnalysis(*diffs)
+    return {"srcOnly":len(diffs[0]),"tgtOnly":len(diffs[1]),"changed":len(diffs[2])}
+
+""" Run compareJasonFormatInfo and print its report """
+def benchmarkView(srcDir,tgtDir,jobs=1):
+    srcCount,tgtCount,diff1,diff2,diff3=DataComparator.compareJasonFormatInfo(srcDir,tgtDir,1,1,jobs)
+    with DataComparator.metrics.stage("report"):
+        DataComparator.printResultOfJasonFormatAnalysis(diff1,diff2,diff3,srcCount,tgtCount)
+    return {"srcOnly":len(diff1),"tgtOnly":len(diff2),"changed":len(diff3),
+            "srcReplicaCount":len(srcCount),"tgtReplicaCount":len(tgtCount)}
+
+""" Run one benchmark case, called in a child process so that peak RSS is per case
+    The comparison records its stages in a fresh RunMetrics, which are
+    summed up into the parse, diff and report timings by STAGES
+"""
+def runCase(mode,dumpDir,jobs,queue):
+    metrics=DataComparator.metrics=RunMetrics()
+    stdout=sys.stdout
+    sys.stdout=open(os.devnull,'w')
+    try:
+        benchmark=benchmarkCSV if mode == "cbt" else benchmarkView
+        counts=benchmark(os.path.join(dumpDir,"src"),os.path.join(dumpDir,"tgt"),jobs)
+    finally:
+        sys.stdout.close()
+        sys.stdout=stdout
+    timings={}
+    for name,stages in STAGES.iteritems():
+        timings[name]=sum(s["wallSeconds"] for s in metrics.stages if s["stage"] in stages)
+    records=metrics.toDict()["recordsParsed"]
+    total=sum(timings.values())
+    queue.put({"seconds":timings,"records":records,"recordsPerSecond":records/total if total else 0,
+               "peakRssMB":peakRssMB(),"discrepancies":counts,"stages":metrics.stages})
+
+""" Result of a benchmark case process, RuntimeError when it died without one """
+def caseResult(process,queue):
+    while True:
+        try:
+            return queue.get(timeout=CASE_POLL_SECONDS)
+        except Queue.Empty:
+            if process.is_alive():
+                continue
+        try:
+            return queue.get(timeout=1)
+        except Queue.Empty:
+            raise RuntimeError("Benchmark case died with exit code %s"%process.exitcode)
+
+def benchmarkCase(mode,keys,files,workDir,rates,jobs=1):
+    dumpDir=os.path.join(workDir,"%s-%d-%d"%(mode,keys,files))
+    manifestPath=os.path.join(dumpDir,"manifest.json")
+    if os.path.exists(manifestPath):
+        manifest=json.load(open(manifestPath))
+    else:
+        print "Generating",mode,"dumps with",keys,"keys ::",dumpDir
+        manifest=DumpGenerator(dumpDir,mode,files).generate(keys,**rates)
+    queue=multiprocessing.Queue()
+    process=multiprocessing.Process(target=runCase,args=(mode,dumpDir,jobs,queue))
+    process.start()
+    try:
+        result=caseResult(process,queue)
+    finally:
+        process.join()
+    result.update({"mode":mode,"keys":keys,"files":files,"jobs":jobs,"injected":manifest["injected"],
+                   "bytes":sum(os.path.getsize(f) for f in glob.glob(dumpDir+"/*/*"))})
+    return result
+
+""" Print the change of every case against a baseline run """
+def compareWithBaseline(results,baseline):
+    previous=dict(((c["mode"],c["keys"],c["files"]),c) for c in baseline["cases"])
+    for case in results["cases"]:
+        old=previous.get((case["mode"],case["keys"],case["files"]))
+        if old is None:
+            continue
+        for stage in ("parse","diff","report"):
+            ratio=case["seconds"][stage]/old["seconds"][stage] if old["seconds"][stage] else 0
+            print "%s %d keys :: %-6s :: %.2fs -> %.2fs (x%.2f)"%(case["mode"],case["keys"],stage,old["seconds"][stage],case["seconds"][stage],ratio)
+        print "%s %d keys :: peak RSS :: %.1fMB -> %.1fMB"%(case["mode"],case["keys"],old["peakRssMB"],case["peakRssMB"])
+
+def main():
+    workDir=None
+    keyCounts=[]
+    modes=["cbt","view"]
+    files=4
+    jobs=1
+    output=None
+    baseline=None
+    rates={"missing":0.001,"drift":0.001,"changed":0.001,"duplicate":0.001}
+    try:
+        (opts, args) = getopt.getopt(sys.argv[1:], 'w:k:m:n:j:o:h', ["help","baseline=","missing=","drift=","changed=","duplicate="])
+    except getopt.GetoptError, error:
+        usage("ERROR: " + str(error))
+        sys.exit(1)
+    for o, a in opts:
+        if o in ("-h","--help"):
+            usage()
+            sys.exit()
+        elif o == "-w":
+            workDir=a
+        elif o == "-k":
+            keyCounts=[int(k) for k in a.split(",")]
+        elif o == "-m":
+            modes=a.split(",")
+        elif o == "-n":
+            files=int(a)
+        elif o == "-j":
+            jobs=int(a)
+        elif o == "-o":
+            output=a
+        elif o == "--baseline":
+            baseline=json.load(open(a))
+        else:
+            rates[o[2:]]=float(a)
+    if workDir is None or not keyCounts:
+        usage("ERROR :: Missing Required Parameters")
+        sys.exit(1)
+    results={"timestamp":time.strftime("%Y-%m-%dT%H:%M:%S"),"python":platform.python_version(),
+             "host":platform.node(),"cpus":multiprocessing.cpu_count(),"cases":[]}
+    for keys in keyCounts:
+        for mode in modes:
+            try:
+                case=benchmarkCase(mode,keys,files,workDir,rates,jobs)
+            except RuntimeError, error:
+                print "ERROR ::",mode,keys,"keys ::",error
+                sys.exit(1)
+            results["cases"].append(case)
+            print "%s %d keys :: parse %.2fs diff %.2fs report %.2fs :: %d records/s :: peak RSS %.1fMB"%(
+                mode,keys,case["seconds"]["parse"],case["seconds"]["diff"],case["seconds"]["report"],
+                case["recordsPerSecond"],case["peakRssMB"])
+    if output:
+        with open(output,'w') as f:
+            json.dump(results,f,indent=2)
+    if baseline:
+        compareWithBaseline(results,baseline)
+
+if __name__ == "__main__":
+    main()
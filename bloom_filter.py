@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+import math
+
+""" Number of bit positions set for every item """
+DEFAULT_NUM_HASHES=7
+
+HALF_MASK=0xffffffff
+
+""" Bloom filter over 64 bit digests in a fixed size bit array
+    The k bit positions of an item are derived from its digest by double
+    hashing (low half + i * high half), so items are hashed only once, by
+    the caller. Membership tests have no false negatives; the false
+    positive rate follows from the share of set bits.
+    A new item whose bits are all set already cannot be told from a
+    repeated one, so add() keeps the expected number of distinct items:
+    every item seen as new stands for 1/(1-rate) items at the false
+    positive rate of the moment.
+"""
+class BloomFilter(object):
+
+    def __init__(self,numBytes,numHashes=DEFAULT_NUM_HASHES):
+        self.bits=bytearray(numBytes)
+        self.numBits=numBytes*8
+        self.numHashes=numHashes
+        self.setBits=0
+        self.distinct=0.0
+
+    def positions(self,digest):
+        h1=digest & HALF_MASK
+        h2=(digest >> 32) | 1
+        numBits=self.numBits
+        return [(h1+i*h2) % numBits for i in xrange(self.numHashes)]
+
+    """ Add a digest, return True when it was not in the filter yet """
+    def add(self,digest):
+        bits=self.bits
+        rate=self.falsePositiveRate()
+        new=False
+        for p in self.positions(digest):
+            mask=1 << (p & 7)
+            if not bits[p >> 3] & mask:
+                bits[p >> 3]|=mask
+                self.setBits+=1
+                new=True
+        if new:
+            self.distinct+=1.0/(1.0-rate)
+        return new
+
+    def __contains__(self,digest):
+        bits=self.bits
+        for p in self.positions(digest):
+            if not bits[p >> 3] & (1 << (p & 7)):
+                return False
+        return True
+
+    """ Share of the bits that are set """
+    def fillRatio(self):
+        return self.setBits/float(self.numBits)
+
+    """ Probability that an item never added tests as present """
+    def falsePositiveRate(self):
+        return self.fillRatio()**self.numHashes
+
+    """ Estimated number of distinct items added, from the share of set bits """
+    def estimatedCount(self):
+        fill=self.fillRatio()
+        if fill >= 1.0:
+            return float("inf")
+        return -self.numBits*math.log(1.0-fill)/self.numHashes
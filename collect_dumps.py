@@ -0,0 +1,306 @@
+#!/usr/bin/env python
+import sys
+import os
+import time
+import json
+import Queue
+import getopt
+import signal
+import threading
+import subprocess
+
+sys.path.extend(('.', 'lib'))
+
+from data_comparison_helper import DataComparator, parseCSVFile
+
+""" The usage method"""
+def usage(error=None):
+    print """\
+    Pulls cbtransfer dumps from the nodes of a source and a target cluster
+    concurrently and parses every dump as soon as it arrives, then compares
+    the two clusters like compare_data.py -m cbt
+
+    Syntax: collect_dumps.py --src-nodes n1,n2 --tgt-nodes n3,n4 -b bucket -d dir [options]
+    Example: collect_dumps.py --src-nodes 10.1.1.1,10.1.1.2 --tgt-nodes 10.1.2.1 -b default -d ./dumps -p 8
+
+    [Required Parameters]
+    --src-nodes :: Comma separated nodes of the source cluster
+    --tgt-nodes :: Comma separated nodes of the target cluster
+    -d      :: Directory the dumps are written to (dir/src and dir/tgt)
+    -b      :: Bucket, used by the ssh transport
+    [Optional Parameters]
+    -p, --parallel :: Number of dumps pulled at the same time (default 4)
+    -j, --jobs :: Number of worker processes parsing the dumps (default 1)
+    --retries  :: Retries of a failed pull (default 2)
+    --timeout  :: Seconds before a pull is killed (default none)
+    --compress :: gzip (default), zstd, lz4 or none, used by the ssh transport
+    --command  :: Use a local command instead of ssh; {node}, {side} (src or tgt)
+               and {bucket} are replaced and the command must write the dump to
+               stdout, for example --command "cat /tmp/bench/{side}/{node}.mem.csv"
+    --timings  :: Write the per node timings to this JSON file
+    --collect-only :: Only pull the dumps, do not compare
+    -h      :: Help, will list the usage
+    """
+    if error:
+        print error
+
+""" Runs cbtransfer on a node over ssh and streams the compressed dump back,
+    like scriptToPullData
+"""
+class SshTransport(object):
+
+    def __init__(self,bucket,compress="gzip",password="couchbase",user="root",
+                 cbUser="Administrator",cbPassword="password"):
+        self.bucket=bucket
+        self.compress=compress
+        self.password=password
+        self.user=user
+        self.cbUser=cbUser
+        self.cbPassword=cbPassword
+
+    def extension(self):
+        return {"gzip":".gz","zstd":".zst","lz4":".lz4"}.get(self.compress,"")
+
+    """ The remote command exits with the status of cbtransfer or of the
+        compressor, not with the one of removing the staged dump
+    """
+    def command(self,side,node):
+        source="%s.mem.csv"%node
+        remote="/opt/couchbase/bin/cbtransfer http://localhost:8091 csv:/data/%s -b %s -u %s -p %s --single-node"%(
+            source,self.bucket,self.cbUser,self.cbPassword)
+        if self.compress in ("gzip","zstd","lz4"):
+            remote+=" && %s -c /data/%s"%(self.compress,source)
+        else:
+            remote+=" && cat /data/%s"%source
+        remote+="; rc=$?; rm -f /data/%s; exit $rc"%source
+        return ["sshpass","-p",self.password,"ssh","%s@%s"%(self.user,node),remote]
+
+""" Runs a local shell command that writes the dump of a node to stdout """
+class CommandTransport(object):
+
+    def __init__(self,template,bucket=""):
+        self.template=template
+        self.bucket=bucket
+
+    def extension(self):
+        return ""
+
+    def command(self,side,node):
+        command=self.template.replace("{node}",node).replace("{side}",side).replace("{bucket}",self.bucket)
+        return ["/bin/sh","-c",command]
+
+""" Pulls dumps of many nodes with bounded parallelism
+    Each pull runs the transport command with stdout written to the dump
+    file, is retried on failure (a failed command or an empty dump) and
+    timed. A command runs in its own process group, which is killed as a
+    whole on timeout. onArrival(target, ok) is called
+    from the pulling thread as soon as a dump is complete, with ok False
+    when the node failed after all retries.
+    A target is a (side, node, path) tuple.
+"""
+class DumpCollector(object):
+
+    def __init__(self,transport,parallel=4,retries=2,timeout=None,retryDelay=2,onArrival=None):
+        self.transport=transport
+        self.parallel=parallel
+        self.retries=retries
+        self.timeout=timeout
+        self.retryDelay=retryDelay
+        self.onArrival=onArrival
+        self.timings={}
+
+    """ Pull every target and return the timings per target """
+    def collect(self,targets):
+        work=Queue.Queue()
+        for target in targets:
+            work.put(target)
+        threads=[threading.Thread(target=self.worker,args=(work,)) for i in range(min(self.parallel,len(targets)))]
+        for t in threads:
+            t.daemon=True
+            t.start()
+        for t in threads:
+            t.join()
+        return self.timings
+
+    def worker(self,work):
+        while True:
+            try:
+                target=work.get_nowait()
+            except Queue.Empty:
+                return
+            self.pull(target)
+
+    def pull(self,target):
+        side,node,path=target
+        start=time.time()
+        timing={"side":side,"node":node,"file":path,"attempts":0,"status":"failed"}
+        directory=os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                pass
+        for attempt in range(self.retries+1):
+            timing["attempts"]=attempt+1
+            if attempt:
+                time.sleep(self.retryDelay)
+            if self.run(self.transport.command(side,node),path):
+                timing["status"]="ok"
+                timing["bytes"]=os.path.getsize(path)
+                break
+            if os.path.exists(path):
+                os.remove(path)
+        timing["seconds"]=time.time()-start
+        self.timings[target]=timing
+        print "Pulled ::",node,"::",timing["status"],"in %.1fs after %d attempt(s)"%(timing["seconds"],timing["attempts"])
+        if self.onArrival is not None:
+            self.onArrival(target,timing["status"] == "ok")
+
+    """ Run one pull, True when the command succeeded and wrote a dump """
+    def run(self,command,path):
+        with open(path,'wb') as out:
+            try:
+                process=subprocess.Popen(command,stdout=out,preexec_fn=os.setsid)
+            except OSError, err:
+                sys.stderr.write('ERROR: %s\n' % str(err))
+                return False
+            timer=None
+            if self.timeout:
+                timer=threading.Timer(self.timeout,killProcessGroup,(process,))
+                timer.start()
+            returncode=process.wait()
+            if timer is not None:
+                timer.cancel()
+        return returncode == 0 and os.path.getsize(path) > 0
+
+""" Kill a command started in its own process group with all its children """
+def killProcessGroup(process):
+    try:
+        os.killpg(process.pid,signal.SIGKILL)
+    except OSError:
+        pass
+
+""" Pull the targets and parse each dump as soon as it arrives
+    Yields (target, parsed) in the order the dumps arrive while later pulls
+    are still running; parsing happens in the worker pool when given, else
+    here, so a slow node never holds back dumps that arrived after it.
+    parsed is None for targets that could not be pulled.
+"""
+def collectAndParse(collector,targets,parser=parseCSVFile,pool=None):
+    arrivals=Queue.Queue()
+    def arrived(target,ok):
+        if ok and pool is not None:
+            arrivals.put((target,ok,pool.apply_async(parser,(target[2],))))
+        else:
+            arrivals.put((target,ok,None))
+    collector.onArrival=arrived
+    thread=threading.Thread(target=collector.collect,args=(targets,))
+    thread.daemon=True
+    thread.start()
+    for i in range(len(targets)):
+        target,ok,result=arrivals.get()
+        if not ok:
+            yield target,None
+        elif result is not None:
+            yield target,result.get()
+        else:
+            yield target,parser(target[2])
+    thread.join()
+
+def main():
+    srcNodes=[]
+    tgtNodes=[]
+    dumpDir=None
+    bucket=""
+    parallel=4
+    jobs=1
+    retries=2
+    timeout=None
+    compress="gzip"
+    command=None
+    timingsFile=None
+    collectOnly=False
+    try:
+        (opts, args) = getopt.getopt(sys.argv[1:], 'd:b:p:j:h', ["help","src-nodes=","tgt-nodes=","parallel=","jobs=",
+                                     "retries=","timeout=","compress=","command=","timings=","collect-only"])
+    except getopt.GetoptError, error:
+        usage("ERROR: " + str(error))
+        sys.exit(1)
+    for o, a in opts:
+        if o in ("-h","--help"):
+            usage()
+            sys.exit()
+        elif o == "--src-nodes":
+            srcNodes=a.split(",")
+        elif o == "--tgt-nodes":
+            tgtNodes=a.split(",")
+        elif o == "-d":
+            dumpDir=a
+        elif o == "-b":
+            bucket=a
+        elif o in ("-p","--parallel"):
+            parallel=int(a)
+        elif o in ("-j","--jobs"):
+            jobs=int(a)
+        elif o == "--retries":
+            retries=int(a)
+        elif o == "--timeout":
+            timeout=float(a)
+        elif o == "--compress":
+            compress=a
+        elif o == "--command":
+            command=a
+        elif o == "--timings":
+            timingsFile=a
+        elif o == "--collect-only":
+            collectOnly=True
+    if dumpDir is None or not (srcNodes or tgtNodes) or (command is None and not bucket):
+        usage("ERROR :: Missing Required Parameters")
+        sys.exit(1)
+    if compress not in ("gzip","zstd","lz4","none"):
+        usage("ERROR :: Unknown compression :: "+compress)
+        sys.exit(1)
+    transport=CommandTransport(command,bucket) if command else SshTransport(bucket,compress)
+    name="%s.mem.csv"+transport.extension()
+    targets=[("src",node,os.path.join(dumpDir,"src",name%node)) for node in srcNodes]
+    targets+=[("tgt",node,os.path.join(dumpDir,"tgt",name%node)) for node in tgtNodes]
+    collector=DumpCollector(transport,parallel,retries,timeout)
+    if collectOnly:
+        collector.collect(targets)
+    else:
+        totalSRC={}
+        totalTGT={}
+        # dumps are merged in the order of the nodes, so that the last node
+        # holding a key wins as in compare_data.py, whatever order they arrive in
+        order=dict((target,i) for i,target in enumerate(targets))
+        parsed={}
+        merged=0
+        pool=DataComparator.createPool(jobs)
+        try:
+            for target,info in collectAndParse(collector,targets,parseCSVFile,pool):
+                parsed[order[target]]=info
+                while merged in parsed:
+                    info=parsed.pop(merged)
+                    side,node,path=targets[merged]
+                    merged+=1
+                    if info is None:
+                        continue
+                    print "Analyzing file ::"+path
+                    print "Record(s) Read ::",len(info)
+                    (totalSRC if side == "src" else totalTGT).update(info)
+        finally:
+            DataComparator.closePool(pool)
+        print "Total Source Records ::",len(totalSRC)
+        print "Total Target Records ::",len(totalTGT)
+        s1,s2,s3=DataComparator.differenceInChangedKeys(totalSRC,totalTGT)
+        DataComparator.printResultOfCSVFormatAnalysis(s1,s2,s3)
+    failed=[t for t in collector.timings.values() if t["status"] != "ok"]
+    if timingsFile:
+        with open(timingsFile,'w') as f:
+            json.dump(sorted(collector.timings.values(),key=lambda t:t["file"]),f,indent=2)
+    if failed:
+        print "ERROR :: Failed to pull ::",[t["side"]+":"+t["node"] for t in failed]
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,8 @@ import glob
 import getopt
 import ast
 
+from view_stream import iterViewRows
+
 """ The usage method"""
 def usage(error=None):
     print """\
@@ -102,17 +104,14 @@ class DataComparator(object):
     """ 
     @staticmethod
     def getValueFromViewResult(filePath):
-        with open(filePath, 'r') as f:
-            s = f.read()
-        dict=ast.literal_eval(s)
         info={}
         count={}
-        for r in dict['rows']:
-            if r['key'] in info.keys():
-                count[r['key']]=count[r['key']]+1
+        for key,value in iterViewRows(filePath):
+            if key in info:
+                count[key]=count[key]+1
             else:
-                info[r['key']]=r['value']
-                count[r['key']]=1
+                info[key]=value
+                count[key]=1
         return count,info
 
     """ The method parses through a cbTransfer
@@ -176,10 +175,10 @@ class DataComparator(object):
         flag=False
         if(val1[0:1] != val2[0:1]):
             flag=True
-            message['flag']=val1[0:1],val2[0:1]
+            message['Exp']=val1[0:1],val2[0:1]
         if(val1[1:2] != val2[1:2]):
             flag=True
-            message['Exp']=val1[1:2],val2[1:2]
+            message['Flag']=val1[1:2],val2[1:2]
         if(val1[2:3] != val2[2:3]):
             flag=True
             message['CAS']=val1[2:3],val2[2:3]
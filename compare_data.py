@@ -4,9 +4,26 @@ import os
 import glob
 import getopt
 import ast
+import cProfile
 
 sys.path.extend(('.', 'lib'))
 
+from data_comparison_helper import DataComparator
+from digest_tree import DigestTree
+from parse_cache import ParseCache
+from run_metrics import RunMetrics
+from report_writer import createReportWriter, CATEGORIES
+from diff_budget import DiffBudget, BudgetExceeded
+from projection import Projection
+from sampling import KeySampler
+from diff_result import writeDiffResult, DiffResult, parseFields
+
+""" Exit codes: in sync, differences found, discrepancy budget exceeded, error """
+EXIT_IN_SYNC=0
+EXIT_DIFFERENT=1
+EXIT_BUDGET_EXCEEDED=2
+EXIT_ERROR=3
+
 """ The usage method"""
 def usage(error=None):
     print """\
@@ -39,6 +56,10 @@ def usage(error=None):
         Syntax: compare_cb_docs.py -s sourceDir -t targetDir -mode modeType "view" -c <replica count number>
         Example: compare_cb_docs.py -s ./active -t ./replica -mode view -c 1
      
+    Dumps may be plain, gzip, zstd or lz4 compressed files (zstd and lz4 need the
+    zstandard and lz4 modules). -s and -t may also name a single dump file, a
+    named pipe or - for stdin instead of a directory.
+
     Parameter Details
     ++++++++++++++++++
 
@@ -52,6 +73,103 @@ def usage(error=None):
     -?      :: Help, will list the usage
     --help  :: Help, will list the usage
     -c      :: Expected Replica count. Parameter used only during view mode
+    -j, --jobs :: Number of worker processes used to parse the dump files (default 1)
+    --value-digest :: cbt mode only, keep a 64 bit digest of each document body
+               instead of the body and read the bodies of changed keys back
+               from the dump files for the report
+    --pipelined :: cbt mode only, hold only the source in memory and stream the target
+               through it with readers running ahead (reader processes with
+               --jobs); target only and changed keys are reported as they are
+               found and the source keys left over are the source only keys
+    --columnar :: cbt mode only, hold each side in a compact columnar store (integer
+               metadata arrays and value digests) and compare column by column
+    --external :: cbt mode only, sort each side into spill files on local disk
+               and compare with a single merge pass instead of in memory maps
+    --memory   :: Memory budget in MB used by --external (default 256)
+    --tmpdir   :: Directory for the spill files of --external, --partitions and --digest (default system temp)
+    --partitions :: Route keys by vBucket into this many partitions on disk and diff
+               every partition pair on its own (in parallel with --jobs); also
+               reports the discrepancy counts per vBucket
+    --digest   :: cbt mode only, compare per vBucket digest trees first and only
+               diff the records of vBuckets whose digests differ. -s and -t may
+               also be digest files saved by an earlier run
+    --save-src-digest, --save-tgt-digest :: Save the digest tree of a side to a file
+    --cache-dir  :: Keep parsed dump files in this directory and reuse them while
+               the dump file is unchanged
+    --cache-size :: Maximum size of the cache directory in MB (default 4096)
+    --metrics  :: Write wall/cpu time and peak memory per stage, records and bytes
+               per file and the count of every diff category to this JSON file.
+               Cpu time and memory are of the main process, -j worker
+               processes are not included
+    --progress :: Show a progress line with an ETA on stderr while parsing
+    --profile  :: Run under cProfile and save the stats to this file
+    --report-format :: jsonl, csv or summary. Stream every discrepancy as it is found
+               to --report-file (default stdout) instead of the text report;
+               summary writes only the counts per category and per vBucket
+    --report-file :: File the structured report is written to. Without it the
+               report is written to stdout and progress output goes to stderr
+    --max-examples :: Write at most this many discrepancies per category
+    --sample   :: With --max-examples, write a random sample per category instead
+               of the first ones found
+    --approx   :: Only estimate the number of keys missing on either side and of
+               changed keys with Bloom filters of fixed size, streaming both
+               sides once; estimates are printed with their bounds
+    --precheck :: Run the approximate comparison first and skip the exact
+               comparison when it finds no difference at all
+    --approx-memory :: Memory in MB of the Bloom filters of --approx and --precheck (default 256)
+    --store    :: cbt mode only, memory or sqlite:PATH. Load both sides with value
+               digests into this key store and compute the diffs in it; with
+               sqlite:PATH the records are bulk loaded into an indexed SQLite
+               database, the diffs run as SQL queries and the database (tables
+               records and files, views src_only, tgt_only and changed) is kept
+               for inspecting keys after the run
+    --watch    :: cbt mode only, keep running and scan -s and -t every this many
+               seconds; only new or changed dump files are parsed and the
+               comparison is updated incrementally. A JSONL line with the
+               discrepancy counts is written after every scan that changed
+               something; the report is printed when the watch ends (Ctrl-C)
+    --watch-log :: Append the watch time series to this file (default stdout)
+    --watch-cycles :: Stop watching after this many scans (default 0, until interrupted)
+    --input    :: LABEL=DIR, repeat for every cluster or view output to compare all
+               of them in one pass instead of -s and -t. Each input is parsed
+               once and a presence/divergence matrix with one column per input
+               is printed; the first input is the reference. In view mode the
+               first input must hold every key once and the others -c times
+               Example: compare_data.py -m cbt --input src=./source --input dst1=./dest1 --input dst2=./dest2
+    --fields   :: cbt mode only, compare only these comma separated fields of key,
+               exp, flag, cas, rev and value (the key is always compared). Only
+               these fields are parsed and kept, e.g. --fields key for a fast key
+               presence check or --fields rev,cas for metadata drift
+    --sample-rate :: Compare only the keys whose hash falls below this fraction of
+               the hash space (e.g. 0.01), the same keys on both sides, and scale
+               the counts up to the whole bucket with 95% confidence intervals.
+               Used by the in memory cbt and view comparisons
+    --fail-after :: Stop as soon as more than this many discrepancies are found;
+               target files are checked for keys missing from the source while
+               they are parsed, so a badly diverged pair fails before the diff
+    --max-diff-ratio :: Stop as soon as the discrepancies exceed this fraction of
+               the source records (e.g. 0.01)
+    --save-result :: Also write all discrepancies to this indexed binary result file,
+               which the report and query commands read without comparing again
+
+    Saved Results
+    ++++++++++++++
+        compare_data.py report RESULT [filters] [--report-format F] [--report-file F]
+        compare_data.py query RESULT [filters]
+    report renders a saved result as text (default) or in any --report-format,
+    query writes the matching discrepancies as JSON lines. Filters:
+    --prefix   :: Only keys starting with this prefix
+    --vbucket  :: Only keys of these comma separated vBuckets
+    --field    :: Only changed keys where one of these comma separated fields
+               changed (flag, Exp, CAS, Rev, Value)
+    --category :: Only these comma separated categories (srcOnly, tgtOnly, changed,
+               srcReplicaCount, tgtReplicaCount)
+    --max-examples :: Write at most this many discrepancies per category
+
+    Exit Codes
+    ++++++++++++++
+        0 :: no discrepancies, 1 :: discrepancies found,
+        2 :: stopped by --fail-after or --max-diff-ratio, 3 :: error
 
     Help Examples
     ++++++++++++++
@@ -60,39 +178,379 @@ def usage(error=None):
         compare_data.py -h
     """
 
+""" Default values of the command line options """
+DEFAULT_OPTIONS={
+    "src":"NONE",
+    "tgt":"NONE",
+    "mode":"NONE",
+    "replicaSrc":1,
+    "replicaTgt":1,
+    "external":False,
+    "memoryLimit":256,
+    "tmpDir":None,
+    "jobs":1,
+    "partitions":0,
+    "digest":False,
+    "saveSrcDigest":None,
+    "saveTgtDigest":None,
+    "cacheDir":None,
+    "cacheSize":4096,
+    "digestValues":False,
+    "columnar":False,
+    "pipelined":False,
+    "metrics":None,
+    "progress":False,
+    "profile":None,
+    "reportFormat":None,
+    "reportFile":None,
+    "reportOut":None,
+    "maxExamples":None,
+    "sample":False,
+    "inputs":None,
+    "approx":False,
+    "precheck":False,
+    "approxMemory":256,
+    "store":None,
+    "watch":None,
+    "watchLog":None,
+    "watchCycles":0,
+    "failAfter":None,
+    "maxDiffRatio":None,
+    "fields":None,
+    "sampler":None,
+    "saveResult":None,
+}
+
+""" Run the comparison selected by the options and print its report
+    Returns the number of discrepancies found (1 when an approximate
+    comparison found any), or None for an unknown mode
+"""
+def runComparison(options):
+    src=options["src"]
+    tgt=options["tgt"]
+    mode=options["mode"]
+    jobs=options["jobs"]
+    tmpDir=options["tmpDir"]
+    metrics=DataComparator.metrics
+    vb=None
+    c1=c2=None
+    if options["inputs"]:
+        if mode not in ("cbt","view"):
+            print "ERROR :: Unknown mode ::",mode
+            usage()
+            return None
+        with metrics.stage("compare"):
+            labels,matrix,replicaCounts=DataComparator.compareDataInfoNWay(options["inputs"],mode,jobs,options["replicaTgt"])
+        found=len(matrix)+sum(len(counts) for counts in replicaCounts)
+        metrics.countDiscrepancies("nway",len(matrix))
+        if mode == "view":
+            metrics.countDiscrepancies("replicaCount",found-len(matrix))
+        if DataComparator.budget is not None:
+            DataComparator.budget.charge(found)
+        with metrics.stage("report"):
+            DataComparator.printResultOfNWayAnalysis(labels,matrix,replicaCounts)
+        return found
+    if options["approx"] or options["precheck"]:
+        if mode not in ("cbt","view"):
+            print "ERROR :: Unknown mode ::",mode
+            usage()
+            return None
+        with metrics.stage("approximate"):
+            estimate=DataComparator.estimateDifferences(src,tgt,mode,options["approxMemory"]*1024*1024)
+        DataComparator.printResultOfApproximateAnalysis(estimate)
+        inSync=DataComparator.isApproximatelyInSync(estimate)
+        if options["approx"]:
+            return 0 if inSync else 1
+        if inSync:
+            print "Approximate pre-check found no differences, skipping the exact comparison"
+            return 0
+    if options["reportFormat"]:
+        DataComparator.reportWriter=createReportWriter(options["reportFormat"],options["reportFile"],options["maxExamples"],options["sample"],
+                                                         out=options["reportOut"])
+    with metrics.stage("compare"):
+        if mode == "cbt" and options["digest"]:
+            s1,s2,s3,vb = DataComparator.compareDataInfoWithDigest(src,tgt,options["saveSrcDigest"],options["saveTgtDigest"],tmpDir)
+        elif mode == "cbt" and options["partitions"]:
+            s1,s2,s3,vb = DataComparator.compareDataInfoInCSVFormatPartitioned(src,tgt,options["partitions"],jobs,tmpDir)
+        elif mode == "view" and options["partitions"]:
+            c1,c2,s1,s2,s3,vb = DataComparator.compareJasonFormatInfoPartitioned(src,tgt,1,options["replicaTgt"],options["partitions"],jobs,tmpDir)
+        elif mode == "cbt" and options["store"]:
+            s1,s2,s3 = DataComparator.compareDataInfoInCSVFormatInStore(src,tgt,options["store"],jobs)
+        elif mode == "cbt" and options["watch"] is not None:
+            s1,s2,s3 = DataComparator.watchDataInfoInCSVFormat(src,tgt,options["watch"],options["watchLog"],options["watchCycles"],jobs)
+        elif mode == "cbt" and options["pipelined"]:
+            s1,s2,s3 = DataComparator.compareDataInfoInCSVFormatPipelined(src,tgt,jobs,options["digestValues"])
+        elif mode == "cbt" and options["columnar"]:
+            s1,s2,s3 = DataComparator.compareDataInfoInCSVFormatColumnar(src,tgt)
+        elif mode == "cbt" and options["external"]:
+            s1,s2,s3 = DataComparator.compareDataInfoInCSVFormatExternal(src,tgt,options["memoryLimit"]*1024*1024,tmpDir,options["digestValues"])
+        elif mode == "cbt":
+            s1,s2,s3 = DataComparator.compareDataInfoInCSVFormat(src,tgt,jobs,options["digestValues"],options["fields"],options["sampler"])
+        elif mode == "view":
+            c1,c2,s1,s2,s3 = DataComparator.compareJasonFormatInfo(src,tgt,1,options["replicaTgt"],jobs,options["sampler"])
+        else:
+            print "ERROR :: Unknown mode ::",mode
+            usage()
+            return None
+    metrics.countDiscrepancies("srcOnly",len(s1))
+    metrics.countDiscrepancies("tgtOnly",len(s2))
+    metrics.countDiscrepancies("changed",len(s3))
+    found=len(s1)+len(s2)+len(s3)
+    if options["digest"] and (DigestTree.isDigestFile(src) or DigestTree.isDigestFile(tgt)):
+        # without the record level diff every differing vBucket is a discrepancy
+        metrics.countDiscrepancies("vbuckets",len(vb))
+        found+=len(vb)
+    if mode == "view":
+        metrics.countDiscrepancies("srcReplicaCount",len(c1))
+        metrics.countDiscrepancies("tgtReplicaCount",len(c2))
+        found+=len(c1)+len(c2)
+    if options["saveResult"]:
+        with metrics.stage("save result"):
+            writeDiffResult(options["saveResult"],{"srcOnly":s1,"tgtOnly":s2,"changed":s3,"srcReplicaCount":c1,"tgtReplicaCount":c2},
+                            {"mode":mode,"src":src,"tgt":tgt})
+    with metrics.stage("report"):
+        if options["sampler"] is not None:
+            counts={"srcOnly":len(s1),"tgtOnly":len(s2),"changed":len(s3)}
+            if mode == "view":
+                counts.update(srcReplicaCount=len(c1),tgtReplicaCount=len(c2))
+        if DataComparator.reportWriter is not None:
+            DataComparator.reportWriter.close()
+            if options["sampler"] is not None:
+                DataComparator.printResultOfSampledAnalysis(options["sampler"],counts)
+            return found
+        if mode == "cbt":
+            DataComparator.printResultOfCSVFormatAnalysis(s1,s2,s3)
+        else:
+            DataComparator.printResultOfJasonFormatAnalysis(s1,s2,s3,c1,c2)
+        if options["digest"]:
+            print "Differing vBuckets ::",vb
+        elif vb is not None:
+            DataComparator.printResultByVbucket(vb)
+        if options["sampler"] is not None:
+            DataComparator.printResultOfSampledAnalysis(options["sampler"],counts)
+    return found
+
+""" Run the comparison, under cProfile when asked, and return the exit code """
+def runWithExitCode(options):
+    try:
+        if options["profile"]:
+            profiler=cProfile.Profile()
+            try:
+                found=profiler.runcall(runComparison,options)
+            finally:
+                profiler.dump_stats(options["profile"])
+        else:
+            found=runComparison(options)
+    except BudgetExceeded, error:
+        print "Discrepancy budget exceeded, comparison stopped ::",error
+        if DataComparator.reportWriter is not None:
+            DataComparator.reportWriter.close()
+        return EXIT_BUDGET_EXCEEDED
+    if found is None:
+        return EXIT_ERROR
+    return EXIT_DIFFERENT if found else EXIT_IN_SYNC
+
+""" Render the discrepancies of a saved result file passing the filters
+    of args, as text or a report format for report and as JSON lines for query
+"""
+def runReport(command,args):
+    (opts, rest) = getopt.gnu_getopt(args, 'h', ["help","prefix=","vbucket=","field=","category=","report-format=","report-file=","max-examples="])
+    prefix=None
+    vbuckets=None
+    fields=0
+    categories=CATEGORIES
+    reportFormat="jsonl" if command == "query" else None
+    reportFile=None
+    maxExamples=None
+    for o, a in opts:
+        if o in ("-h","--help"):
+            usage()
+            return EXIT_IN_SYNC
+        elif o == "--prefix":
+            prefix=a
+        elif o == "--vbucket":
+            vbuckets=set(int(vb) for vb in a.split(","))
+        elif o == "--field":
+            fields=parseFields(a)
+        elif o == "--category":
+            categories=[c for c in a.split(",") if c]
+            for category in categories:
+                if category not in CATEGORIES:
+                    raise ValueError("Unknown category ::"+category)
+        elif o == "--report-format":
+            reportFormat=a
+        elif o == "--report-file":
+            reportFile=a
+        elif o == "--max-examples":
+            maxExamples=int(a)
+    if len(rest) != 1:
+        print "ERROR :: "+command+" needs one result file"
+        usage()
+        return EXIT_ERROR
+    result=DiffResult(rest[0])
+    try:
+        entries=result.entries(categories,prefix,vbuckets,fields)
+        found=0
+        if reportFormat:
+            writer=createReportWriter(reportFormat,reportFile,maxExamples)
+            for category,key,vb,detail in entries:
+                writer.add(category,key,detail)
+                found+=1
+            writer.close()
+        else:
+            diffs=dict((category,{}) for category in CATEGORIES)
+            for category,key,vb,detail in entries:
+                if maxExamples is None or len(diffs[category]) < maxExamples:
+                    diffs[category][key]=detail
+                found+=1
+            if result.meta.get("mode") == "view":
+                DataComparator.printResultOfJasonFormatAnalysis(diffs["srcOnly"],diffs["tgtOnly"],diffs["changed"],
+                                                                diffs["srcReplicaCount"],diffs["tgtReplicaCount"])
+            else:
+                DataComparator.printResultOfCSVFormatAnalysis(diffs["srcOnly"],diffs["tgtOnly"],diffs["changed"])
+    finally:
+        result.close()
+    return EXIT_DIFFERENT if found else EXIT_IN_SYNC
+
 def main():
-    src="NONE"
-    tgt="NONE"
-    mode="NONE"
-    replicaSrc=1
-    replicaTgt=1
+    if len(sys.argv) > 1 and sys.argv[1] in ("report","query"):
+        exitCode=EXIT_ERROR
+        try:
+            exitCode=runReport(sys.argv[1],sys.argv[2:])
+        except getopt.GetoptError, error:
+            usage("ERROR: " + str(error))
+        except Exception, error:
+            sys.stderr.write("ERROR :: %s\n" % str(error))
+        sys.exit(exitCode)
+    options=dict(DEFAULT_OPTIONS)
+    exitCode=EXIT_ERROR
     try:
-        (opts, args) = getopt.getopt(sys.argv[1:], 'c:s:t:m:h', ["mode","mode=","src=","tgt="])
+        (opts, args) = getopt.getopt(sys.argv[1:], 'c:s:t:m:hj:', ["mode","mode=","src=","tgt=","external","memory=","tmpdir=","jobs=","partitions=","digest","save-src-digest=","save-tgt-digest=","cache-dir=","cache-size=","value-digest","columnar","pipelined","metrics=","progress","profile=","report-format=","report-file=","max-examples=","sample","input=","approx","precheck","approx-memory=","store=","watch=","watch-log=","watch-cycles=","fail-after=","max-diff-ratio=","fields=","sample-rate=","save-result="])
         for o, a in opts:
             if o == "-h" or o ==  "--help":
                 usage()
+                sys.exit(EXIT_IN_SYNC)
             if o in ("-s","--src"):
-                src=a
+                options["src"]=a
             elif o in ("-t","--tgt"):
-                tgt=a
+                options["tgt"]=a
             elif o in ("-m","--mode"):
-                mode=a
+                options["mode"]=a
             elif o in ("-c","--count"):
-                replicaTgt=int(a)
-        if src == "NONE" or tgt == "NONE" or mode == "NONE":
+                options["replicaTgt"]=int(a)
+            elif o in ("-j","--jobs"):
+                options["jobs"]=int(a)
+            elif o == "--partitions":
+                options["partitions"]=int(a)
+            elif o == "--digest":
+                options["digest"]=True
+            elif o == "--save-src-digest":
+                options["saveSrcDigest"]=a
+            elif o == "--save-tgt-digest":
+                options["saveTgtDigest"]=a
+            elif o == "--cache-dir":
+                options["cacheDir"]=a
+            elif o == "--cache-size":
+                options["cacheSize"]=int(a)
+            elif o == "--value-digest":
+                options["digestValues"]=True
+            elif o == "--columnar":
+                options["columnar"]=True
+            elif o == "--pipelined":
+                options["pipelined"]=True
+            elif o == "--external":
+                options["external"]=True
+            elif o == "--memory":
+                options["memoryLimit"]=int(a)
+            elif o == "--tmpdir":
+                options["tmpDir"]=a
+            elif o == "--metrics":
+                options["metrics"]=a
+            elif o == "--progress":
+                options["progress"]=True
+            elif o == "--profile":
+                options["profile"]=a
+            elif o == "--report-format":
+                options["reportFormat"]=a
+            elif o == "--report-file":
+                options["reportFile"]=a
+            elif o == "--max-examples":
+                options["maxExamples"]=int(a)
+            elif o == "--sample":
+                options["sample"]=True
+            elif o == "--approx":
+                options["approx"]=True
+            elif o == "--precheck":
+                options["precheck"]=True
+            elif o == "--approx-memory":
+                options["approxMemory"]=int(a)
+            elif o == "--store":
+                options["store"]=a
+            elif o == "--watch":
+                options["watch"]=float(a)
+            elif o == "--watch-log":
+                options["watchLog"]=a
+            elif o == "--watch-cycles":
+                options["watchCycles"]=int(a)
+            elif o == "--fields":
+                options["fields"]=Projection(a)
+            elif o == "--save-result":
+                options["saveResult"]=a
+            elif o == "--sample-rate":
+                options["sampler"]=KeySampler(float(a))
+            elif o == "--fail-after":
+                options["failAfter"]=int(a)
+            elif o == "--max-diff-ratio":
+                options["maxDiffRatio"]=float(a)
+            elif o == "--input":
+                label,path=a.split("=",1)
+                options["inputs"]=(options["inputs"] or [])+[(label,path)]
+        if options["inputs"]:
+            if len(options["inputs"]) < 2 or options["mode"] == "NONE":
+                print "ERROR :: N-way comparison needs a mode and at least two --input"
+                usage()
+                sys.exit(EXIT_ERROR)
+        elif options["src"] == "NONE" or options["tgt"] == "NONE" or options["mode"] == "NONE":
             print "ERROR :: Missing Required Parameters"
             usage()
-            sys.exit()
-        if mode == "cbt":
-            s1,s2,s3 = data_analysis_helper.DataComparator.compareDataInfoInCSVFormat(src,tgt)
-            DataComparator.printResultOfCSVFormatAnalysis(s1,s2,s3)
-        elif mode == "view":
-            c1,c2,s1,s2,s3 = data_analysis_helper.DataComparator.compareJasonFormatInfo(src,tgt,1,replicaTgt)
-            DataComparator.printResultOfJasonFormatAnalysis(s1,s2,s3,c1,c2) 
-    except error:
-        usage()
+            sys.exit(EXIT_ERROR)
+        otherModes=(options["inputs"] or options["digest"] or options["partitions"] or options["store"] or options["approx"]
+                    or options["precheck"] or options["watch"] is not None or options["columnar"] or options["pipelined"] or options["external"])
+        if options["fields"] is not None and (options["mode"] != "cbt" or otherModes):
+            print "ERROR :: --fields is only supported by the in memory cbt comparison"
+            usage()
+            sys.exit(EXIT_ERROR)
+        if options["sampler"] is not None and (options["fields"] is not None or otherModes):
+            print "ERROR :: --sample-rate is only supported by the in memory cbt and view comparisons"
+            usage()
+            sys.exit(EXIT_ERROR)
+        if options["sample"] and options["maxExamples"] is None:
+            print "ERROR :: --sample needs --max-examples"
+            usage()
+            sys.exit(EXIT_ERROR)
+        if options["cacheDir"]:
+            DataComparator.parseCache=ParseCache(options["cacheDir"],options["cacheSize"]*1024*1024)
+        DataComparator.metrics=RunMetrics(options["progress"])
+        if options["failAfter"] is not None or options["maxDiffRatio"] is not None:
+            DataComparator.budget=DiffBudget(options["failAfter"],options["maxDiffRatio"])
+        if options["reportFormat"] and not options["reportFile"]:
+            # the report owns stdout, progress and text output go to stderr
+            options["reportOut"]=sys.stdout
+            sys.stdout=sys.stderr
+        try:
+            exitCode=runWithExitCode(options)
+            if DataComparator.parseCache is not None:
+                DataComparator.parseCache.report()
+        finally:
+            if options["reportOut"] is not None:
+                sys.stdout=options["reportOut"]
+        if options["metrics"]:
+            DataComparator.metrics.write(options["metrics"])
     except getopt.GetoptError, error:
-        usage("ERROR: " + str(error)) 
+        usage("ERROR: " + str(error))
+    except Exception, error:
+        sys.stderr.write("ERROR :: %s\n" % str(error))
+    sys.exit(exitCode)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,305 @@
+#!/usr/bin/env python
+import mmap
+
+from dump_reader import openDump, isRegularFile, decompressorFor
+
+QUOTE='"'
+DOUBLE_QUOTE='""'
+
+""" Number of metadata fields before the value: Key, Exp, Flag, CAS, Rev id """
+NUM_FIELDS=5
+
+""" Returned by scanRecord when the buffer ends inside the record """
+INCOMPLETE=None
+
+""" Returned by scanRecord when a quoted field is still open at the end of the dump """
+UNTERMINATED=(None,None)
+
+""" Offset just after the closing quote of the quoted field at pos, or -1
+    when the field does not end before end. A quote is escaped by doubling
+    it, so a quote that is the last byte before end is only known to close
+    the field once the whole dump is in the buffer (final).
+"""
+def endOfQuoted(buf,pos,end,final):
+    i=pos+1
+    while True:
+        q=buf.find(QUOTE,i,end)
+        if q < 0:
+            return -1
+        if q+1 < end:
+            if buf[q+1] != QUOTE:
+                return q+1
+            i=q+2
+        elif final:
+            return q+1
+        else:
+            return -1
+
+""" Scan the cbtransfer CSV record starting at pos
+    Records are Key,Exp,Flag,CAS,Rev id,Value where the value is the rest of
+    the record. Fields follow CSV quoting rules: a field starting with a
+    quote ends at the next single quote, doubled quotes are literal quotes
+    and commas and line breaks inside quotes belong to the field.
+    Returns (fields, valueStart, valueEnd, next) with the value span still
+    quoted, (None, next) for a malformed line, INCOMPLETE when the record
+    does not end before end and more data may follow, or UNTERMINATED when
+    a quoted field is still open at the end of the dump (final).
+"""
+def scanRecord(buf,pos,end,final):
+    fields=[]
+    for i in range(NUM_FIELDS):
+        if pos < end and buf[pos] == QUOTE:
+            q=endOfQuoted(buf,pos,end,final)
+            if q < 0:
+                return INCOMPLETE if not final else UNTERMINATED
+            if q >= end or buf[q] != ",":
+                if q >= end and not final:
+                    return INCOMPLETE
+                nl=buf.find("\n",q,end)
+                if nl < 0:
+                    return INCOMPLETE if not final else (None,end)
+                return None,nl+1
+            fields.append(buf[pos+1:q-1].replace(DOUBLE_QUOTE,QUOTE))
+            pos=q+1
+            continue
+        c=buf.find(",",pos,end)
+        nl=buf.find("\n",pos,c if c >= 0 else end)
+        if nl >= 0:
+            return None,nl+1
+        if c < 0:
+            return INCOMPLETE if not final else (None,end)
+        fields.append(buf[pos:c])
+        pos=c+1
+    start=pos
+    if pos < end and buf[pos] == QUOTE:
+        q=endOfQuoted(buf,pos,end,final)
+        if q < 0:
+            return INCOMPLETE if not final else UNTERMINATED
+        stop=q
+        nl=buf.find("\n",q,end)
+    else:
+        nl=buf.find("\n",pos,end)
+        stop=nl
+    if nl < 0:
+        if not final:
+            return INCOMPLETE
+        nl=end
+        if stop < 0:
+            stop=end
+    elif stop == nl and stop > start and buf[stop-1] == "\r":
+        stop-=1
+    return fields,start,stop,nl+1
+
+""" Text of a value span as returned by scanRecord, with the CSV quoting removed """
+def decodeValue(raw):
+    if raw[:1] == QUOTE and len(raw) > 1 and raw[-1:] == QUOTE:
+        return raw[1:-1].replace(DOUBLE_QUOTE,QUOTE)
+    return raw[:]
+
+""" Split a complete record line, or return None when the line has quoted
+    metadata, a value continuing on the next line or too few fields and
+    has to go through scanRecord. offset is the position of the line.
+"""
+def splitLine(line,offset):
+    record=line.rstrip("\r\n")
+    parts=record.split(",",NUM_FIELDS)
+    if len(parts) <= NUM_FIELDS:
+        return None
+    start=len(record)-len(parts[NUM_FIELDS])
+    q=record.find(QUOTE)
+    if q >= 0 and (q < start or record.count(QUOTE,q) % 2):
+        return None
+    parts.append(offset+start)
+    return parts
+
+""" Scanner over the records of a cbtransfer CSV dump
+    Regular files are memory mapped, compressed dumps, pipes and stdin are
+    read as a stream. Lines are split as they are read; only lines with
+    quoted metadata or values spanning several lines are scanned field by
+    field. Iterating yields (key, exp, flag, cas, rev, value, offset) where
+    value is the still quoted value span, a string or for a value spanning
+    several lines of a mapped file a zero copy buffer valid while the
+    iteration runs, and offset is the byte offset of the span in the
+    (decompressed) dump. A dump ending inside a quoted field (a truncated
+    dump) raises ValueError after the records before it.
+"""
+class CSVScanner(object):
+
+    def __init__(self,filePath):
+        self.filePath=filePath
+
+    def unterminated(self,pos):
+        return ValueError("%s :: the record at byte %d ends inside a quoted field, the dump is truncated"%(self.filePath,pos))
+
+    def __iter__(self):
+        if isRegularFile(self.filePath):
+            return self.scanMapped()
+        return self.scanStream()
+
+    """ Scan a regular file through a read only memory map """
+    def scanMapped(self):
+        with open(self.filePath,'rb') as f:
+            head=f.read(4)
+            f.seek(0,2)
+            size=f.tell()
+            if size == 0:
+                return
+            if decompressorFor(head) is not None:
+                for record in self.scanStream():
+                    yield record
+                return
+            buf=mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ)
+            try:
+                readline=buf.readline
+                pos=0
+                while True:
+                    line=readline()
+                    if not line:
+                        return
+                    record=splitLine(line,pos)
+                    if record is not None:
+                        pos+=len(line)
+                        yield record
+                        continue
+                    result=scanRecord(buf,pos,size,True)
+                    if result is UNTERMINATED:
+                        raise self.unterminated(pos)
+                    if result[0] is not None:
+                        fields,start,stop,pos=result
+                        yield fields[0],fields[1],fields[2],fields[3],fields[4],buffer(buf,start,stop-start),start
+                    else:
+                        pos=result[1]
+                    buf.seek(pos)
+            finally:
+                buf.close()
+
+    """ Iterate over the keys of the records only
+        Lines of a mapped file are only checked to be a complete record and
+        cut at the first comma, the lines splitLine would reject go through
+        scanRecord. Other files are scanned as usual
+    """
+    def keys(self):
+        if isRegularFile(self.filePath):
+            return self.scanMappedKeys()
+        return (record[0] for record in self.scanStream())
+
+    def scanMappedKeys(self):
+        with open(self.filePath,'rb') as f:
+            head=f.read(4)
+            f.seek(0,2)
+            size=f.tell()
+            if size == 0:
+                return
+            if decompressorFor(head) is not None:
+                for record in self.scanStream():
+                    yield record[0]
+                return
+            buf=mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ)
+            try:
+                readline=buf.readline
+                pos=0
+                while True:
+                    line=readline()
+                    if not line:
+                        return
+                    q=line.find(QUOTE)
+                    if q < 0:
+                        complete=line.count(",") >= NUM_FIELDS
+                    else:
+                        complete=line.count(",",0,q) >= NUM_FIELDS and not line.count(QUOTE,q) % 2
+                    if complete:
+                        pos+=len(line)
+                        yield line[:line.find(",")]
+                        continue
+                    result=scanRecord(buf,pos,size,True)
+                    if result is UNTERMINATED:
+                        raise self.unterminated(pos)
+                    if result[0] is not None:
+                        pos=result[3]
+                        yield result[0][0]
+                    else:
+                        pos=result[1]
+                    buf.seek(pos)
+            finally:
+                buf.close()
+
+    """ Iterate over the first count fields of the records (key, exp, ...)
+        with count at most NUM_FIELDS. Lines of a mapped file are only
+        checked to be a complete record and split up to the last requested
+        field, the value is not split or decoded. Other files are scanned
+        as usual
+    """
+    def fields(self,count):
+        if isRegularFile(self.filePath):
+            return self.scanMappedFields(count)
+        return (record[:count] for record in self.scanStream())
+
+    def scanMappedFields(self,count):
+        with open(self.filePath,'rb') as f:
+            head=f.read(4)
+            f.seek(0,2)
+            size=f.tell()
+            if size == 0:
+                return
+            if decompressorFor(head) is not None:
+                for record in self.scanStream():
+                    yield record[:count]
+                return
+            buf=mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ)
+            try:
+                readline=buf.readline
+                pos=0
+                while True:
+                    line=readline()
+                    if not line:
+                        return
+                    q=line.find(QUOTE)
+                    if q < 0:
+                        complete=line.count(",") >= NUM_FIELDS
+                    else:
+                        complete=line.count(",",0,q) >= NUM_FIELDS and not line.count(QUOTE,q) % 2
+                    if complete:
+                        pos+=len(line)
+                        fields=line.split(",",count)
+                        del fields[count]
+                        yield fields
+                        continue
+                    result=scanRecord(buf,pos,size,True)
+                    if result is UNTERMINATED:
+                        raise self.unterminated(pos)
+                    if result[0] is not None:
+                        pos=result[3]
+                        yield result[0][:count]
+                    else:
+                        pos=result[1]
+                    buf.seek(pos)
+            finally:
+                buf.close()
+
+    """ Scan a compressed dump, a pipe or stdin line by line """
+    def scanStream(self):
+        with openDump(self.filePath) as f:
+            pos=0
+            while True:
+                line=f.readline()
+                if not line:
+                    return
+                record=splitLine(line,pos)
+                if record is None:
+                    # join the following lines until the record is complete
+                    final=False
+                    while True:
+                        result=scanRecord(line,0,len(line),final)
+                        if result is not INCOMPLETE:
+                            break
+                        more=f.readline()
+                        final=not more
+                        line+=more
+                    if result is UNTERMINATED:
+                        raise self.unterminated(pos)
+                    if result[0] is not None:
+                        fields,start,stop,next=result
+                        record=fields[0],fields[1],fields[2],fields[3],fields[4],line[start:stop],pos+start
+                pos+=len(line)
+                if record is not None:
+                    yield record
@@ -1,9 +1,55 @@
 #!/usr/bin/env python
 import sys
 import os
+import math
+import time
+import json
 import glob
 import getopt
 import ast
+import itertools
+import collections
+import threading
+import Queue
+import multiprocessing
+import tempfile
+import shutil
+
+from external_sort import ExternalSorter, DEFAULT_MEMORY_LIMIT
+from view_stream import iterViewRows
+from replica_counter import ReplicaCounter
+from partition import PartitionWriter, readPartition, countByVbucket, vbucketOf, DEFAULT_PARTITIONS
+from digest_tree import DigestTree, valueDigest, digest64, recordDigest
+from record_store import RecordStore, COLUMNS
+from csv_scanner import CSVScanner, decodeValue, QUOTE
+from incremental_index import IncrementalIndex, fileIdentity, SRC, TGT
+from key_store import openKeyStore
+from bloom_filter import BloomFilter
+from run_metrics import RunMetrics
+from dump_reader import openDump, listDumpFiles, isRegularFile, STDIN
+
+""" Files modified less than this many seconds ago are still being written
+    and are left to the next scan of watch mode
+"""
+WATCH_SETTLE_SECONDS=1
+
+""" Default memory in bytes of the Bloom filters of the approximate mode """
+DEFAULT_APPROX_MEMORY=256*1024*1024
+
+""" Width in standard deviations of the bounds of approximate estimates """
+APPROX_SIGMAS=3
+
+""" Records per batch streamed from a target file reader in the pipelined comparison """
+PIPELINE_BATCH_SIZE=5000
+
+""" Batches a target file reader of the pipelined comparison may queue ahead """
+PIPELINE_QUEUE_BATCHES=8
+
+""" Status of an input that does not hold the key in an N-way comparison """
+MISSING=None
+
+""" Fields reported by an N-way comparison, labelled like differenceInValuesInCSVFormat """
+NWAY_FIELDS=('Exp','Flag','CAS','Rev','Value')
 
 """ Class contains logic for data consistency checks 
     1) Comparison of Data in {Key, Exp, Flag, CAS, Rev id, Value} format
@@ -19,137 +65,1053 @@ import ast
        Usage: View output in Jason format
 """
 class DataComparator(object):
+
+    """ Optional ParseCache consulted by parseFiles """
+    parseCache=None
+
+    """ RunMetrics the stages, files and results of a run are recorded in """
+    metrics=RunMetrics()
+
+    """ Optional ReportWriter every discrepancy is streamed to as it is found """
+    reportWriter=None
+
+    """ Optional DiffBudget every discrepancy is charged to as it is found """
+    budget=None
  
-    """ Compare View Output in Jason format between Source and Target Directories"""
+    """ Compare View Output in Jason format between Source and Target Directories
+        With a KeySampler only the sampled keys are read and compared
+    """
     @staticmethod
-    def compareJasonFormatInfo(srcDir=".",tgtDir=".",srcCnt=1,tgtCnt=1):
-        srcFiles=glob.glob(srcDir+"/*")
-        tgtFiles=glob.glob(tgtDir+"/*")
+    def compareJasonFormatInfo(srcDir=".",tgtDir=".",srcCnt=1,tgtCnt=1,jobs=1,sampler=None):
+        metrics=DataComparator.metrics
+        with metrics.stage("list files"):
+            srcFiles=listDumpFiles(srcDir)
+            tgtFiles=listDumpFiles(tgtDir)
+            metrics.expectFiles(srcFiles+tgtFiles)
         totalSRC={}
-        totalCountSRC={}
+        totalCountSRC=ReplicaCounter()
         totalTGT={}
-        totalCountTGT={}
-        for file in srcFiles:
-            print "Analyzing Src file ::"+file
-            count,info=DataComparator.getValueFromJasonResult(file)
-            totalSRC.update(info)
-            totalCountSRC.update(count)
-        for file in tgtFiles:
-            print "Analyzing Tgt file ::"+file
-            count,info=DataComparator.getValueFromJasonResult(file)
-            totalTGT.update(info)
-            totalCountTGT.update(count)
-        srcMinusTgt,tgtMinusSrc,sameKeyValueDiff=DataComparator.differenceInChangedKeysForJasonResult(totalSRC,totalTGT)
-        srcCountResult=DataComparator.compareCountOfReplicas(totalCountSRC,srcCnt)
-        tgtCountResult=DataComparator.compareCountOfReplicas(totalCountTGT,tgtCnt)
+        totalCountTGT=ReplicaCounter()
+        missing=0
+        parser=parseJasonFile if sampler is None else SampledParser(sampler,"view")
+        pool=DataComparator.createPool(jobs)
+        try:
+            srcResults=DataComparator.parseFiles(srcFiles,parser,pool)
+            tgtResults=DataComparator.parseFiles(tgtFiles,parser,pool)
+            with metrics.stage("parse source"):
+                for file,(count,info) in itertools.izip(srcFiles,srcResults):
+                    print "Analyzing Src file ::"+file
+                    totalSRC.update(info)
+                    totalCountSRC.merge(count)
+                    metrics.fileParsed(file,len(count))
+            DataComparator.budgetTotal(len(totalSRC))
+            with metrics.stage("parse target"):
+                for file,(count,info) in itertools.izip(tgtFiles,tgtResults):
+                    print "Analyzing Tgt file ::"+file
+                    missing=DataComparator.budgetProbe(missing,info,totalSRC,totalTGT)
+                    totalTGT.update(info)
+                    totalCountTGT.merge(count)
+                    metrics.fileParsed(file,len(count))
+        finally:
+            DataComparator.closePool(pool)
+        if sampler is not None:
+            sampler.sampledRecords=(len(totalSRC),len(totalTGT))
+        with metrics.stage("diff"):
+            srcMinusTgt,tgtMinusSrc,sameKeyValueDiff=DataComparator.differenceInChangedKeysForJasonResult(totalSRC,totalTGT)
+        with metrics.stage("replica counts"):
+            srcCountResult=DataComparator.compareCountOfReplicas(totalCountSRC,srcCnt,"srcReplicaCount")
+            tgtCountResult=DataComparator.compareCountOfReplicas(totalCountTGT,tgtCnt,"tgtReplicaCount")
         return srcCountResult,tgtCountResult,srcMinusTgt,tgtMinusSrc,sameKeyValueDiff
 
-    """ Method to check if count of replicas are consistent """
+    """ Method to check if count of replicas are consistent
+        Returns a map of key to [count, files] for keys with an unexpected count
+        which are also streamed to the report writer under category if given
+    """
     @staticmethod
-    def compareCountOfReplicas(src={},count=1):
-        result={}
-        for o in src.keys():
-            if src[o] != count:
-                result[o]=src[o]
+    def compareCountOfReplicas(src=None,count=1,category=None):
+        if src is None:
+            return {}
+        result=src.mismatches(count)
+        if category:
+            DataComparator.emitAll(category,result)
         return result
 
+    """ Stream one discrepancy to the report writer and charge it to the budget """
+    @staticmethod
+    def emit(category,key,detail):
+        if DataComparator.reportWriter is not None:
+            DataComparator.reportWriter.add(category,key,detail)
+        if DataComparator.budget is not None:
+            DataComparator.budget.charge()
+
+    """ Stream all discrepancies of a diff map to the report writer and charge them to the budget """
+    @staticmethod
+    def emitAll(category,diff):
+        if DataComparator.reportWriter is not None:
+            for key,detail in diff.iteritems():
+                DataComparator.reportWriter.add(category,key,detail)
+        if DataComparator.budget is not None:
+            DataComparator.budget.charge(len(diff))
+
+    """ Limit the budget by the number of source records once it is known """
+    @staticmethod
+    def budgetTotal(records):
+        if DataComparator.budget is not None:
+            DataComparator.budget.setTotal(records)
+
+    """ Stop parsing the target early when the keys of a target file missing
+        from the source already exceed the budget. Only keys not seen in an
+        earlier target file are counted in missing, which is updated and
+        returned; the keys only in the target can only grow as more files
+        are read, so the count is a lower bound of the discrepancies
+    """
+    @staticmethod
+    def budgetProbe(missing,info,totalSRC,totalTGT):
+        if DataComparator.budget is None:
+            return missing
+        for key in info:
+            if key not in totalSRC and key not in totalTGT:
+                missing+=1
+        DataComparator.budget.check(missing)
+        return missing
+
     """ Compare CSV output between Source and Target Directories
         Assumption:: Output is in CSV format {Key, Exp, Flag, CAS, Rev Id, Value}
+        With a Projection only its fields are parsed, kept and compared,
+        with a KeySampler only the sampled keys
     """
     @staticmethod
-    def compareDataInfoInCSVFormat(srcDir=".",tgtDir="."):
-        srcFiles=glob.glob(srcDir+"/*")
-        tgtFiles=glob.glob(tgtDir+"/*")
+    def compareDataInfoInCSVFormat(srcDir=".",tgtDir=".",jobs=1,digestValues=False,projection=None,sampler=None):
+        metrics=DataComparator.metrics
+        with metrics.stage("list files"):
+            srcFiles=listDumpFiles(srcDir)
+            tgtFiles=listDumpFiles(tgtDir)
+            metrics.expectFiles(srcFiles+tgtFiles)
         totalSRC={}
         totalTGT={}
+        parser=parseCSVFileWithDigest if digestValues else parseCSVFile
+        if projection is not None:
+            parser=projection
+            digestValues=False
+        elif sampler is not None:
+            parser=SampledParser(sampler,"cbt",digestValues)
+        missing=0
+        pool=DataComparator.createPool(jobs)
+        try:
+            srcResults=DataComparator.parseFiles(srcFiles,parser,pool)
+            tgtResults=DataComparator.parseFiles(tgtFiles,parser,pool)
+            with metrics.stage("parse source"):
+                print "Analyzing Source Directory"
+                for file,info in itertools.izip(srcFiles,srcResults):
+                    print "Analyzing file ::"+file
+                    print "Record(s) Read ::",len(info)
+                    totalSRC.update(info)
+                    metrics.fileParsed(file,len(info))
+                print "Total Source Records ::",len(totalSRC)
+            DataComparator.budgetTotal(len(totalSRC))
+            with metrics.stage("parse target"):
+                print "Analyzing Target Directory"
+                for file,info in itertools.izip(tgtFiles,tgtResults):
+                    print "Analyzing file ::"+file
+                    print "Record(s) Read ::",len(info)
+                    missing=DataComparator.budgetProbe(missing,info,totalSRC,totalTGT)
+                    totalTGT.update(info)
+                    metrics.fileParsed(file,len(info))
+                print "Total Target Records ::",len(totalTGT)
+        finally:
+            DataComparator.closePool(pool)
+        if sampler is not None:
+            sampler.sampledRecords=(len(totalSRC),len(totalTGT))
+        with metrics.stage("diff"):
+            srcMinusTgt,tgtMinusSrc,sameKeyValueDiff=DataComparator.differenceInChangedKeys(totalSRC,totalTGT,not digestValues,projection)
+        if digestValues:
+            DataComparator.emitAll("srcOnly",srcMinusTgt)
+            DataComparator.emitAll("tgtOnly",tgtMinusSrc)
+            with metrics.stage("fetch changed values"):
+                DataComparator.fetchChangedValues(sameKeyValueDiff)
+            DataComparator.emitAll("changed",sameKeyValueDiff)
+        return srcMinusTgt,tgtMinusSrc,sameKeyValueDiff
+
+    """ Estimate the differences between Source and Target with fixed memory
+        The keys and the (key, record) digests of the source are added to
+        Bloom filters sharing memoryLimit bytes, then the target is streamed
+        through them: a key missing from the key filter is certainly not in
+        the source and a present key whose record digest is missing from the
+        record filter certainly changed. Both counts are corrected for the
+        false positive rates of the filters and given with bounds of
+        APPROX_SIGMAS standard deviations; keys only in the source follow
+        from the distinct key counts of both sides. A new key whose bits are
+        all set already is not seen as new, so the distinct counts are the
+        expected counts kept by the key filters and the target counts are
+        scaled up by the share of new keys that went unseen
+    """
+    @staticmethod
+    def estimateDifferences(srcDir=".",tgtDir=".",mode="cbt",memoryLimit=DEFAULT_APPROX_MEMORY):
+        metrics=DataComparator.metrics
+        size=max(1,memoryLimit/3)
+        srcKeys=BloomFilter(size)
+        records=BloomFilter(size)
+        tgtKeys=BloomFilter(size)
+        srcSeen=tgtSeen=missing=changed=0
+        with metrics.stage("approximate source"):
+            print "Analyzing Source Directory"
+            for file in listDumpFiles(srcDir):
+                print "Analyzing file ::"+file
+                for key,record in DataComparator.iterApproximateItems(file,mode):
+                    if srcKeys.add(key):
+                        srcSeen+=1
+                    records.add(record)
+        with metrics.stage("approximate target"):
+            print "Analyzing Target Directory"
+            for file in listDumpFiles(tgtDir):
+                print "Analyzing file ::"+file
+                for key,record in DataComparator.iterApproximateItems(file,mode):
+                    if not tgtKeys.add(key):
+                        continue
+                    tgtSeen+=1
+                    if key not in srcKeys:
+                        missing+=1
+                    elif record not in records:
+                        changed+=1
+        srcCount=DataComparator.distinctCount(srcKeys,srcSeen)
+        tgtCount=DataComparator.distinctCount(tgtKeys,tgtSeen)
+        scale=tgtCount/float(tgtSeen) if tgtSeen else 1.0
+        keyRate=srcKeys.falsePositiveRate()
+        recordRate=records.falsePositiveRate()
+        tgtOnly=DataComparator.approximateCount(missing,keyRate,scale)
+        # target only keys that passed the key filter are counted as changed
+        leaked=tgtOnly[1]*keyRate*(1-recordRate)
+        changedCount=DataComparator.approximateCount(max(0,changed*scale-leaked),recordRate)
+        common=tgtCount-tgtOnly[1]
+        srcOnly=(max(0,srcCount-tgtCount+tgtOnly[0]),max(0,srcCount-common),max(0,srcCount-tgtCount+tgtOnly[2]))
+        return {"srcRecords":srcCount,"tgtRecords":tgtCount,"keyFalsePositiveRate":keyRate,
+                "recordFalsePositiveRate":recordRate,"srcOnly":srcOnly,"tgtOnly":tgtOnly,
+                "changed":changedCount,"observedTgtOnly":missing,"observedChanged":changed}
+
+    """ Distinct items added to a Bloom filter, at least the items seen to set a new bit """
+    @staticmethod
+    def distinctCount(bloom,seen):
+        return max(seen,int(round(bloom.distinct)))
+
+    """ (low, estimate, high) of a count observed through a filter that lets
+        every item slip through with probability rate, scaled by the share of
+        the items that reached the filter at all
+    """
+    @staticmethod
+    def approximateCount(observed,rate,scale=1.0):
+        estimate=observed*scale/(1.0-rate)
+        spread=APPROX_SIGMAS*math.sqrt((estimate+1)*rate)/(1.0-rate)
+        return (observed,estimate,estimate+spread)
+
+    """ (key digest, record digest) of the records of a dump file """
+    @staticmethod
+    def iterApproximateItems(filePath,mode="cbt"):
+        if mode == "cbt":
+            for key,record in DataComparator.iterCSVRecords(filePath,True):
+                yield valueDigest(key),recordDigest(key,record)
+        else:
+            for key,value in iterViewRows(filePath):
+                yield digest64(key),digest64(u"%s\0%s"%(key,value))
+
+    """ True when an approximate comparison found no difference at all """
+    @staticmethod
+    def isApproximatelyInSync(estimate):
+        return estimate["observedTgtOnly"] == 0 and estimate["observedChanged"] == 0 and estimate["srcRecords"] == estimate["tgtRecords"]
+
+    """ Compare CSV output between Source and Target Directories in a key store
+        store is a --store argument (see key_store.openKeyStore). Both sides
+        are loaded into the store with value digests, one batch of inserts per
+        dump file, and the three diffs are answered by the store, so with
+        sqlite:PATH neither side is held in memory and the database can be
+        queried after the run. Returns the same three diffs as
+        compareDataInfoInCSVFormat
+    """
+    @staticmethod
+    def compareDataInfoInCSVFormatInStore(srcDir=".",tgtDir=".",store="memory",jobs=1):
+        metrics=DataComparator.metrics
+        keyStore=openKeyStore(store)
+        pool=DataComparator.createPool(jobs)
+        try:
+            keyStore.clear()
+            for side,path,name in ((SRC,srcDir,"Source"),(TGT,tgtDir,"Target")):
+                with metrics.stage("load "+name.lower()):
+                    print "Analyzing "+name+" Directory"
+                    files=listDumpFiles(path)
+                    metrics.expectFiles(files)
+                    for file,info in itertools.izip(files,DataComparator.parseFiles(files,parseCSVFileWithDigest,pool)):
+                        print "Analyzing file ::"+file
+                        print "Record(s) Read ::",len(info)
+                        keyStore.addRecords(side,file,info.iteritems())
+                        metrics.fileParsed(file,len(info))
+                    keyStore.finishLoad()
+                    print "Total "+name+" Records ::",keyStore.count(side)
+            DataComparator.budgetTotal(keyStore.count(SRC))
+            DataComparator.closePool(pool)
+            pool=None
+            with metrics.stage("diff"):
+                srcMinusTgt={}
+                for key,record in keyStore.srcOnly():
+                    srcMinusTgt[key]=record
+                    DataComparator.emit("srcOnly",key,record)
+                tgtMinusSrc={}
+                for key,record in keyStore.tgtOnly():
+                    tgtMinusSrc[key]=record
+                    DataComparator.emit("tgtOnly",key,record)
+                sameKeyValueDiff={}
+                for key,src,tgt in keyStore.changedPairs():
+                    flag,message=DataComparator.differenceInValuesInCSVFormat(src,tgt)
+                    if flag:
+                        sameKeyValueDiff[key]=message
+        finally:
+            DataComparator.closePool(pool)
+            keyStore.close()
+        with metrics.stage("fetch changed values"):
+            DataComparator.fetchChangedValues(sameKeyValueDiff)
+        DataComparator.emitAll("changed",sameKeyValueDiff)
+        return srcMinusTgt,tgtMinusSrc,sameKeyValueDiff
+
+    """ Watch the Source and Target Directories and keep the comparison up to date
+        Every interval seconds both directories are listed, new or changed
+        dump files (by size and mtime) are parsed with value digests and
+        merged into an IncrementalIndex, and removed files are dropped from
+        it, so a scan costs time proportional to the new snapshots only.
+        After every scan that changed something a line with the discrepancy
+        counts is appended to the JSONL time series at logPath (stdout when
+        None). Runs for cycles scans, until interrupted when 0, and returns
+        the same three diffs as compareDataInfoInCSVFormat
+    """
+    @staticmethod
+    def watchDataInfoInCSVFormat(srcDir=".",tgtDir=".",interval=60,logPath=None,cycles=0,jobs=1):
+        metrics=DataComparator.metrics
+        index=IncrementalIndex(DataComparator.differenceInValuesInCSVFormat)
+        known=({},{})
+        pool=DataComparator.createPool(jobs)
+        log=open(logPath,'a') if logPath else sys.stdout
+        cycle=0
+        try:
+            while True:
+                start=time.time()
+                parsed=removed=0
+                for side,path in ((SRC,srcDir),(TGT,tgtDir)):
+                    current={}
+                    for file in listDumpFiles(path):
+                        try:
+                            identity=fileIdentity(file)
+                        except OSError:
+                            continue
+                        if start-identity[1] < WATCH_SETTLE_SECONDS:
+                            identity=known[side].get(file)
+                        if identity is not None:
+                            current[file]=identity
+                    for file in sorted(known[side]):
+                        if file not in current:
+                            index.remove(side,file)
+                            removed+=1
+                    changed=sorted(f for f in current if known[side].get(f) != current[f])
+                    with metrics.stage("parse"):
+                        for file,info in itertools.izip(changed,DataComparator.parseFiles(changed,parseCSVFileWithDigest,pool)):
+                            print "Analyzing file ::"+file
+                            print "Record(s) Read ::",len(info)
+                            index.update(side,file,info)
+                            metrics.fileParsed(file,len(info))
+                            parsed+=1
+                    known[side].clear()
+                    known[side].update(current)
+                if parsed or removed or cycle == 0:
+                    entry=index.counts()
+                    entry.update({"time":start,"filesParsed":parsed,"filesRemoved":removed,"seconds":time.time()-start})
+                    log.write(json.dumps(entry,sort_keys=True)+"\n")
+                    log.flush()
+                cycle+=1
+                if cycles and cycle >= cycles:
+                    break
+                time.sleep(max(0,interval-(time.time()-start)))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            DataComparator.closePool(pool)
+            if logPath:
+                log.close()
+        DataComparator.emitAll("srcOnly",index.srcOnly)
+        DataComparator.emitAll("tgtOnly",index.tgtOnly)
+        with metrics.stage("fetch changed values"):
+            DataComparator.fetchChangedValues(index.changed)
+        DataComparator.emitAll("changed",index.changed)
+        return index.srcOnly,index.tgtOnly,index.changed
+
+    """ Create a worker process pool for parsing, or None for serial parsing """
+    @staticmethod
+    def createPool(jobs=1):
+        if jobs <= 1:
+            return None
+        return multiprocessing.Pool(jobs)
+
+    @staticmethod
+    def closePool(pool):
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+    """ Parse files with the given module level parser function
+        Returns an iterator over the results in the order of files.
+        With a pool all files are queued to the workers right away, so
+        the results of one directory can be merged while the next one
+        is still being parsed. Unchanged files are loaded from parseCache.
+        stdin is always parsed in this process
+    """
+    @staticmethod
+    def parseFiles(files,parser,pool=None):
+        if STDIN in files:
+            pool=None
+        if DataComparator.parseCache is not None:
+            mapper=lambda missing,function: DataComparator.mapTasks(missing,function,pool)
+            return DataComparator.parseCache.parseFiles(files,parser,mapper)
+        return DataComparator.mapTasks(files,parser,pool)
+
+    """ Run a module level function over tasks, in the pool when there is one """
+    @staticmethod
+    def mapTasks(tasks,function,pool=None):
+        if pool is None:
+            return itertools.imap(function,tasks)
+        return pool.imap(function,tasks)
+
+    """ Compare CSV output between Source and Target Directories partitioned by vBucket
+        Both sides are routed by the vBucket of the key into partition files
+        on disk and every partition pair is then diffed on its own, in the
+        worker pool when jobs > 1, so memory is bounded by one partition pair
+        per worker. Also returns the discrepancy counts per vBucket
+    """
+    @staticmethod
+    def compareDataInfoInCSVFormatPartitioned(srcDir=".",tgtDir=".",partitions=DEFAULT_PARTITIONS,jobs=1,tmpDir=None):
+        srcFiles=listDumpFiles(srcDir)
+        tgtFiles=listDumpFiles(tgtDir)
+        workDir=tempfile.mkdtemp(prefix="cmpdump-",dir=tmpDir)
+        pool=DataComparator.createPool(jobs)
+        diff1={}
+        diff2={}
+        diff3={}
+        try:
+            print "Analyzing Source Directory"
+            DataComparator.budgetTotal(DataComparator.partitionFiles("src",srcFiles,partitionCSVFile,workDir,partitions,pool))
+            print "Analyzing Target Directory"
+            DataComparator.partitionFiles("tgt",tgtFiles,partitionCSVFile,workDir,partitions,pool)
+            tasks=[(workDir,len(srcFiles),len(tgtFiles),p) for p in range(partitions)]
+            for d1,d2,d3 in DataComparator.mapTasks(tasks,diffCSVPartition,pool):
+                DataComparator.emitAll("srcOnly",d1)
+                DataComparator.emitAll("tgtOnly",d2)
+                DataComparator.emitAll("changed",d3)
+                diff1.update(d1)
+                diff2.update(d2)
+                diff3.update(d3)
+        finally:
+            DataComparator.closePool(pool)
+            shutil.rmtree(workDir,ignore_errors=True)
+        return diff1,diff2,diff3,countByVbucket(diff1,diff2,diff3)
+
+    """ Compare View Output in Jason format partitioned by vBucket, see
+        compareDataInfoInCSVFormatPartitioned
+    """
+    @staticmethod
+    def compareJasonFormatInfoPartitioned(srcDir=".",tgtDir=".",srcCnt=1,tgtCnt=1,partitions=DEFAULT_PARTITIONS,jobs=1,tmpDir=None):
+        srcFiles=listDumpFiles(srcDir)
+        tgtFiles=listDumpFiles(tgtDir)
+        workDir=tempfile.mkdtemp(prefix="cmpdump-",dir=tmpDir)
+        pool=DataComparator.createPool(jobs)
+        srcCountResult={}
+        tgtCountResult={}
+        diff1={}
+        diff2={}
+        diff3={}
+        try:
+            DataComparator.budgetTotal(DataComparator.partitionFiles("src",srcFiles,partitionJasonFile,workDir,partitions,pool))
+            DataComparator.partitionFiles("tgt",tgtFiles,partitionJasonFile,workDir,partitions,pool)
+            tasks=[(workDir,srcFiles,tgtFiles,p,srcCnt,tgtCnt) for p in range(partitions)]
+            for c1,c2,d1,d2,d3 in DataComparator.mapTasks(tasks,diffJasonPartition,pool):
+                for category,diff in zip(("srcReplicaCount","tgtReplicaCount","srcOnly","tgtOnly","changed"),(c1,c2,d1,d2,d3)):
+                    DataComparator.emitAll(category,diff)
+                srcCountResult.update(c1)
+                tgtCountResult.update(c2)
+                diff1.update(d1)
+                diff2.update(d2)
+                diff3.update(d3)
+        finally:
+            DataComparator.closePool(pool)
+            shutil.rmtree(workDir,ignore_errors=True)
+        return srcCountResult,tgtCountResult,diff1,diff2,diff3,countByVbucket(diff1,diff2,diff3)
+
+    """ Compare CSV output using a per vBucket digest tree of each side
+        src and tgt are either dump directories or saved digest trees.
+        The trees are compared first and the record level diff is only run
+        for the vBuckets whose digests differ, which needs both dump
+        directories and reads them a second time, keeping only the records
+        of those vBuckets; against a saved tree every differing vBucket is
+        charged to the budget as one discrepancy instead. Returns the
+        three diffs and the differing vBuckets
+    """
+    @staticmethod
+    def compareDataInfoWithDigest(src=".",tgt=".",saveSrc=None,saveTgt=None,tmpDir=None):
+        srcTree=DataComparator.digestTreeOf(src,"Source",tmpDir)
+        tgtTree=DataComparator.digestTreeOf(tgt,"Target",tmpDir)
+        if saveSrc:
+            srcTree.save(saveSrc)
+        if saveTgt:
+            tgtTree.save(saveTgt)
+        DataComparator.budgetTotal(sum(srcTree.counts))
+        vbuckets=srcTree.differingVbuckets(tgtTree)
+        print "vBuckets with different digests ::",len(vbuckets),"of",srcTree.numVbuckets
+        if not vbuckets or DigestTree.isDigestFile(src) or DigestTree.isDigestFile(tgt):
+            if DataComparator.budget is not None:
+                DataComparator.budget.charge(len(vbuckets))
+            return {},{},{},vbuckets
+        selected=set(vbuckets)
+        totalSRC=DataComparator.getValueFromCSVInVbuckets(listDumpFiles(src),selected)
+        totalTGT=DataComparator.getValueFromCSVInVbuckets(listDumpFiles(tgt),selected)
+        srcMinusTgt,tgtMinusSrc,sameKeyValueDiff=DataComparator.differenceInChangedKeys(totalSRC,totalTGT)
+        return srcMinusTgt,tgtMinusSrc,sameKeyValueDiff,vbuckets
+
+    """ Compare any number of labelled inputs in a single pass
+        inputs is a list of (label, directory). Every input is parsed once
+        (cbt dumps with value digests) and its records are added to one
+        table of key -> record per input, so the cost grows with the total
+        input size and not with the number of pairs. The first input is the
+        reference; a key missing there is compared against the first input
+        holding it. Returns the labels and the matrix of the keys that are
+        missing or divergent somewhere, key -> status per input where the
+        status is MISSING or the tuple of differing fields (empty when the
+        record matches). In view mode the replica counts of every input are
+        checked too, the reference is expected to hold every key once and the
+        other inputs replicaCount times; the third result is the list of the
+        replica count mismatches per input (empty in cbt mode)
+    """
+    @staticmethod
+    def compareDataInfoNWay(inputs,mode="cbt",jobs=1,replicaCount=1):
+        metrics=DataComparator.metrics
+        labels=[label for label,path in inputs]
+        with metrics.stage("list files"):
+            files=[listDumpFiles(path) for label,path in inputs]
+            metrics.expectFiles(sum(files,[]))
+        parser=parseCSVFileWithDigest if mode == "cbt" else parseJasonFile
+        table={}
+        counters=[ReplicaCounter() for label in labels]
+        pool=DataComparator.createPool(jobs)
+        try:
+            results=[DataComparator.parseFiles(f,parser,pool) for f in files]
+            for i,label in enumerate(labels):
+                with metrics.stage("parse "+label):
+                    print "Analyzing "+label+" Directory"
+                    total=0
+                    for file,info in itertools.izip(files[i],results[i]):
+                        if mode != "cbt":
+                            count,info=info
+                            counters[i].merge(count)
+                        print "Analyzing file ::"+file
+                        print "Record(s) Read ::",len(info)
+                        for key,record in info.iteritems():
+                            row=table.get(key)
+                            if row is None:
+                                row=table[key]=[None]*len(labels)
+                            if row[i] is None:
+                                total+=1
+                            row[i]=record
+                        metrics.fileParsed(file,len(info))
+                    print "Total "+label+" Records ::",total
+        finally:
+            DataComparator.closePool(pool)
+        with metrics.stage("diff"):
+            matrix={}
+            for key,row in table.iteritems():
+                status=DataComparator.statusOfNWayRow(row,mode)
+                if status is not None:
+                    matrix[key]=status
+        replicaCounts=[]
+        if mode != "cbt":
+            with metrics.stage("replica counts"):
+                replicaCounts=[counter.mismatches(1 if i == 0 else replicaCount) for i,counter in enumerate(counters)]
+        return labels,matrix,replicaCounts
+
+    """ Status per input of one N-way table row, None when all inputs agree """
+    @staticmethod
+    def statusOfNWayRow(row,mode="cbt"):
+        reference=None
+        for record in row:
+            if record is not None:
+                reference=record
+                break
+        status=[]
+        differs=False
+        for record in row:
+            if record is None:
+                status.append(MISSING)
+                differs=True
+            elif record is reference:
+                status.append(())
+            elif mode == "cbt":
+                flag,message=DataComparator.differenceInValuesInCSVFormat(reference,record)
+                fields=tuple(f for f in NWAY_FIELDS if f in message)
+                differs=differs or flag
+                status.append(fields)
+            elif record != reference:
+                status.append(('Rev',))
+                differs=True
+            else:
+                status.append(())
+        if differs:
+            return tuple(status)
+        return None
+
+    """ Compare CSV output using a compact columnar RecordStore for each side
+        Metadata is held in integer arrays and values as digests, the keys of
+        both stores are aligned once and each of the five fields is then
+        compared as a whole column. Returns the same three diffs as
+        compareDataInfoInCSVFormat
+    """
+    @staticmethod
+    def compareDataInfoInCSVFormatColumnar(srcDir=".",tgtDir="."):
         print "Analyzing Source Directory"
-        for file in srcFiles:
-            print "Analyzing file ::"+file
-            info=DataComparator.getValueFromCSV(file)
-            print "Record(s) Read ::",len(info)
-            totalSRC.update(info)
-        print "Total Source Records ::",len(totalSRC)
+        srcStore=DataComparator.loadRecordStore(listDumpFiles(srcDir))
+        print "Total Source Records ::",len(srcStore)
+        DataComparator.budgetTotal(len(srcStore))
         print "Analyzing Target Directory"
-        for file in tgtFiles:
-             print "Analyzing file ::"+file
-             info=DataComparator.getValueFromCSV(file)
-             print "Record(s) Read ::",len(info)
-             totalTGT.update(info) 
-        print "Total Target Records ::",len(totalTGT)
-        srcMinusTgt,tgtMinusSrc,sameKeyValueDiff=DataComparator.differenceInChangedKeys(totalSRC,totalTGT)
+        tgtStore=DataComparator.loadRecordStore(listDumpFiles(tgtDir))
+        print "Total Target Records ::",len(tgtStore)
+        srcOnly,tgtOnly,srcCommon,tgtCommon=srcStore.align(tgtStore)
+        diff1=dict((srcStore.key(i),srcStore.record(i)) for i in srcOnly)
+        diff2=dict((tgtStore.key(i),tgtStore.record(i)) for i in tgtOnly)
+        diff3={}
+        labels=('Exp','Flag','CAS','Rev','Value')
+        for (name,code),label in zip(COLUMNS,labels):
+            for n in srcStore.differingPositions(tgtStore,name,srcCommon,tgtCommon):
+                i=srcCommon[n]
+                j=tgtCommon[n]
+                if label == 'Value':
+                    change=[srcStore.columns[name][i],srcStore.location(i)],[tgtStore.columns[name][j],tgtStore.location(j)]
+                else:
+                    change=[srcStore.field(name,i)],[tgtStore.field(name,j)]
+                diff3.setdefault(srcStore.key(i),{})[label]=change
+        DataComparator.emitAll("srcOnly",diff1)
+        DataComparator.emitAll("tgtOnly",diff2)
+        DataComparator.fetchChangedValues(diff3)
+        DataComparator.emitAll("changed",diff3)
+        return diff1,diff2,diff3
+
+    """ Build a finished RecordStore from CSV files """
+    @staticmethod
+    def loadRecordStore(files):
+        store=RecordStore()
+        for file in files:
+            print "Analyzing file ::"+file
+            fileId=store.addFile(file)
+            count=len(store)
+            for key,record in DataComparator.iterCSVRecords(file,True):
+                store.add(key,record,fileId)
+            print "Record(s) Read ::",len(store)-count
+        store.finish()
+        return store
+
+    """ Load a saved digest tree or build one from a dump directory
+        A key held by several dump files counts once with its record of the
+        last file, as with dict.update. The (key, record digest) pairs of
+        every file are spilled into vBucket partitions under tmpDir and the
+        tree is built one partition at a time, so memory is bounded by the
+        keys of one partition
+    """
+    @staticmethod
+    def digestTreeOf(path,name,tmpDir=None,partitions=DEFAULT_PARTITIONS):
+        if DigestTree.isDigestFile(path):
+            print "Loading "+name+" digest tree ::"+path
+            return DigestTree.load(path)
+        print "Analyzing "+name+" Directory"
+        files=listDumpFiles(path)
+        workDir=tempfile.mkdtemp(prefix="cmpdump-digest-",dir=tmpDir)
+        tree=DigestTree()
+        try:
+            for fileId,file in enumerate(files):
+                print "Analyzing file ::"+file
+                writer=PartitionWriter(workDir,"digest",fileId,partitions)
+                try:
+                    for key,record in DataComparator.iterCSVRecords(file):
+                        writer.add(key,recordDigest(key,record))
+                finally:
+                    writer.close()
+                print "Record(s) Read ::",writer.count
+            for partition in range(partitions):
+                digests={}
+                for fileId in range(len(files)):
+                    digests.update(readPartition(workDir,"digest",fileId,partition))
+                for key,digest in digests.iteritems():
+                    tree.addDigest(key,digest)
+        finally:
+            shutil.rmtree(workDir,ignore_errors=True)
+        print "Total "+name+" Records ::",sum(tree.counts)
+        return tree
+
+    """ Load only the records whose key falls into one of the given vBuckets """
+    @staticmethod
+    def getValueFromCSVInVbuckets(files,vbuckets):
+        info={}
+        for file in files:
+            for key,record in DataComparator.iterCSVRecords(file):
+                if vbucketOf(key) in vbuckets:
+                    info[key]=record
+        return info
+
+    """ Split every file of one side into partition files """
+    @staticmethod
+    def partitionFiles(side,files,partitioner,workDir,partitions,pool=None):
+        if STDIN in files:
+            pool=None
+        tasks=[(file,side,fileId,workDir,partitions) for fileId,file in enumerate(files)]
+        total=0
+        for file,count in itertools.izip(files,DataComparator.mapTasks(tasks,partitioner,pool)):
+            print "Analyzing file ::"+file
+            print "Record(s) Read ::",count
+            total+=count
+        print "Total Records ::",total
+        return total
+
+    """ Compare CSV output between Source and Target Directories in a pipeline
+        Only the source is held in a map. The target files are read by
+        readers running ahead through bounded queues, threads or with
+        jobs > 1 worker processes reading up to jobs files at once, and
+        every target record is looked up and its key removed from the
+        source map as it arrives, so target only and changed keys are
+        reported file by file while the target is still read and the keys
+        left in the source map at the end are the source only keys.
+        Duplicates resolve like dict.update over the files: target files
+        are consumed last file first and a key already seen in a later file
+        is skipped, while within a file the source record of a key is kept
+        until the file is done and a repeated key is compared again, so the
+        last record of the file wins. Returns the same three diffs as
+        compareDataInfoInCSVFormat
+    """
+    @staticmethod
+    def compareDataInfoInCSVFormatPipelined(srcDir=".",tgtDir=".",jobs=1,digestValues=False):
+        metrics=DataComparator.metrics
+        with metrics.stage("list files"):
+            srcFiles=listDumpFiles(srcDir)
+            tgtFiles=listDumpFiles(tgtDir)
+            metrics.expectFiles(srcFiles+tgtFiles)
+        totalSRC={}
+        parser=parseCSVFileWithDigest if digestValues else parseCSVFile
+        pool=DataComparator.createPool(jobs)
+        try:
+            with metrics.stage("parse source"):
+                print "Analyzing Source Directory"
+                for file,info in itertools.izip(srcFiles,DataComparator.parseFiles(srcFiles,parser,pool)):
+                    print "Analyzing file ::"+file
+                    print "Record(s) Read ::",len(info)
+                    totalSRC.update(info)
+                    metrics.fileParsed(file,len(info))
+                print "Total Source Records ::",len(totalSRC)
+        finally:
+            DataComparator.closePool(pool)
+        DataComparator.budgetTotal(len(totalSRC))
+        emit=DataComparator.emit
+        compare=DataComparator.differenceInValuesInCSVFormat
+        seen=set()
+        srcMinusTgt={}
+        tgtMinusSrc={}
+        sameKeyValueDiff={}
+        with metrics.stage("stream target"):
+            print "Analyzing Target Directory"
+            for file,batches in DataComparator.streamFiles(list(reversed(tgtFiles)),digestValues,jobs):
+                print "Analyzing file ::"+file
+                count=0
+                # source record (None when target only) of the keys first seen in this file
+                fileKeys={}
+                for batch in batches:
+                    count+=len(batch)
+                    for key,record in batch:
+                        if key in fileKeys:
+                            src=fileKeys[key]
+                        elif key in seen:
+                            continue
+                        else:
+                            seen.add(key)
+                            src=fileKeys[key]=totalSRC.pop(key,None)
+                        if src is None:
+                            tgtMinusSrc[key]=record
+                            continue
+                        flag,message=compare(src,record)
+                        if flag:
+                            sameKeyValueDiff[key]=message
+                        else:
+                            sameKeyValueDiff.pop(key,None)
+                for key,src in fileKeys.iteritems():
+                    if src is None:
+                        emit("tgtOnly",key,tgtMinusSrc[key])
+                    elif key in sameKeyValueDiff and not digestValues:
+                        emit("changed",key,sameKeyValueDiff[key])
+                print "Record(s) Read ::",count
+                metrics.fileParsed(file,count)
+            print "Total Target Records ::",len(seen)
+        for key,record in totalSRC.iteritems():
+            srcMinusTgt[key]=record
+            emit("srcOnly",key,record)
+        if digestValues:
+            with metrics.stage("fetch changed values"):
+                DataComparator.fetchChangedValues(sameKeyValueDiff)
+            DataComparator.emitAll("changed",sameKeyValueDiff)
+        return srcMinusTgt,tgtMinusSrc,sameKeyValueDiff
+
+    """ Yield (file, batches) for the files in order, where batches iterates
+        over the lists of (key, record) of the file read ahead by a reader
+        thread, or with jobs > 1 by reader processes of which up to jobs
+        run at once, each queueing at most PIPELINE_QUEUE_BATCHES batches
+    """
+    @staticmethod
+    def streamFiles(files,digestValues=False,jobs=1):
+        pending=collections.deque(files)
+        readers=collections.deque()
+        def startReader():
+            file=pending.popleft()
+            if jobs > 1 and file != STDIN:
+                queue=multiprocessing.Queue(PIPELINE_QUEUE_BATCHES)
+                reader=multiprocessing.Process(target=readRecordBatches,args=(file,digestValues,queue))
+            else:
+                queue=Queue.Queue(PIPELINE_QUEUE_BATCHES)
+                reader=threading.Thread(target=readRecordBatches,args=(file,digestValues,queue))
+            reader.daemon=True
+            reader.start()
+            readers.append((file,queue,reader))
+        try:
+            while pending or readers:
+                while pending and len(readers) < max(1,jobs):
+                    startReader()
+                file,queue,reader=readers[0]
+                yield file,iter(queue.get,None)
+                readers.popleft()
+                reader.join()
+        finally:
+            for file,queue,reader in readers:
+                if isinstance(reader,multiprocessing.Process):
+                    reader.terminate()
+
+    """ Compare CSV output between Source and Target Directories using an
+        external sort merge, so that the memory used is bounded by memoryLimit
+        Each side is sorted by key into spill files under tmpDir and then both
+        sorted streams are walked once to find the differences
+    """
+    @staticmethod
+    def compareDataInfoInCSVFormatExternal(srcDir=".",tgtDir=".",memoryLimit=DEFAULT_MEMORY_LIMIT,tmpDir=None,digestValues=False):
+        metrics=DataComparator.metrics
+        srcSorter=ExternalSorter(memoryLimit/2,tmpDir)
+        tgtSorter=ExternalSorter(memoryLimit/2,tmpDir)
+        try:
+            with metrics.stage("sort source"):
+                print "Analyzing Source Directory"
+                total=DataComparator.sortCSVFiles(listDumpFiles(srcDir),srcSorter,digestValues)
+                print "Total Source Records ::",total
+            DataComparator.budgetTotal(total)
+            with metrics.stage("sort target"):
+                print "Analyzing Target Directory"
+                total=DataComparator.sortCSVFiles(listDumpFiles(tgtDir),tgtSorter,digestValues)
+                print "Total Target Records ::",total
+            with metrics.stage("merge diff"):
+                srcMinusTgt,tgtMinusSrc,sameKeyValueDiff=DataComparator.differenceInSortedStreams(srcSorter.sortedRecords(),tgtSorter.sortedRecords(),not digestValues)
+        finally:
+            srcSorter.cleanup()
+            tgtSorter.cleanup()
+        if digestValues:
+            with metrics.stage("fetch changed values"):
+                DataComparator.fetchChangedValues(sameKeyValueDiff)
+            DataComparator.emitAll("changed",sameKeyValueDiff)
         return srcMinusTgt,tgtMinusSrc,sameKeyValueDiff
 
-   
+    """ Feed all records of the given CSV files into an external sorter """
+    @staticmethod
+    def sortCSVFiles(files,sorter,digestValues=False):
+        DataComparator.metrics.expectFiles(files)
+        total=0
+        for file in files:
+            print "Analyzing file ::"+file
+            count=0
+            for key,record in DataComparator.iterCSVRecords(file,digestValues):
+                sorter.add(key,record)
+                count+=1
+            print "Record(s) Read ::",count
+            DataComparator.metrics.fileParsed(file,count)
+            total+=count
+        return total
+
+    """ Walk two streams of (key, record) sorted by key with unique keys
+        and find the same differences as differenceInChangedKeys. Changed
+        keys are left to the caller to report when emitChanged is False
+    """
+    @staticmethod
+    def differenceInSortedStreams(srcRecords,tgtRecords,emitChanged=True):
+        diff1={}
+        diff2={}
+        diff3={}
+        emit=DataComparator.emit
+        src=next(srcRecords,None)
+        tgt=next(tgtRecords,None)
+        while src is not None and tgt is not None:
+            if src[0] < tgt[0]:
+                diff1[src[0]]=src[1]
+                emit("srcOnly",src[0],src[1])
+                src=next(srcRecords,None)
+            elif src[0] > tgt[0]:
+                diff2[tgt[0]]=tgt[1]
+                emit("tgtOnly",tgt[0],tgt[1])
+                tgt=next(tgtRecords,None)
+            else:
+                flag,message=DataComparator.differenceInValuesInCSVFormat(src[1],tgt[1])
+                if flag:
+                    diff3[src[0]]=message
+                    if emitChanged:
+                        emit("changed",src[0],message)
+                src=next(srcRecords,None)
+                tgt=next(tgtRecords,None)
+        while src is not None:
+            diff1[src[0]]=src[1]
+            emit("srcOnly",src[0],src[1])
+            src=next(srcRecords,None)
+        while tgt is not None:
+            diff2[tgt[0]]=tgt[1]
+            emit("tgtOnly",tgt[0],tgt[1])
+            tgt=next(tgtRecords,None)
+        return diff1,diff2,diff3
+
     """ The method parses through a all jason result set
         dump given format and builds hash map 
         for key of documents and value as rev Ids
     """ 
     @staticmethod
-    def getValueFromJasonResult(filePath):
-        with open(filePath, 'r') as f:
-            s = f.read()
-        dict=ast.literal_eval(s)
+    def getValueFromJasonResult(filePath,count=None,sampler=None):
         info={}
-        count={}
-        for r in dict['rows']:
-            if r['key'] in info.keys():
-                count[r['key']]=count[r['key']]+1
-            else:
-                info[r['key']]=r['value']
-                count[r['key']]=1
+        if count is None:
+            count=ReplicaCounter()
+        fileId=count.addFile(filePath)
+        for key,value in iterViewRows(filePath):
+            if sampler is not None and not sampler.accepts(key):
+                continue
+            if key not in info:
+                info[key]=value
+            count.add(key,fileId)
         return count,info
 
     """ Extract information from file
         Data Format assumption {key, Exp, Flag, CAS, Rev id, Value}
+        With a KeySampler only the records of sampled keys are kept
     """   
     @staticmethod
-    def getValueFromCSV(filePath):
+    def getValueFromCSV(filePath,digestValues=False,sampler=None):
         info={}
+        if sampler is not None:
+            accepts=sampler.accepts
+            for key,record in DataComparator.iterCSVRecords(filePath,digestValues):
+                if accepts(key):
+                    info[key]=record
+            return info
+        for key,record in DataComparator.iterCSVRecords(filePath,digestValues):
+            info[key]=record
+        return info
+
+    """ Iterate over (key, [Exp, Flag, CAS, Rev id, Value]) records of a CSV file
+        Records are read by the quote aware CSVScanner, so values holding
+        commas or line breaks are kept whole. With digestValues the Value is
+        replaced by a 64 bit digest of the document body followed by the
+        (file, offset, length) of the body, so that bodies are never held
+        in memory
+    """
+    @staticmethod
+    def iterCSVRecords(filePath,digestValues=False):
         try:
-            for line in open(filePath):
-                values=line.split(",")
-                if len(values) >= 6:
-                    info[values[0]]=[values[1],values[2],values[3],values[4],values[5:]]
+            if not digestValues:
+                for key,exp,flag,cas,rev,value,offset in CSVScanner(filePath):
+                    yield key,[exp,flag,cas,rev,decodeValue(value)]
+                return
+            for key,exp,flag,cas,rev,value,offset in CSVScanner(filePath):
+                # digest the decoded value, as compared by the default mode
+                digest=valueDigest(decodeValue(value) if value[:1] == QUOTE else value)
+                yield key,[exp,flag,cas,rev,digest,(filePath,offset,len(value))]
         except Exception, err:
             sys.stderr.write('ERROR: %s\n' % str(err))
-        return info
+
+    """ Replace the value digests of changed keys by the document bodies,
+        read back from the dump files by byte offset. Compressed dumps are
+        read forward to the offsets; bodies of dumps read from stdin or a
+        pipe cannot be read again and keep their digest
+    """
+    @staticmethod
+    def fetchChangedValues(diff):
+        locations={}
+        for key,message in diff.iteritems():
+            if 'Value' in message:
+                for side in (0,1):
+                    location=message['Value'][side][1]
+                    locations.setdefault(location[0],[]).append((location[1],location[2],key,side))
+        bodies={}
+        for filePath,entries in locations.iteritems():
+            if not isRegularFile(filePath):
+                continue
+            entries.sort()
+            with openDump(filePath) as f:
+                for offset,length,key,side in entries:
+                    f.seek(offset)
+                    bodies[key,side]=f.read(length)
+        for key,message in diff.iteritems():
+            if 'Value' in message and (key,0) in bodies and (key,1) in bodies:
+                message['Value']=[decodeValue(bodies[key,0])],[decodeValue(bodies[key,1])]
      
     """ Find the difference between two key,rev id pairs maps 
         1) Src Key Map - Tgt Key Map
         2) Tgt Key Map - Src Key Map
         3) Change in Values for Common Keys
+        Differences are also streamed to the report writer and charged to
+        the budget unless emit is False. Records parsed by a Projection are
+        compared on its fields only
     """
     @staticmethod
-    def differenceInChangedKeys(dict1,dict2):
+    def differenceInChangedKeys(dict1,dict2,emit=True,projection=None):
         s1=set(dict1.keys())
         s2=set(dict2.keys())
         diff1={}
         diff2={}
         diff3={}
+        report=DataComparator.emit if emit else None
+        expand=projection.expand if projection is not None else None
         for o in s1.difference(s2):
-            diff1[o]=dict1[o]
+            diff1[o]=expand(dict1[o]) if expand else dict1[o]
+            if report:
+                report("srcOnly",o,diff1[o])
         for o in s2.difference(s1):
-            diff2[o]=dict2[o]
+            diff2[o]=expand(dict2[o]) if expand else dict2[o]
+            if report:
+                report("tgtOnly",o,diff2[o])
+        if projection is not None and projection.keysOnly():
+            return diff1,diff2,diff3
+        compare=projection.compare if projection is not None else DataComparator.differenceInValuesInCSVFormat
         for o in s1.intersection(s2):
-            flag,message=DataComparator.differenceInValuesInCSVFormat(dict1[o],dict2[o])
+            flag,message=compare(dict1[o],dict2[o])
             if flag:
                 diff3[o]=message
+                if report:
+                    report("changed",o,message)
         return diff1,diff2,diff3
   
     @staticmethod
-    def differenceInChangedKeysForJasonResult(dict1,dict2):
+    def differenceInChangedKeysForJasonResult(dict1,dict2,emit=True):
         s1=set(dict1.keys())
         s2=set(dict2.keys())
         diff1={}
         diff2={}
         diff3={}
+        report=DataComparator.emit if emit else None
         for o in s1.difference(s2):
             diff1[o]=dict1[o]
+            if report:
+                report("srcOnly",o,dict1[o])
         for o in s2.difference(s1):
             diff2[o]=dict2[o]
+            if report:
+                report("tgtOnly",o,dict2[o])
         for o in s1.intersection(s2):
             if dict1[o] != dict2[o]:
                 diff3[o]=[dict1[o],dict2[o]]
+                if report:
+                    report("changed",o,diff3[o])
         return diff1,diff2,diff3
 
     """ Find differences in values for {Flag, Exp, CAS, Rev id, Value} result set """
@@ -159,10 +1121,10 @@ class DataComparator(object):
         flag=False
         if(val1[0:1] != val2[0:1]):
             flag=True
-            message['flag']=val1[0:1],val2[0:1]
+            message['Exp']=val1[0:1],val2[0:1]
         if(val1[1:2] != val2[1:2]):
             flag=True
-            message['Exp']=val1[1:2],val2[1:2]
+            message['Flag']=val1[1:2],val2[1:2]
         if(val1[2:3] != val2[2:3]):
             flag=True
             message['CAS']=val1[2:3],val2[2:3]
@@ -171,7 +1133,7 @@ class DataComparator(object):
             message['Rev']=val1[3:4],val2[3:4]
         if(val1[4:5] != val2[4:5]):
             flag=True
-            message['Value']=val1[4:5],val2[4:5]
+            message['Value']=val1[4:6],val2[4:6]
         return flag,message
 
     """ Print the analysis results for CSV format """
@@ -217,18 +1179,108 @@ class DataComparator(object):
         print """3) Change Value Analysis for same Keys """
         for o in diff3.keys():
             print "\n For Key :: "+o
-            for key in diff3[o].keys():
-                print "\n"+key+"::",diff3[o][key]
-        print "number of such cases ::",len(diff2)
+            print "\n",diff3[o][0]," changes to ",diff3[o][1]
+        print "number of such cases ::",len(diff3)
         print """4) Source Replica Count Issues """
         for o in srcCount.keys():
-            print "\n",[o,srcCount[o]]
+            print "\n",[o]+srcCount[o]
         print "number of such cases ::",len(srcCount)
         print """5) Target Replica Count Issues """
         for o in tgtCount.keys():
-            print "\n",[o,tgtCount[o]]
+            print "\n",[o]+tgtCount[o]
         print "number of such cases ::",len(tgtCount)
     
+    """ Print the discrepancy counts per vBucket of a partitioned comparison """
+    @staticmethod
+    def printResultByVbucket(byVbucket):
+        print "----------------------------------------------------------"
+        print """Discrepancies per vBucket [Source only, Target only, Changed] """
+        for vb in sorted(byVbucket.keys()):
+            print "\n vBucket :: %d ::"%vb,byVbucket[vb]
+        print "number of such vBuckets ::",len(byVbucket)
+
+    """ Print the presence/divergence matrix of an N-way comparison
+        Every key is listed with one column per input: ok, missing or the
+        fields that differ from the reference, followed by the counts per input
+        and in view mode the replica count issues per input
+    """
+    @staticmethod
+    def printResultOfNWayAnalysis(labels,matrix,replicaCounts=()):
+        print "++++++++++++++++++++++++++++++++++++++++++++++++++++++++++"
+        print "Analysis of N-way Comparison Results"
+        print "++++++++++++++++++++++++++++++++++++++++++++++++++++++++++"
+        print "Inputs ::",", ".join(labels),":: reference ::",labels[0]
+        width=max([len(label) for label in labels]+[7])
+        print "\n Key :: "+" ".join(label.ljust(width) for label in labels)
+        for key in sorted(matrix.keys()):
+            print " "+key+" :: "+" ".join(DataComparator.nWayStatusText(status).ljust(width) for status in matrix[key])
+        print "\n number of such cases ::",len(matrix)
+        print "----------------------------------------------------------"
+        print """Discrepancies per input [Missing, Divergent, """+", ".join(NWAY_FIELDS)+"""] """
+        for i,label in enumerate(labels):
+            statuses=[row[i] for row in matrix.itervalues()]
+            missing=sum(1 for status in statuses if status is MISSING)
+            divergent=sum(1 for status in statuses if status)
+            byField=[sum(1 for status in statuses if status and field in status) for field in NWAY_FIELDS]
+            print "\n Input :: %s ::"%label,[missing,divergent]+byField
+        for label,counts in itertools.izip(labels,replicaCounts):
+            print "----------------------------------------------------------"
+            print "Replica Count Issues of "+label
+            for o in counts.keys():
+                print "\n",[o]+counts[o]
+            print "number of such cases ::",len(counts)
+        print "======================================================"
+
+    @staticmethod
+    def nWayStatusText(status):
+        if status is MISSING:
+            return "missing"
+        if not status:
+            return "ok"
+        return ",".join(status)
+
+    """ Print the estimates of an approximate comparison with their bounds """
+    @staticmethod
+    def printResultOfApproximateAnalysis(estimate):
+        print "++++++++++++++++++++++++++++++++++++++++++++++++++++++++++"
+        print "Approximate Analysis of Source and Target Directory"
+        print "++++++++++++++++++++++++++++++++++++++++++++++++++++++++++"
+        print "Source Keys ::",estimate["srcRecords"]
+        print "Target Keys ::",estimate["tgtRecords"]
+        print "False positive rate of the key filter ::","%.3g"%estimate["keyFalsePositiveRate"]
+        print "False positive rate of the record filter ::","%.3g"%estimate["recordFalsePositiveRate"]
+        print "----------------------------------------------------------"
+        for label,name in (("1) Keys only in Source","srcOnly"),("2) Keys only in Target","tgtOnly"),("3) Keys with changed values","changed")):
+            low,value,high=estimate[name]
+            print label," :: %d [%.1f, %.1f]"%(round(value),low,high)
+        print "======================================================"
+
+    """ Print the discrepancy counts of a sampled comparison scaled up to the
+        whole bucket, and as fractions of the sampled keys, with their
+        confidence intervals
+    """
+    @staticmethod
+    def printResultOfSampledAnalysis(sampler,counts):
+        srcRecords,tgtRecords=sampler.sampledRecords
+        print "++++++++++++++++++++++++++++++++++++++++++++++++++++++++++"
+        print "Sampled Analysis of Source and Target Directory"
+        print "++++++++++++++++++++++++++++++++++++++++++++++++++++++++++"
+        print "Sample rate ::",sampler.rate
+        print "Sampled Source Keys ::",srcRecords,":: estimated %.0f"%(srcRecords/sampler.rate)
+        print "Sampled Target Keys ::",tgtRecords,":: estimated %.0f"%(tgtRecords/sampler.rate)
+        print "Estimates with %.0f%% confidence intervals"%(100*math.erf(sampler.z/math.sqrt(2)))
+        print "----------------------------------------------------------"
+        for label,name in (("1) Keys only in Source","srcOnly"),("2) Keys only in Target","tgtOnly"),("3) Keys with changed values","changed"),
+                           ("4) Source keys with unexpected replica count","srcReplicaCount"),("5) Target keys with unexpected replica count","tgtReplicaCount")):
+            if name not in counts:
+                continue
+            low,value,high=sampler.scale(counts[name])
+            total=tgtRecords if name in ("tgtOnly","tgtReplicaCount") else srcRecords
+            fLow,fValue,fHigh=sampler.fraction(counts[name],total)
+            print label," :: %d [%.1f, %.1f] :: %.4f%% [%.4f%%, %.4f%%] of the keys"%(
+                round(value),low,high,100*fValue,100*fLow,100*fHigh)
+        print "======================================================"
+
     """ Print in format for {Exp, Flag, CAS, Rev Id, Value} """
     @staticmethod
     def printAllValues(data=[]):
@@ -239,3 +1291,94 @@ class DataComparator(object):
         str['Rev Id']=data[3]
         str['Value']=data[4]
         return str
+
+""" Module level parsers so that they can be sent to worker processes """
+def parseCSVFile(filePath):
+    return DataComparator.getValueFromCSV(filePath)
+
+def parseCSVFileWithDigest(filePath):
+    return DataComparator.getValueFromCSV(filePath,True)
+
+def parseJasonFile(filePath):
+    return DataComparator.getValueFromJasonResult(filePath)
+
+""" Parser of the sampled keys of a dump file, picklable for worker processes """
+class SampledParser(object):
+
+    def __init__(self,sampler,mode="cbt",digestValues=False):
+        self.sampler=sampler
+        self.mode=mode
+        self.digestValues=digestValues
+        self.__name__="parse%sSample%r%s"%(mode,sampler.rate,"Digest" if digestValues else "")
+
+    def __call__(self,filePath):
+        if self.mode == "cbt":
+            return DataComparator.getValueFromCSV(filePath,self.digestValues,self.sampler)
+        return DataComparator.getValueFromJasonResult(filePath,None,self.sampler)
+
+def partitionCSVFile(task):
+    filePath,side,fileId,workDir,partitions=task
+    writer=PartitionWriter(workDir,side,fileId,partitions)
+    try:
+        for key,record in DataComparator.iterCSVRecords(filePath):
+            writer.add(key,record)
+    finally:
+        writer.close()
+    return writer.count
+
+def partitionJasonFile(task):
+    filePath,side,fileId,workDir,partitions=task
+    writer=PartitionWriter(workDir,side,fileId,partitions)
+    try:
+        for key,value in iterViewRows(filePath):
+            writer.add(key,value)
+    finally:
+        writer.close()
+    return writer.count
+
+""" Put the records of a CSV file on a queue in batches of PIPELINE_BATCH_SIZE,
+    followed by None
+"""
+def readRecordBatches(filePath,digestValues,queue):
+    try:
+        batch=[]
+        for item in DataComparator.iterCSVRecords(filePath,digestValues):
+            batch.append(item)
+            if len(batch) >= PIPELINE_BATCH_SIZE:
+                queue.put(batch)
+                batch=[]
+        if batch:
+            queue.put(batch)
+    finally:
+        queue.put(None)
+
+""" Diff one partition pair, later files overwrite earlier ones as with dict.update """
+def diffCSVPartition(task):
+    workDir,srcFileCount,tgtFileCount,partition=task
+    totalSRC={}
+    totalTGT={}
+    for fileId in range(srcFileCount):
+        totalSRC.update(readPartition(workDir,"src",fileId,partition))
+    for fileId in range(tgtFileCount):
+        totalTGT.update(readPartition(workDir,"tgt",fileId,partition))
+    return DataComparator.differenceInChangedKeys(totalSRC,totalTGT,False)
+
+def diffJasonPartition(task):
+    workDir,srcFiles,tgtFiles,partition,srcCnt,tgtCnt=task
+    totals=[]
+    for side,files in (("src",srcFiles),("tgt",tgtFiles)):
+        total={}
+        counter=ReplicaCounter()
+        for fileId,file in enumerate(files):
+            counterFileId=counter.addFile(file)
+            info={}
+            for key,value in readPartition(workDir,side,fileId,partition):
+                if key not in info:
+                    info[key]=value
+                counter.add(key,counterFileId)
+            total.update(info)
+        totals.append((total,counter))
+    diff1,diff2,diff3=DataComparator.differenceInChangedKeysForJasonResult(totals[0][0],totals[1][0],False)
+    srcCountResult=DataComparator.compareCountOfReplicas(totals[0][1],srcCnt)
+    tgtCountResult=DataComparator.compareCountOfReplicas(totals[1][1],tgtCnt)
+    return srcCountResult,tgtCountResult,diff1,diff2,diff3
@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+
+""" Raised as soon as a comparison found more discrepancies than its budget """
+class BudgetExceeded(Exception):
+
+    def __init__(self,count,limit):
+        Exception.__init__(self,"%d discrepancies found, the budget is %d"%(count,limit))
+        self.count=count
+        self.limit=limit
+
+""" Budget of discrepancies a comparison may find before it is abandoned
+    The limit is failAfter discrepancies and, once the number of source
+    records is known (setTotal), at most maxRatio of those records,
+    whichever is lower. Every discrepancy found is charged and the charge
+    that goes over the limit raises BudgetExceeded. check() tests a lower
+    bound of the discrepancies known early, e.g. while parsing, without
+    charging it, so a run can stop before its diff stage.
+"""
+class DiffBudget(object):
+
+    def __init__(self,failAfter=None,maxRatio=None):
+        self.failAfter=failAfter
+        self.maxRatio=maxRatio
+        self.limit=failAfter
+        self.count=0
+
+    """ Tighten the limit by maxRatio of the given number of source records """
+    def setTotal(self,records):
+        if self.maxRatio is None:
+            return
+        limit=int(self.maxRatio*records)
+        if self.failAfter is not None:
+            limit=min(limit,self.failAfter)
+        self.limit=limit
+
+    def charge(self,n=1):
+        self.count+=n
+        if self.limit is not None and self.count > self.limit:
+            raise BudgetExceeded(self.count,self.limit)
+
+    def check(self,lowerBound):
+        if self.limit is not None and lowerBound > self.limit:
+            raise BudgetExceeded(lowerBound,self.limit)
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+import mmap
+import struct
+import marshal
+
+from partition import vbucketOf
+from report_writer import CATEGORIES
+
+DIFF_RESULT_MAGIC="CMPDIFF1"
+
+""" Labels of the fields of a changed key, as in differenceInValuesInCSVFormat,
+    bit i of the field mask of an entry is set when field i changed
+"""
+DIFF_FIELDS=('Exp','Flag','CAS','Rev','Value')
+
+LENGTH=struct.Struct('<I')
+CATEGORY=struct.Struct('<QQ')
+INDEX_ENTRY=struct.Struct('<QHB')
+
+""" Bit mask of the changed fields of a diff detail, 0 for anything but a field map """
+def fieldMask(detail):
+    if not isinstance(detail,dict):
+        return 0
+    mask=0
+    for i,field in enumerate(DIFF_FIELDS):
+        if field in detail:
+            mask|=1 << i
+    return mask
+
+""" Bit mask of a comma separated list of field names, case insensitive """
+def parseFields(names):
+    mask=0
+    lower=[f.lower() for f in DIFF_FIELDS]
+    for name in names.split(","):
+        name=name.strip().lower()
+        if name not in lower:
+            raise ValueError("Unknown field ::"+name+", expected some of "+",".join(DIFF_FIELDS))
+        mask|=1 << lower.index(name)
+    return mask
+
+""" Write the diffs of a comparison to a result file
+    diffs maps a category of CATEGORIES to its diff map key -> detail and
+    meta is a dict of plain values describing the run (mode, directories).
+    Layout: magic, meta, one (count, index offset) pair per category, the
+    entries of every category sorted by key, each the key and the marshalled
+    detail, then per category an index of (entry offset, vBucket, field
+    mask) in key order.
+"""
+def writeDiffResult(path,diffs,meta=None):
+    with open(path,'wb') as f:
+        f.write(DIFF_RESULT_MAGIC)
+        data=marshal.dumps(meta or {})
+        f.write(LENGTH.pack(len(data)))
+        f.write(data)
+        tablePos=f.tell()
+        f.write(CATEGORY.pack(0,0)*len(CATEGORIES))
+        indexes=[]
+        for category in CATEGORIES:
+            diff=diffs.get(category) or {}
+            entries=[]
+            for key in diff:
+                raw=key.encode('utf-8') if isinstance(key,unicode) else key
+                entries.append((raw,key))
+            entries.sort()
+            index=[]
+            for raw,key in entries:
+                detail=diff[key]
+                index.append(INDEX_ENTRY.pack(f.tell(),vbucketOf(raw),fieldMask(detail)))
+                data=marshal.dumps(detail)
+                f.write(LENGTH.pack(len(raw)))
+                f.write(raw)
+                f.write(LENGTH.pack(len(data)))
+                f.write(data)
+            indexes.append(index)
+        table=[]
+        for index in indexes:
+            table.append(CATEGORY.pack(len(index),f.tell()))
+            f.write("".join(index))
+        f.seek(tablePos)
+        f.write("".join(table))
+
+""" Read only view of a result file written by writeDiffResult
+    The file is memory mapped; keys are found by binary search over the
+    index of a category and details are only unmarshalled for the entries
+    that pass the filters.
+"""
+class DiffResult(object):
+
+    def __init__(self,path):
+        self.path=path
+        self.file=open(path,'rb')
+        self.buf=mmap.mmap(self.file.fileno(),0,access=mmap.ACCESS_READ)
+        if self.buf[:len(DIFF_RESULT_MAGIC)] != DIFF_RESULT_MAGIC:
+            self.close()
+            raise ValueError("Not a diff result file ::"+path)
+        pos=len(DIFF_RESULT_MAGIC)
+        size=LENGTH.unpack_from(self.buf,pos)[0]
+        pos+=LENGTH.size
+        self.meta=marshal.loads(self.buf[pos:pos+size])
+        pos+=size
+        self.table={}
+        for category in CATEGORIES:
+            self.table[category]=CATEGORY.unpack_from(self.buf,pos)
+            pos+=CATEGORY.size
+
+    def count(self,category):
+        return self.table[category][0]
+
+    def indexEntry(self,category,i):
+        return INDEX_ENTRY.unpack_from(self.buf,self.table[category][1]+i*INDEX_ENTRY.size)
+
+    def keyAt(self,offset):
+        size=LENGTH.unpack_from(self.buf,offset)[0]
+        return self.buf[offset+LENGTH.size:offset+LENGTH.size+size]
+
+    def detailAt(self,offset):
+        pos=offset+LENGTH.size+LENGTH.unpack_from(self.buf,offset)[0]
+        size=LENGTH.unpack_from(self.buf,pos)[0]
+        pos+=LENGTH.size
+        return marshal.loads(self.buf[pos:pos+size])
+
+    """ Index of the first key of a category not below key """
+    def lowerBound(self,category,key):
+        lo=0
+        hi=self.count(category)
+        while lo < hi:
+            mid=(lo+hi)//2
+            if self.keyAt(self.indexEntry(category,mid)[0]) < key:
+                lo=mid+1
+            else:
+                hi=mid
+        return lo
+
+    """ (start, stop) index range of the keys of a category starting with prefix """
+    def prefixRange(self,category,prefix):
+        if not prefix:
+            return 0,self.count(category)
+        start=self.lowerBound(category,prefix)
+        # the keys from start on that have the prefix come first
+        lo=start
+        hi=self.count(category)
+        while lo < hi:
+            mid=(lo+hi)//2
+            if self.keyAt(self.indexEntry(category,mid)[0]).startswith(prefix):
+                lo=mid+1
+            else:
+                hi=mid
+        return start,lo
+
+    """ (category, key, vBucket, detail) of the entries passing the filters
+        categories restricts the categories, prefix the keys, vbuckets is a
+        set of vBuckets and fields a mask of DIFF_FIELDS of which at least
+        one must have changed (only changed keys have fields)
+    """
+    def entries(self,categories=CATEGORIES,prefix=None,vbuckets=None,fields=0):
+        for category in categories:
+            if fields and category != "changed":
+                continue
+            start,stop=self.prefixRange(category,prefix)
+            for i in xrange(start,stop):
+                offset,vb,mask=self.indexEntry(category,i)
+                if vbuckets is not None and vb not in vbuckets:
+                    continue
+                if fields and not mask & fields:
+                    continue
+                yield category,self.keyAt(offset),vb,self.detailAt(offset)
+
+    def close(self):
+        self.buf.close()
+        self.file.close()
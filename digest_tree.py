@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+import struct
+import hashlib
+
+from partition import vbucketOf, NUM_VBUCKETS
+
+try:
+    import xxhash
+except ImportError:
+    xxhash=None
+
+DIGEST_MAGIC="CMPDIGT2"
+DIGEST_MASK=0xffffffffffffffff
+
+""" 64 bit digest of a string """
+def digest64(data):
+    if isinstance(data,unicode):
+        data=data.encode('utf-8')
+    return struct.unpack('<Q',hashlib.md5(data).digest()[:8])[0]
+
+""" Fast 64 bit digest of a document body, xxh64 when xxhash is installed """
+def valueDigest(data):
+    if xxhash is not None:
+        return xxhash.xxh64(data).intdigest()
+    return digest64(data)
+
+""" Digest of one {Key, Exp, Flag, CAS, Rev id, Value} record """
+def recordDigest(key,record):
+    value=record[4]
+    if isinstance(value,list):
+        value=",".join(value)
+    elif not isinstance(value,basestring):
+        value=str(value)
+    return digest64("\0".join((key,str(record[0]),str(record[1]),str(record[2]),str(record[3]),str(digest64(value)))))
+
+""" Hash tree over the vBuckets of a bucket
+    Every leaf is the sum (mod 2^64) of the record digests of one vBucket,
+    so it does not depend on the order records are read in and leaves of
+    several dump files can be added up. Every key must be added once, so
+    callers resolve keys held by several dump files first. Internal nodes
+    hash their two
+    children, so comparing two trees starts at the root and only descends
+    into subtrees whose digests differ.
+    Only the leaves are saved, the internal nodes are rebuilt on load.
+"""
+class DigestTree(object):
+
+    def __init__(self,numVbuckets=NUM_VBUCKETS):
+        self.numVbuckets=numVbuckets
+        self.leaves=[0]*numVbuckets
+        self.counts=[0]*numVbuckets
+        self.levels=None
+
+    def add(self,key,record):
+        self.addDigest(key,recordDigest(key,record))
+
+    """ Add a key by the recordDigest of its record """
+    def addDigest(self,key,digest):
+        vb=vbucketOf(key,self.numVbuckets)
+        self.leaves[vb]=(self.leaves[vb]+digest) & DIGEST_MASK
+        self.counts[vb]+=1
+        self.levels=None
+
+    """ Add the leaves of a tree built from other dump files of the same side """
+    def merge(self,other):
+        if self.numVbuckets != other.numVbuckets:
+            raise ValueError("Digest trees have a different number of vBuckets")
+        self.leaves=[(a+b) & DIGEST_MASK for a,b in zip(self.leaves,other.leaves)]
+        self.counts=[a+b for a,b in zip(self.counts,other.counts)]
+        self.levels=None
+
+    """ Build the internal levels, levels[0] is the root level """
+    def build(self):
+        level=[digest64(struct.pack('<QQ',d,c)) for d,c in zip(self.leaves,self.counts)]
+        levels=[level]
+        while len(level) > 1:
+            level=[digest64(struct.pack('<QQ',level[i],level[i+1])) for i in range(0,len(level),2)]
+            levels.insert(0,level)
+        self.levels=levels
+        return levels
+
+    def root(self):
+        if self.levels is None:
+            self.build()
+        return self.levels[0][0]
+
+    """ List of vBuckets whose digests differ between the two trees """
+    def differingVbuckets(self,other):
+        if self.numVbuckets != other.numVbuckets:
+            raise ValueError("Digest trees have a different number of vBuckets")
+        mine=self.levels or self.build()
+        theirs=other.levels or other.build()
+        nodes=[0]
+        for depth in range(len(mine)):
+            nodes=[n for n in nodes if mine[depth][n] != theirs[depth][n]]
+            if depth < len(mine)-1:
+                nodes=[c for n in nodes for c in (2*n,2*n+1)]
+        return nodes
+
+    def save(self,path):
+        with open(path,'wb') as f:
+            f.write(DIGEST_MAGIC)
+            f.write(struct.pack('<I',self.numVbuckets))
+            f.write(struct.pack('<%dQ'%self.numVbuckets,*self.leaves))
+            f.write(struct.pack('<%dQ'%self.numVbuckets,*self.counts))
+
+    @staticmethod
+    def load(path):
+        with open(path,'rb') as f:
+            magic=f.read(len(DIGEST_MAGIC))
+            if magic != DIGEST_MAGIC:
+                if magic[:-1] == DIGEST_MAGIC[:-1]:
+                    raise ValueError("Digest tree of an older version, build it again ::"+path)
+                raise ValueError("Not a digest tree file ::"+path)
+            numVbuckets=struct.unpack('<I',f.read(4))[0]
+            tree=DigestTree(numVbuckets)
+            tree.leaves=list(struct.unpack('<%dQ'%numVbuckets,f.read(8*numVbuckets)))
+            tree.counts=list(struct.unpack('<%dQ'%numVbuckets,f.read(8*numVbuckets)))
+        return tree
+
+    @staticmethod
+    def isDigestFile(path):
+        try:
+            with open(path,'rb') as f:
+                return f.read(len(DIGEST_MAGIC)-1) == DIGEST_MAGIC[:-1]
+        except IOError:
+            return False
@@ -0,0 +1,413 @@
+#!/usr/bin/env python
+import sys
+import time
+import getopt
+import shutil
+import socket
+import struct
+import marshal
+import tempfile
+
+sys.path.extend(('.', 'lib'))
+
+from data_comparison_helper import DataComparator
+from digest_tree import DigestTree
+from partition import PartitionWriter, readPartition, vbucketOf, DEFAULT_PARTITIONS, NUM_VBUCKETS
+from dump_reader import listDumpFiles
+from report_writer import createReportWriter
+from compare_data import EXIT_IN_SYNC, EXIT_DIFFERENT, EXIT_ERROR
+
+""" Records per message of a records reply """
+RECORDS_PER_MESSAGE=10000
+
+""" vBuckets whose records are fetched from the workers at a time, rounded
+    up to whole partitions of the workers
+"""
+VBUCKETS_PER_FETCH=64
+
+HEADER=struct.Struct('<I')
+
+""" The usage method"""
+def usage(error=None):
+    print """\
+    Compares cbt dumps that stay on the nodes holding them. A worker runs next
+    to the dumps of one node, parses them once into vBucket partitions and a
+    digest tree and serves them over TCP; the coordinator sums the digest
+    trees of each side, fetches only the records of the vBuckets whose
+    digests differ and prints the usual three category report
+
+    Syntax: distributed_compare.py worker -d dumpPath [-p port] [options]
+            distributed_compare.py coordinator --src-workers h:p,... --tgt-workers h:p,... [options]
+    Example: distributed_compare.py worker -d /data/10.1.1.1.mem.csv -p 9100
+             distributed_compare.py coordinator --src-workers 10.1.1.1:9100,10.1.1.2:9100 --tgt-workers 10.1.2.1:9100
+
+    [Worker Parameters]
+    -d      :: Dump file or directory of dumps of this node
+    -p      :: Port to listen on (default 0, any free port, printed at start)
+    --bind  :: Address to listen on (default 0.0.0.0)
+    --partitions :: Number of vBucket partition files (default 64)
+    --tmpdir :: Directory for the partition files (default system temp)
+    [Coordinator Parameters]
+    --src-workers :: Comma separated host:port of the workers of the source cluster
+    --tgt-workers :: Comma separated host:port of the workers of the target cluster
+    --timeout :: Seconds a worker may take to answer (default none)
+    --report-format, --report-file, --max-examples :: As for compare_data.py
+    --shutdown-workers :: Stop the workers when the comparison is done
+    -h      :: Help, will list the usage
+
+    Every key must be on one worker of a side, as in the per node dumps of a
+    cluster: the digests of a key held by several workers of a side are
+    summed while its records are merged with the last worker winning, so
+    such keys are reported by the coordinator and the counts are off.
+    The protocol is length prefixed marshal messages without authentication,
+    run the workers on a trusted network only. Exit codes are those of
+    compare_data.py
+    """
+    if error:
+        print error
+
+def sendMessage(sock,message):
+    data=marshal.dumps(message)
+    sock.sendall(HEADER.pack(len(data)))
+    sock.sendall(data)
+
+""" Read one message from the file of a socket, None at the end of the connection """
+def receiveMessage(reader):
+    header=reader.read(HEADER.size)
+    if len(header) < HEADER.size:
+        return None
+    size=HEADER.unpack(header)[0]
+    data=reader.read(size)
+    if len(data) < size:
+        raise IOError("Connection closed in the middle of a message")
+    return marshal.loads(data)
+
+""" Worker serving the dumps of one node
+    The dumps are read once into one partition file per vBucket partition
+    and dump file, like the partitioned comparison, and into a digest tree.
+    Requests are
+        ("digest",) -> ("digest", numVbuckets, leaves, counts, partitions)
+        ("records", vbuckets) -> ("records", [(key, record), ...]) messages
+                                 followed by ("end",)
+        ("shutdown",) -> ("bye",), the worker exits
+    Within a node the last dump file holding a key wins, as with dict.update
+"""
+class CompareWorker(object):
+
+    def __init__(self,path,partitions=DEFAULT_PARTITIONS,tmpDir=None):
+        self.path=path
+        self.partitions=partitions
+        self.tmpDir=tmpDir
+        self.workDir=None
+        self.files=[]
+        self.tree=DigestTree()
+
+    def load(self):
+        self.workDir=tempfile.mkdtemp(prefix="cmpdump-worker-",dir=self.tmpDir)
+        self.files=listDumpFiles(self.path)
+        for fileId,file in enumerate(self.files):
+            print "Analyzing file ::"+file
+            writer=PartitionWriter(self.workDir,"local",fileId,self.partitions)
+            try:
+                for key,record in DataComparator.iterCSVRecords(file):
+                    writer.add(key,record)
+            finally:
+                writer.close()
+            print "Record(s) Read ::",writer.count
+        # the tree is built per partition so that a key of several dump files counts once
+        for partition in range(self.partitions):
+            info={}
+            for fileId in range(len(self.files)):
+                info.update(readPartition(self.workDir,"local",fileId,partition))
+            for key,record in info.iteritems():
+                self.tree.add(key,record)
+        print "Total Records ::",sum(self.tree.counts)
+
+    """ Records of the given vBuckets, key -> record """
+    def records(self,vbuckets):
+        vbuckets=set(vbuckets)
+        info={}
+        for partition in sorted(set(vb % self.partitions for vb in vbuckets)):
+            for fileId in range(len(self.files)):
+                for key,record in readPartition(self.workDir,"local",fileId,partition):
+                    if vbucketOf(key) in vbuckets:
+                        info[key]=record
+        return info
+
+    """ Answer the requests of one coordinator connection, False after a shutdown """
+    def serveConnection(self,conn):
+        reader=conn.makefile('rb')
+        try:
+            while True:
+                message=receiveMessage(reader)
+                if message is None:
+                    return True
+                if message[0] == "digest":
+                    sendMessage(conn,("digest",self.tree.numVbuckets,self.tree.leaves,self.tree.counts,self.partitions))
+                elif message[0] == "records":
+                    items=self.records(message[1]).items()
+                    for start in range(0,len(items),RECORDS_PER_MESSAGE):
+                        sendMessage(conn,("records",items[start:start+RECORDS_PER_MESSAGE]))
+                    sendMessage(conn,("end",))
+                elif message[0] == "shutdown":
+                    sendMessage(conn,("bye",))
+                    return False
+                else:
+                    sendMessage(conn,("error","Unknown request ::"+str(message[0])))
+        finally:
+            reader.close()
+
+    def serve(self,host="0.0.0.0",port=0):
+        listener=socket.socket(socket.AF_INET,socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET,socket.SO_REUSEADDR,1)
+        listener.bind((host,port))
+        listener.listen(5)
+        print "Worker listening on %s:%d"%listener.getsockname()
+        sys.stdout.flush()
+        try:
+            while True:
+                conn,address=listener.accept()
+                try:
+                    if not self.serveConnection(conn):
+                        return
+                except socket.error, err:
+                    sys.stderr.write('ERROR: %s\n' % str(err))
+                finally:
+                    conn.close()
+        finally:
+            listener.close()
+
+    def close(self):
+        if self.workDir:
+            shutil.rmtree(self.workDir,ignore_errors=True)
+
+""" Connection of the coordinator to one worker """
+class WorkerClient(object):
+
+    def __init__(self,address,timeout=None):
+        host,port=address.rsplit(":",1)
+        self.address=address
+        self.sock=socket.create_connection((host,int(port)),timeout)
+        self.reader=self.sock.makefile('rb')
+        self.partitions=DEFAULT_PARTITIONS
+
+    def send(self,*message):
+        sendMessage(self.sock,message)
+
+    def receive(self):
+        message=receiveMessage(self.reader)
+        if message is None:
+            raise IOError("Worker closed the connection ::"+self.address)
+        if message[0] == "error":
+            raise IOError("Worker "+self.address+" :: "+message[1])
+        return message
+
+    def digestTree(self):
+        self.send("digest")
+        reply,numVbuckets,leaves,counts,self.partitions=self.receive()
+        tree=DigestTree(numVbuckets)
+        tree.leaves=list(leaves)
+        tree.counts=list(counts)
+        return tree
+
+    """ Records of a records request sent earlier, key -> record """
+    def receiveRecords(self):
+        info={}
+        while True:
+            message=self.receive()
+            if message[0] == "end":
+                return info
+            info.update(message[1])
+
+    def shutdown(self):
+        self.send("shutdown")
+        self.receive()
+
+    def close(self):
+        self.reader.close()
+        self.sock.close()
+
+""" Batches of about vbucketsPerFetch vBuckets made of whole partitions
+    (vb % partitions), so that a worker reads each of its partition files
+    for one batch only
+"""
+def fetchBatches(vbuckets,partitions,vbucketsPerFetch=VBUCKETS_PER_FETCH):
+    byPartition={}
+    for vb in vbuckets:
+        byPartition.setdefault(vb % partitions,[]).append(vb)
+    batch=[]
+    for partition in sorted(byPartition):
+        batch.extend(byPartition[partition])
+        if len(batch) >= vbucketsPerFetch:
+            yield batch
+            batch=[]
+    if batch:
+        yield batch
+
+""" Compare the dumps served by the workers of both sides
+    The digest trees of the workers of a side are summed into one tree per
+    side, and the records of the differing vBuckets are fetched from all
+    workers in fetchBatches, grouped by the partitions of the first source
+    worker, and diffed like compareDataInfoInCSVFormat, the last worker of
+    a side holding a key winning. Keys fetched from several workers of a
+    side are counted and reported, their digests were summed. Returns the
+    three diffs and the differing vBuckets
+"""
+def coordinate(srcClients,tgtClients,vbucketsPerFetch=VBUCKETS_PER_FETCH):
+    metrics=DataComparator.metrics
+    trees=[]
+    with metrics.stage("digests"):
+        for name,clients in (("Source",srcClients),("Target",tgtClients)):
+            tree=DigestTree(NUM_VBUCKETS)
+            for client in clients:
+                tree.merge(client.digestTree())
+            print "Total "+name+" Records ::",sum(tree.counts)
+            trees.append(tree)
+    DataComparator.budgetTotal(sum(trees[0].counts))
+    vbuckets=trees[0].differingVbuckets(trees[1])
+    print "vBuckets with different digests ::",len(vbuckets),"of",trees[0].numVbuckets
+    diff1={}
+    diff2={}
+    diff3={}
+    shared=0
+    with metrics.stage("fetch and diff"):
+        for batch in fetchBatches(vbuckets,srcClients[0].partitions,vbucketsPerFetch):
+            for client in srcClients+tgtClients:
+                client.send("records",batch)
+            totalSRC={}
+            totalTGT={}
+            for clients,total in ((srcClients,totalSRC),(tgtClients,totalTGT)):
+                for client in clients:
+                    info=client.receiveRecords()
+                    shared+=sum(1 for key in info if key in total)
+                    total.update(info)
+            d1,d2,d3=DataComparator.differenceInChangedKeys(totalSRC,totalTGT)
+            diff1.update(d1)
+            diff2.update(d2)
+            diff3.update(d3)
+    if shared:
+        print "WARNING :: Keys held by several workers of a side ::",shared,":: the last worker wins, the record counts include every copy"
+    return diff1,diff2,diff3,vbuckets
+
+""" Connect to the workers, retrying while they are still loading their dumps """
+def connectWorkers(addresses,timeout=None,retries=30,retryDelay=1):
+    clients=[]
+    for address in addresses:
+        for attempt in range(retries+1):
+            try:
+                clients.append(WorkerClient(address,timeout))
+                break
+            except socket.error:
+                if attempt == retries:
+                    raise
+                time.sleep(retryDelay)
+    return clients
+
+def runWorker(args):
+    path=None
+    host="0.0.0.0"
+    port=0
+    partitions=DEFAULT_PARTITIONS
+    tmpDir=None
+    (opts, rest) = getopt.getopt(args, 'd:p:h', ["help","bind=","partitions=","tmpdir="])
+    for o, a in opts:
+        if o in ("-h","--help"):
+            usage()
+            sys.exit(EXIT_IN_SYNC)
+        elif o == "-d":
+            path=a
+        elif o == "-p":
+            port=int(a)
+        elif o == "--bind":
+            host=a
+        elif o == "--partitions":
+            partitions=int(a)
+        elif o == "--tmpdir":
+            tmpDir=a
+    if path is None:
+        usage("ERROR :: Missing Required Parameters")
+        return EXIT_ERROR
+    worker=CompareWorker(path,partitions,tmpDir)
+    try:
+        worker.load()
+        worker.serve(host,port)
+    finally:
+        worker.close()
+    return EXIT_IN_SYNC
+
+def runCoordinator(args):
+    srcWorkers=[]
+    tgtWorkers=[]
+    timeout=None
+    reportFormat=None
+    reportFile=None
+    maxExamples=None
+    shutdown=False
+    (opts, rest) = getopt.getopt(args, 'h', ["help","src-workers=","tgt-workers=","timeout=","report-format=",
+                                 "report-file=","max-examples=","shutdown-workers"])
+    for o, a in opts:
+        if o in ("-h","--help"):
+            usage()
+            sys.exit(EXIT_IN_SYNC)
+        elif o == "--src-workers":
+            srcWorkers=a.split(",")
+        elif o == "--tgt-workers":
+            tgtWorkers=a.split(",")
+        elif o == "--timeout":
+            timeout=float(a)
+        elif o == "--report-format":
+            reportFormat=a
+        elif o == "--report-file":
+            reportFile=a
+        elif o == "--max-examples":
+            maxExamples=int(a)
+        elif o == "--shutdown-workers":
+            shutdown=True
+    if not srcWorkers or not tgtWorkers:
+        usage("ERROR :: Missing Required Parameters")
+        return EXIT_ERROR
+    reportOut=None
+    if reportFormat and not reportFile:
+        # the report owns stdout, progress output goes to stderr
+        reportOut=sys.stdout
+        sys.stdout=sys.stderr
+    srcClients=tgtClients=[]
+    try:
+        srcClients=connectWorkers(srcWorkers,timeout)
+        tgtClients=connectWorkers(tgtWorkers,timeout)
+        if reportFormat:
+            DataComparator.reportWriter=createReportWriter(reportFormat,reportFile,maxExamples,out=reportOut)
+        s1,s2,s3,vb=coordinate(srcClients,tgtClients)
+        if DataComparator.reportWriter is not None:
+            DataComparator.reportWriter.close()
+        else:
+            DataComparator.printResultOfCSVFormatAnalysis(s1,s2,s3)
+            print "Differing vBuckets ::",vb
+        if shutdown:
+            for client in srcClients+tgtClients:
+                client.shutdown()
+    finally:
+        for client in srcClients+tgtClients:
+            client.close()
+        if reportOut is not None:
+            sys.stdout=reportOut
+    return EXIT_DIFFERENT if s1 or s2 or s3 else EXIT_IN_SYNC
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in ("worker","coordinator"):
+        usage()
+        sys.exit(EXIT_IN_SYNC if len(sys.argv) > 1 and sys.argv[1] in ("-h","--help") else EXIT_ERROR)
+    exitCode=EXIT_ERROR
+    try:
+        if sys.argv[1] == "worker":
+            exitCode=runWorker(sys.argv[2:])
+        else:
+            exitCode=runCoordinator(sys.argv[2:])
+    except getopt.GetoptError, error:
+        usage("ERROR: " + str(error))
+    except Exception, error:
+        sys.stderr.write("ERROR :: %s\n" % str(error))
+    sys.exit(exitCode)
+
+if __name__ == "__main__":
+    main()
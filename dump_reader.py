@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+import sys
+import os
+import stat
+import glob
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard=None
+
+try:
+    import lz4.frame as lz4frame
+except ImportError:
+    lz4frame=None
+
+""" Path that stands for standard input """
+STDIN="-"
+
+""" Size of the compressed blocks read from a dump """
+BLOCK_SIZE=4*1024*1024
+
+GZIP_MAGIC="\x1f\x8b"
+ZSTD_MAGIC="\x28\xb5\x2f\xfd"
+LZ4_MAGIC="\x04\x22\x4d\x18"
+
+def gzipDecompressor():
+    return zlib.decompressobj(16+zlib.MAX_WBITS)
+
+def zstdDecompressor():
+    if zstandard is None:
+        raise IOError("Reading zstd compressed dumps needs the zstandard module")
+    return zstandard.ZstdDecompressor().decompressobj()
+
+def lz4Decompressor():
+    if lz4frame is None:
+        raise IOError("Reading lz4 compressed dumps needs the lz4 module")
+    return lz4frame.LZ4FrameDecompressor()
+
+""" Decompressor factory of a dump, chosen by the first bytes of the dump """
+def decompressorFor(magic):
+    if magic.startswith(GZIP_MAGIC):
+        return gzipDecompressor
+    if magic.startswith(ZSTD_MAGIC):
+        return zstdDecompressor
+    if magic.startswith(LZ4_MAGIC):
+        return lz4Decompressor
+    return None
+
+""" File like reader over a compressed stream
+    The raw stream is read in BLOCK_SIZE blocks and decompressed block by
+    block, so it works on pipes and stdin as well as on files. Concatenated
+    frames (for example several gzip members) are decompressed in turn.
+    Supports read, readline, line iteration and forward only seek.
+"""
+class DecompressedStream(object):
+
+    def __init__(self,raw,factory,head=""):
+        self.raw=raw
+        self.factory=factory
+        self.decompressor=factory()
+        self.pending=head
+        self.buffer=""
+        self.pos=0
+        self.offset=0
+        self.eof=False
+
+    """ Decompress the next block into the buffer, False at the end of the stream """
+    def fill(self):
+        while not self.eof:
+            data=self.pending or self.raw.read(BLOCK_SIZE)
+            self.pending=""
+            if not data:
+                self.eof=True
+                flush=getattr(self.decompressor,"flush",None)
+                out=flush() if flush else ""
+            else:
+                out=self.decompressor.decompress(data)
+                unused=getattr(self.decompressor,"unused_data","")
+                if unused or getattr(self.decompressor,"eof",False):
+                    self.decompressor=self.factory()
+                    self.pending=unused
+            if out:
+                self.buffer=self.buffer[self.pos:]+out
+                self.pos=0
+                return True
+        return False
+
+    def read(self,size=-1):
+        chunks=[]
+        while size < 0 or size > 0:
+            if self.pos >= len(self.buffer) and not self.fill():
+                break
+            end=len(self.buffer) if size < 0 else min(len(self.buffer),self.pos+size)
+            chunks.append(self.buffer[self.pos:end])
+            if size > 0:
+                size-=end-self.pos
+            self.pos=end
+        data="".join(chunks)
+        self.offset+=len(data)
+        return data
+
+    def readline(self):
+        chunks=[]
+        while True:
+            if self.pos >= len(self.buffer) and not self.fill():
+                break
+            end=self.buffer.find("\n",self.pos)
+            if end >= 0:
+                chunks.append(self.buffer[self.pos:end+1])
+                self.pos=end+1
+                break
+            chunks.append(self.buffer[self.pos:])
+            self.pos=len(self.buffer)
+        line="".join(chunks)
+        self.offset+=len(line)
+        return line
+
+    def __iter__(self):
+        while True:
+            line=self.readline()
+            if not line:
+                return
+            yield line
+
+    def tell(self):
+        return self.offset
+
+    """ Seek forward by reading and dropping the data in between """
+    def seek(self,offset):
+        if offset < self.offset:
+            raise IOError("Compressed dumps can only be read forward")
+        while self.offset < offset:
+            if not self.read(min(BLOCK_SIZE,offset-self.offset)):
+                break
+
+    def close(self):
+        if self.raw is not sys.stdin:
+            self.raw.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*args):
+        self.close()
+
+""" Plain reader over a pipe or stdin whose first bytes were already read """
+class PeekedStream(object):
+
+    def __init__(self,raw,head):
+        self.raw=raw
+        self.head=head
+
+    def read(self,size=-1):
+        head=self.head
+        self.head=""
+        if size < 0:
+            return head+self.raw.read()
+        if len(head) >= size:
+            self.head=head[size:]
+            return head[:size]
+        return head+self.raw.read(size-len(head))
+
+    def readline(self):
+        head=self.head
+        self.head=""
+        if "\n" in head:
+            line,rest=head.split("\n",1)
+            self.head=rest
+            return line+"\n"
+        return head+self.raw.readline()
+
+    def __iter__(self):
+        while True:
+            line=self.readline()
+            if not line:
+                return
+            yield line
+
+    def close(self):
+        if self.raw is not sys.stdin:
+            self.raw.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*args):
+        self.close()
+
+""" True for dumps that are regular files and can be seeked and memory mapped """
+def isRegularFile(path):
+    if path == STDIN:
+        return False
+    try:
+        return stat.S_ISREG(os.stat(path).st_mode)
+    except OSError:
+        return False
+
+""" Open a dump for reading
+    path may be a plain, gzip, zstd or lz4 file (detected by magic bytes),
+    a named pipe or "-" for stdin. Returns a binary file like object.
+"""
+def openDump(path):
+    if path == STDIN:
+        raw=sys.stdin
+    else:
+        raw=open(path,'rb',BLOCK_SIZE)
+    head=raw.read(4)
+    factory=decompressorFor(head)
+    if factory is not None:
+        return DecompressedStream(raw,factory,head)
+    if isRegularFile(path):
+        raw.seek(0)
+        return raw
+    return PeekedStream(raw,head)
+
+""" Files of a dump argument: the files of a directory in sorted order, or
+    the path itself for a single file, a named pipe or "-" for stdin.
+    The order is the one every mode merges the files in, the last file
+    holding a key wins
+"""
+def listDumpFiles(path):
+    if path != STDIN and os.path.isdir(path):
+        return sorted(glob.glob(path+"/*"))
+    return [path]
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+import os
+import heapq
+import marshal
+import tempfile
+import shutil
+
+""" Default memory budget (in bytes) for a single sorter """
+DEFAULT_MEMORY_LIMIT=256*1024*1024
+
+""" Rough per record overhead of a python list/dict entry, used for budgeting """
+RECORD_OVERHEAD=200
+
+""" Maximum number of spill files merged in a single pass """
+MAX_MERGE_FAN_IN=64
+
+""" External sort of (key, record) pairs using sorted spill files on local disk
+    - Records are buffered in memory until the memory budget is exhausted
+    - The buffer is then sorted by key and spilled to a run file
+    - sortedRecords() merges all runs and yields (key, record) in key order
+    When a key is added more than once the last record added wins, which
+    is the same behaviour as dict.update() used by the in memory comparison
+"""
+class ExternalSorter(object):
+
+    def __init__(self,memoryLimit=DEFAULT_MEMORY_LIMIT,tmpDir=None):
+        self.memoryLimit=memoryLimit
+        self.workDir=tempfile.mkdtemp(prefix="cmpdump-",dir=tmpDir)
+        self.buffer=[]
+        self.bufferSize=0
+        self.runs=[]
+        self.seq=0
+
+    """ Add one record to the sorter, spilling to disk when over budget """
+    def add(self,key,record):
+        self.buffer.append((key,self.seq,record))
+        self.seq+=1
+        self.bufferSize+=ExternalSorter.estimateSize(key,record)
+        if self.bufferSize >= self.memoryLimit:
+            self.spill()
+
+    """ Approximate in memory size of a record """
+    @staticmethod
+    def estimateSize(key,record):
+        size=len(key)+RECORD_OVERHEAD
+        for field in record:
+            if isinstance(field,list):
+                for v in field:
+                    size+=len(v)
+            elif field is not None:
+                size+=len(str(field))
+        return size
+
+    """ Sort the in memory buffer and write it out as a new run """
+    def spill(self):
+        if not self.buffer:
+            return
+        self.buffer.sort()
+        self.runs.append(self.writeRun(self.buffer))
+        self.buffer=[]
+        self.bufferSize=0
+
+    def writeRun(self,entries):
+        fd,path=tempfile.mkstemp(suffix=".run",dir=self.workDir)
+        with os.fdopen(fd,'wb',1024*1024) as f:
+            for entry in entries:
+                marshal.dump(entry,f)
+        return path
+
+    @staticmethod
+    def readRun(path):
+        with open(path,'rb',1024*1024) as f:
+            while True:
+                try:
+                    yield marshal.load(f)
+                except EOFError:
+                    break
+
+    """ Merge runs in batches until at most MAX_MERGE_FAN_IN remain """
+    def reduceRuns(self):
+        while len(self.runs) > MAX_MERGE_FAN_IN:
+            batch=self.runs[:MAX_MERGE_FAN_IN]
+            merged=self.writeRun(heapq.merge(*[ExternalSorter.readRun(p) for p in batch]))
+            for p in batch:
+                os.remove(p)
+            self.runs=self.runs[MAX_MERGE_FAN_IN:]+[merged]
+
+    """ Yield (key, record) in key order, keeping the last record of a key """
+    def sortedRecords(self):
+        if not self.runs:
+            self.buffer.sort()
+            entries=iter(self.buffer)
+        else:
+            self.spill()
+            self.reduceRuns()
+            entries=heapq.merge(*[ExternalSorter.readRun(p) for p in self.runs])
+        pending=None
+        for entry in entries:
+            if pending is not None and pending[0] != entry[0]:
+                yield pending[0],pending[2]
+            pending=entry
+        if pending is not None:
+            yield pending[0],pending[2]
+
+    """ Remove all spill files """
+    def cleanup(self):
+        self.buffer=[]
+        self.runs=[]
+        shutil.rmtree(self.workDir,ignore_errors=True)
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+import sys
+import os
+import json
+import zlib
+import random
+import getopt
+
+""" The usage method"""
+def usage(error=None):
+    print """\
+    Generates synthetic source and target dumps for the comparison tool
+
+    cbt  :: cbtransfer style CSV {Key, Exp, Flag, CAS, Rev id, Value}, one file per node
+    view :: view style {rows:[{id,key,value}]} dumps for active and replica
+
+    Syntax: generate_dumps.py -o outDir -m mode -k keys [options]
+    Example: generate_dumps.py -o ./bench -m cbt -k 1000000 -n 4 --missing 0.001
+
+    [Required Parameters]
+    -o      :: Output directory, dumps are written to outDir/src and outDir/tgt
+    -m      :: cbt or view
+    -k      :: Number of keys
+    [Optional Parameters]
+    -n        :: Number of files (nodes) per side (default 4)
+    --seed    :: Random seed (default 1)
+    --value-size :: Approximate size of a document body in bytes (default 200)
+    --missing :: Fraction of keys missing from either side (default 0)
+    --drift   :: Fraction of keys with different Exp, Flag, CAS or Rev (default 0)
+    --changed :: Fraction of keys with a different value (default 0)
+    --duplicate :: Fraction of keys written twice to the target (default 0)
+    -h      :: Help, will list the usage
+
+    A manifest.json with the number of injected discrepancies is written to outDir
+    """
+    if error:
+        print error
+
+""" Writes cbtransfer and view dumps with injected discrepancies
+    Keys are spread round robin over the node files and written as they are
+    generated, so memory does not depend on the number of keys
+"""
+class DumpGenerator(object):
+
+    def __init__(self,outDir,mode="cbt",files=4,seed=1,valueSize=200):
+        self.outDir=outDir
+        self.mode=mode
+        self.files=files
+        self.random=random.Random(seed)
+        self.valueSize=valueSize
+        self.injected={"srcOnly":0,"tgtOnly":0,"metadata":0,"value":0,"duplicate":0}
+
+    def document(self,i,version=0):
+        filler="x"*max(0,self.valueSize-60)
+        return '{"id":%d,"version":%d,"name":"user%d","data":"%s"}'%(i,version,i,filler)
+
+    def openFiles(self,side):
+        path=os.path.join(self.outDir,side)
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        extension=".mem.csv" if self.mode == "cbt" else ".view.json"
+        return [open(os.path.join(path,"node%d%s"%(n,extension)),'w',1024*1024) for n in range(self.files)]
+
+    def generate(self,keys,missing=0.0,drift=0.0,changed=0.0,duplicate=0.0):
+        src=self.openFiles("src")
+        tgt=self.openFiles("tgt")
+        first=[True]*(2*self.files)
+        if self.mode == "view":
+            for f in src+tgt:
+                f.write('{"rows":[\n')
+        r=self.random
+        for i in xrange(keys):
+            key="key::%012d"%i
+            node=i%self.files
+            record=[0,0,1400000000000000000+i,1,self.document(i)]
+            target=list(record)
+            writeSrc=writeTgt=True
+            if missing and r.random() < missing:
+                if r.random() < 0.5:
+                    writeTgt=False
+                    self.injected["srcOnly"]+=1
+                else:
+                    writeSrc=False
+                    self.injected["tgtOnly"]+=1
+            elif drift and r.random() < drift:
+                field=r.randint(0,3)
+                target[field]+=1
+                self.injected["metadata"]+=1
+            elif changed and r.random() < changed:
+                target[4]=self.document(i,1)
+                self.injected["value"]+=1
+            copies=1
+            if writeTgt and duplicate and r.random() < duplicate:
+                copies=2
+                self.injected["duplicate"]+=1
+            if writeSrc:
+                self.write(src[node],node,first,key,record)
+            for c in range(copies if writeTgt else 0):
+                self.write(tgt[node],self.files+node,first,key,target)
+        for f in src+tgt:
+            if self.mode == "view":
+                f.write('\n]}\n')
+            f.close()
+        manifest={"mode":self.mode,"keys":keys,"files":self.files,"injected":self.injected}
+        with open(os.path.join(self.outDir,"manifest.json"),'w') as f:
+            json.dump(manifest,f,indent=2)
+        return manifest
+
+    def write(self,f,index,first,key,record):
+        if self.mode == "cbt":
+            f.write("%s,%d,%d,%d,%d,%s\n"%(key,record[0],record[1],record[2],record[3],record[4]))
+            return
+        if not first[index]:
+            f.write(',\n')
+        first[index]=False
+        f.write('{"id":"%s","key":"%s","value":"%d-%016x%08x"}'%(key,key,record[3],record[2]+record[0]+record[1],zlib.crc32(record[4]) & 0xffffffff))
+
+def main():
+    outDir=None
+    mode="cbt"
+    keys=0
+    files=4
+    seed=1
+    valueSize=200
+    rates={"missing":0.0,"drift":0.0,"changed":0.0,"duplicate":0.0}
+    try:
+        (opts, args) = getopt.getopt(sys.argv[1:], 'o:m:k:n:h', ["help","seed=","value-size=","missing=","drift=","changed=","duplicate="])
+    except getopt.GetoptError, error:
+        usage("ERROR: " + str(error))
+        sys.exit(1)
+    for o, a in opts:
+        if o in ("-h","--help"):
+            usage()
+            sys.exit()
+        elif o == "-o":
+            outDir=a
+        elif o == "-m":
+            mode=a
+        elif o == "-k":
+            keys=int(a)
+        elif o == "-n":
+            files=int(a)
+        elif o == "--seed":
+            seed=int(a)
+        elif o == "--value-size":
+            valueSize=int(a)
+        else:
+            rates[o[2:]]=float(a)
+    if outDir is None or keys <= 0 or mode not in ("cbt","view"):
+        usage("ERROR :: Missing Required Parameters")
+        sys.exit(1)
+    manifest=DumpGenerator(outDir,mode,files,seed,valueSize).generate(keys,**rates)
+    print json.dumps(manifest["injected"])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+import os
+
+SRC=0
+TGT=1
+
+""" Comparison of two sides kept up to date file by file
+    Every side holds the parsed records of each of its dump files and a
+    merged map key -> (file, record) where, like the update order of
+    compareDataInfoInCSVFormat over the sorted files, the last file holding a
+    key wins. The src only, tgt only and changed maps are maintained for
+    the keys whose merged record changes, so updating a file costs time
+    proportional to that file and not to the whole bucket.
+    compareRecords(src, tgt) returns (changed, message) like
+    DataComparator.differenceInValuesInCSVFormat. A key is only refreshed
+    when its Exp, Flag, CAS, Rev id or Value changed or when it is a
+    discrepancy, whose value location may have moved with the new snapshot.
+"""
+class IncrementalIndex(object):
+
+    def __init__(self,compareRecords):
+        self.compareRecords=compareRecords
+        self.files=({},{})
+        self.merged=({},{})
+        self.srcOnly={}
+        self.tgtOnly={}
+        self.changed={}
+
+    """ Replace the records of a dump file of a side by info, key -> record """
+    def update(self,side,path,info):
+        old=self.files[side].get(path,{})
+        self.files[side][path]=info
+        merged=self.merged[side]
+        touched=[]
+        for key,record in info.iteritems():
+            current=merged.get(key)
+            if current is None or current[0] < path:
+                merged[key]=(path,record)
+                touched.append(key)
+            elif current[0] == path:
+                merged[key]=(path,record)
+                if current[1][:5] != record[:5] or key in self.changed or key in self.srcOnly or key in self.tgtOnly:
+                    touched.append(key)
+        for key in old:
+            if key not in info and merged[key][0] == path:
+                self.resolve(side,key)
+                touched.append(key)
+        for key in touched:
+            self.refresh(key)
+        return len(touched)
+
+    """ Drop a dump file of a side that no longer exists """
+    def remove(self,side,path):
+        old=self.files[side].pop(path,{})
+        merged=self.merged[side]
+        for key in old:
+            if merged[key][0] == path:
+                self.resolve(side,key)
+                self.refresh(key)
+        return len(old)
+
+    """ Find the winning record of a key among the remaining files of a side """
+    def resolve(self,side,key):
+        winner=None
+        for path,info in self.files[side].iteritems():
+            if key in info and (winner is None or path > winner[0]):
+                winner=(path,info[key])
+        if winner is None:
+            del self.merged[side][key]
+        else:
+            self.merged[side][key]=winner
+
+    """ Recompute the diff status of one key """
+    def refresh(self,key):
+        src=self.merged[SRC].get(key)
+        tgt=self.merged[TGT].get(key)
+        self.srcOnly.pop(key,None)
+        self.tgtOnly.pop(key,None)
+        self.changed.pop(key,None)
+        if src is not None and tgt is None:
+            self.srcOnly[key]=src[1]
+        elif tgt is not None and src is None:
+            self.tgtOnly[key]=tgt[1]
+        elif src is not None:
+            flag,message=self.compareRecords(src[1],tgt[1])
+            if flag:
+                self.changed[key]=message
+
+    def counts(self):
+        return {"srcRecords":len(self.merged[SRC]),"tgtRecords":len(self.merged[TGT]),
+                "srcOnly":len(self.srcOnly),"tgtOnly":len(self.tgtOnly),"changed":len(self.changed)}
+
+""" Identity of a dump file used to notice new snapshots """
+def fileIdentity(path):
+    st=os.stat(path)
+    return st.st_size,st.st_mtime
@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+import os
+import sqlite3
+
+SRC=0
+TGT=1
+
+""" Rows inserted per executemany call of the SQLite store """
+INSERT_BATCH_SIZE=50000
+
+DIGEST_SIGN=1 << 63
+
+""" Key stores hold the records of both sides of a cbt comparison and
+    answer the three diffs. Records are the digest records of
+    iterCSVRecords: [Exp, Flag, CAS, Rev id, value digest, (file, offset, length)].
+    A store is filled with addRecords per side and file, the last record
+    of a key wins, and queried with srcOnly, tgtOnly and changedPairs.
+"""
+
+""" Key store in two dictionaries, like the default in memory comparison """
+class MemoryKeyStore(object):
+
+    def __init__(self):
+        self.sides=({},{})
+
+    def clear(self):
+        self.sides=({},{})
+
+    def addRecords(self,side,path,records):
+        self.sides[side].update(records)
+
+    def finishLoad(self):
+        pass
+
+    def count(self,side):
+        return len(self.sides[side])
+
+    def srcOnly(self):
+        tgt=self.sides[TGT]
+        return ((key,record) for key,record in self.sides[SRC].iteritems() if key not in tgt)
+
+    def tgtOnly(self):
+        src=self.sides[SRC]
+        return ((key,record) for key,record in self.sides[TGT].iteritems() if key not in src)
+
+    """ (key, source record, target record) of the common keys whose fields differ """
+    def changedPairs(self):
+        tgt=self.sides[TGT]
+        for key,record in self.sides[SRC].iteritems():
+            other=tgt.get(key)
+            if other is not None and other[:5] != record[:5]:
+                yield key,record,other
+
+    def close(self):
+        pass
+
+""" Key store in an SQLite database file
+    Records are bulk loaded in transactions of INSERT_BATCH_SIZE rows into a
+    table keyed by (side, key), the diffs are computed by the database with
+    an anti join for the keys of one side only and a join for the changed
+    keys. The database is left behind after the run with the views
+    src_only, tgt_only and changed, so single keys can be inspected later
+    with the sqlite3 shell without parsing the dumps again, e.g.
+        select * from records where key = 'key::000000000042';
+"""
+class SqliteKeyStore(object):
+
+    SCHEMA="""
+        create table if not exists files (id integer primary key, path text unique);
+        create table if not exists records (
+            side integer not null, key text not null,
+            exp text, flag text, cas text, rev text, digest integer,
+            file integer, offset integer, length integer,
+            primary key (side, key)) without rowid;
+        create view if not exists src_only as
+            select s.* from records s where s.side = 0 and not exists
+                (select 1 from records t where t.side = 1 and t.key = s.key);
+        create view if not exists tgt_only as
+            select t.* from records t where t.side = 1 and not exists
+                (select 1 from records s where s.side = 0 and s.key = t.key);
+        create view if not exists changed as
+            select s.key, s.exp, t.exp as tgt_exp, s.flag, t.flag as tgt_flag, s.cas, t.cas as tgt_cas,
+                   s.rev, t.rev as tgt_rev, s.digest, t.digest as tgt_digest
+            from records s join records t on t.side = 1 and t.key = s.key
+            where s.side = 0 and (s.exp is not t.exp or s.flag is not t.flag or s.cas is not t.cas
+                                  or s.rev is not t.rev or s.digest is not t.digest);
+    """
+
+    COLUMNS="r.key, r.exp, r.flag, r.cas, r.rev, r.digest, f.path, r.offset, r.length"
+
+    def __init__(self,path):
+        self.path=path
+        self.db=sqlite3.connect(path)
+        self.db.text_factory=str
+        self.db.execute("pragma synchronous = off")
+        self.db.execute("pragma journal_mode = memory")
+        self.db.executescript(SqliteKeyStore.SCHEMA)
+        self.fileIds={}
+
+    def clear(self):
+        self.db.execute("delete from records")
+        self.db.execute("delete from files")
+        self.db.commit()
+        self.fileIds={}
+
+    def fileId(self,path):
+        if path not in self.fileIds:
+            self.db.execute("insert or ignore into files (path) values (?)",(path,))
+            self.fileIds[path]=self.db.execute("select id from files where path = ?",(path,)).fetchone()[0]
+        return self.fileIds[path]
+
+    """ Insert the (key, record) pairs of one dump file in batched transactions """
+    def addRecords(self,side,path,records):
+        fileId=self.fileId(path)
+        batch=[]
+        for key,r in records:
+            digest=r[4]-(DIGEST_SIGN << 1) if r[4] >= DIGEST_SIGN else r[4]
+            batch.append((side,key,r[0],r[1],r[2],r[3],digest,fileId,r[5][1],r[5][2]))
+            if len(batch) >= INSERT_BATCH_SIZE:
+                self.insert(batch)
+                batch=[]
+        if batch:
+            self.insert(batch)
+
+    def insert(self,batch):
+        with self.db:
+            self.db.executemany("insert or replace into records values (?,?,?,?,?,?,?,?,?,?)",batch)
+
+    def finishLoad(self):
+        self.db.execute("analyze")
+        self.db.commit()
+
+    def count(self,side):
+        return self.db.execute("select count(*) from records where side = ?",(side,)).fetchone()[0]
+
+    @staticmethod
+    def record(row,start=1):
+        digest=row[start+4]
+        if digest < 0:
+            digest+=DIGEST_SIGN << 1
+        return [row[start],row[start+1],row[start+2],row[start+3],digest,(row[start+5],row[start+6],row[start+7])]
+
+    def srcOnly(self):
+        return self.only(SRC)
+
+    def tgtOnly(self):
+        return self.only(TGT)
+
+    def only(self,side):
+        query=("select "+SqliteKeyStore.COLUMNS+" from records r join files f on f.id = r.file"
+               " where r.side = ? and not exists (select 1 from records o where o.side = ? and o.key = r.key)")
+        for row in self.db.execute(query,(side,1-side)):
+            yield row[0],SqliteKeyStore.record(row)
+
+    """ (key, source record, target record) of the common keys whose fields differ """
+    def changedPairs(self):
+        query=("select "+SqliteKeyStore.COLUMNS+", "+SqliteKeyStore.COLUMNS.replace("r.","t.").replace("f.","g.")+
+               " from records r join files f on f.id = r.file"
+               " join records t on t.side = 1 and t.key = r.key join files g on g.id = t.file"
+               " where r.side = 0 and (r.exp is not t.exp or r.flag is not t.flag or r.cas is not t.cas"
+               " or r.rev is not t.rev or r.digest is not t.digest)")
+        for row in self.db.execute(query):
+            yield row[0],SqliteKeyStore.record(row),SqliteKeyStore.record(row,10)
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+""" Open the key store named by a --store argument: memory or sqlite:PATH """
+def openKeyStore(spec):
+    if spec == "memory":
+        return MemoryKeyStore()
+    if spec.startswith("sqlite:"):
+        path=spec[len("sqlite:"):]
+        directory=os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        return SqliteKeyStore(path)
+    raise ValueError("Unknown key store ::"+spec)
@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+import os
+import glob
+import json
+import mmap
+import struct
+import hashlib
+import itertools
+from array import array
+
+from dump_reader import isRegularFile
+from record_store import UINT64
+from replica_counter import ReplicaCounter
+
+""" Default maximum size of the cache directory in bytes """
+DEFAULT_CACHE_SIZE=4*1024*1024*1024
+
+""" Version of the entry layout, part of every entry identity so entries
+    written for an older layout are never loaded
+"""
+CACHE_FORMAT=3
+
+""" Size of the reads hashing the content of a dump """
+HASH_CHUNK_SIZE=1024*1024
+
+ENTRY_MAGIC="CMPCACHE"
+
+""" Entry header: magic, format, layout, number of keys, number of value columns """
+ENTRY_HEADER=struct.Struct('<8sIIQI')
+
+""" Column header: type code and size of the column data in bytes """
+COLUMN_HEADER=struct.Struct('<cQ')
+
+""" Layouts of a parse result: key -> None (keys only projections), key ->
+    list or tuple of strings (records and projected records), key -> value
+    digest record, and the (ReplicaCounter, key -> value) of a view dump
+"""
+KEYS,LISTS,TUPLES,DIGESTS,VIEW=range(5)
+
+""" Raised for a parse result that fits none of the layouts """
+class LayoutError(Exception):
+    pass
+
+""" Type code of a column of strings, 's' for str and 'u' for unicode """
+def stringCode(values):
+    if all(type(v) is str for v in values):
+        return 's'
+    if all(type(v) is unicode for v in values):
+        return 'u'
+    raise LayoutError("Column holds values other than strings")
+
+""" Column data of strings: the offsets of the strings, then their bytes """
+def packStrings(values,code):
+    if code == 'u':
+        values=[v.encode('utf-8') for v in values]
+    offsets=array(UINT64,[0])
+    position=0
+    for v in values:
+        position+=len(v)
+        offsets.append(position)
+    return offsets.tostring()+"".join(values)
+
+def unpackStrings(buf,pos,count,code):
+    offsets=array(UINT64)
+    offsets.fromstring(buf[pos:pos+offsets.itemsize*(count+1)])
+    pos+=offsets.itemsize*(count+1)
+    data=buf[pos:pos+offsets[-1]]
+    if len(offsets) != count+1 or len(data) != offsets[-1]:
+        raise ValueError("Truncated cache entry")
+    values=[data[offsets[i]:offsets[i+1]] for i in xrange(count)]
+    if code == 'u':
+        values=[v.decode('utf-8') for v in values]
+    return values
+
+""" (layout, keys, [(code, values)]) of a parse result of filePath
+    Raises LayoutError when the result fits none of the layouts
+"""
+def encodeResult(filePath,result):
+    if isinstance(result,tuple):
+        counter,info=result
+        keys=info.keys()
+        if len(counter.files) != 1 or counter.otherFiles or len(counter) != len(keys):
+            raise LayoutError("Replica counter of more than one file")
+        values=[info[k] for k in keys]
+        texts=[json.dumps(v) for v in values]
+        if [json.loads(t) for t in texts] != values:
+            raise LayoutError("View values that do not round trip through JSON")
+        return VIEW,keys,[('u',[t.decode('utf-8') for t in texts]),('q',[counter.count(k) for k in keys])]
+    keys=result.keys()
+    values=[result[k] for k in keys]
+    if not values or values[0] is None:
+        if any(v is not None for v in values):
+            raise LayoutError("Keys only result with records")
+        return KEYS,keys,[]
+    first=values[0]
+    width=len(first)
+    if any(type(v) is not type(first) or len(v) != width for v in values):
+        raise LayoutError("Records of different types or lengths")
+    columns=zip(*values)
+    if type(first) is list and width == 6 and isinstance(first[5],tuple):
+        if any(location[0] != filePath for location in columns[5]):
+            raise LayoutError("Value locations in another file")
+        strings=[(stringCode(c),c) for c in columns[:4]]
+        return DIGESTS,keys,strings+[('q',columns[4]),('q',[l[1] for l in columns[5]]),('q',[l[2] for l in columns[5]])]
+    if type(first) not in (list,tuple):
+        raise LayoutError("Records that are neither lists nor tuples")
+    return LISTS if type(first) is list else TUPLES,keys,[(stringCode(c),c) for c in columns]
+
+""" Parse result of filePath from the decoded keys and columns of an entry """
+def decodeResult(filePath,layout,keys,columns):
+    if layout == VIEW:
+        texts,counts=columns
+        return ReplicaCounter.ofFile(filePath,keys,counts),dict(itertools.izip(keys,[json.loads(t) for t in texts]))
+    if layout == KEYS:
+        return dict.fromkeys(keys)
+    if layout == TUPLES:
+        return dict(itertools.izip(keys,itertools.izip(*columns)))
+    if layout == LISTS:
+        return dict(itertools.izip(keys,itertools.imap(list,itertools.izip(*columns))))
+    exp,flag,cas,rev,digest,offset,length=columns
+    return dict((key,[exp[i],flag[i],cas[i],rev[i],digest[i],(filePath,offset[i],length[i])]) for i,key in enumerate(keys))
+
+""" On disk cache of parsed dump files
+    An entry is keyed by the parser kind and the identity of the dump file:
+    its path, size, mtime and a hash of its whole content, so a dump is read
+    once more to look it up. Entries have a fixed binary layout, a header,
+    the keys and one column per record field, strings as an offset array
+    followed by their bytes and integers as a 64 bit array, and are read
+    back through a memory map. Entries hold data only, a damaged or
+    foreign entry is treated as a miss. Results that fit no layout are not
+    cached. Entries are touched on every hit and the least recently used
+    ones are evicted once the cache directory grows beyond maxSize.
+"""
+class ParseCache(object):
+
+    def __init__(self,cacheDir,maxSize=DEFAULT_CACHE_SIZE):
+        self.cacheDir=cacheDir
+        self.maxSize=maxSize
+        self.hits=0
+        self.misses=0
+        self.bytesLoaded=0
+        if not os.path.isdir(cacheDir):
+            os.makedirs(cacheDir)
+
+    """ Identity of a dump file for the given parser kind """
+    def entryPath(self,filePath,kind):
+        st=os.stat(filePath)
+        h=hashlib.sha1()
+        h.update("%d\0%s\0%s\0%d\0%d\0"%(CACHE_FORMAT,kind,os.path.abspath(filePath),st.st_size,int(st.st_mtime*1000)))
+        with open(filePath,'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE),""):
+                h.update(chunk)
+        return os.path.join(self.cacheDir,h.hexdigest()+".cache")
+
+    """ Return the cached parse result of filePath, or None """
+    def get(self,filePath,kind,path=None):
+        path=path or self.entryPath(filePath,kind)
+        try:
+            with open(path,'rb') as f:
+                buf=mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ)
+            try:
+                result=self.readEntry(filePath,buf)
+                size=len(buf)
+            finally:
+                buf.close()
+        except (IOError,ValueError,struct.error,IndexError,UnicodeDecodeError,mmap.error):
+            result=None
+        if result is None:
+            self.misses+=1
+            return None
+        os.utime(path,None)
+        self.hits+=1
+        self.bytesLoaded+=size
+        return result
+
+    def readEntry(self,filePath,buf):
+        magic,format,layout,count,numColumns=ENTRY_HEADER.unpack_from(buf,0)
+        if magic != ENTRY_MAGIC or format != CACHE_FORMAT:
+            return None
+        pos=ENTRY_HEADER.size
+        columns=[]
+        for i in range(numColumns+1):
+            code,size=COLUMN_HEADER.unpack_from(buf,pos)
+            pos+=COLUMN_HEADER.size
+            if code == 'q':
+                column=array(UINT64)
+                column.fromstring(buf[pos:pos+size])
+                if len(column) != count:
+                    return None
+                column=column.tolist()
+            else:
+                column=unpackStrings(buf,pos,count,code)
+            columns.append(column)
+            pos+=size
+        return decodeResult(filePath,layout,columns[0],columns[1:])
+
+    def put(self,filePath,kind,result,path=None):
+        path=path or self.entryPath(filePath,kind)
+        try:
+            layout,keys,columns=encodeResult(filePath,result)
+            columns=[(stringCode(keys),keys)]+columns
+        except LayoutError:
+            return
+        tmp=path+".tmp%d"%os.getpid()
+        with open(tmp,'wb') as f:
+            f.write(ENTRY_HEADER.pack(ENTRY_MAGIC,CACHE_FORMAT,layout,len(keys),len(columns)-1))
+            for code,values in columns:
+                if code == 'q':
+                    data=array(UINT64,values).tostring()
+                else:
+                    data=packStrings(values,code)
+                f.write(COLUMN_HEADER.pack(code,len(data)))
+                f.write(data)
+        os.rename(tmp,path)
+        self.evict()
+
+    """ Remove least recently used entries until the cache fits in maxSize """
+    def evict(self):
+        entries=[]
+        total=0
+        for path in glob.glob(os.path.join(self.cacheDir,"*.cache")):
+            try:
+                st=os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime,st.st_size,path))
+            total+=st.st_size
+        entries.sort()
+        while total > self.maxSize and entries:
+            mtime,size,path=entries.pop(0)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total-=size
+
+    """ Parse files through the cache, files that are not cached are parsed
+        by mapper(files, parser), for example in a worker pool, and added.
+        Pipes and stdin are parsed but never cached
+    """
+    def parseFiles(self,files,parser,mapper):
+        kind=parser.__name__
+        paths=[self.entryPath(file,kind) if isRegularFile(file) else None for file in files]
+        cached=[path is not None and os.path.exists(path) for path in paths]
+        missing=mapper([file for file,hit in zip(files,cached) if not hit],parser)
+        for file,path,hit in zip(files,paths,cached):
+            if hit:
+                result=self.get(file,kind,path)
+                if result is None:
+                    result=parser(file)
+                    self.put(file,kind,result,path)
+            else:
+                self.misses+=1
+                result=next(missing)
+                if path is not None:
+                    self.put(file,kind,result,path)
+            yield result
+
+    def report(self):
+        print "Parse cache :: hits",self.hits,":: misses",self.misses,":: bytes loaded from cache",self.bytesLoaded
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+import os
+import zlib
+import marshal
+
+""" Number of vBuckets of a Couchbase bucket """
+NUM_VBUCKETS=1024
+
+""" Default number of partitions used by the partitioned comparison """
+DEFAULT_PARTITIONS=64
+
+""" Couchbase vBucket of a key, CRC32 of the key mapped onto numVbuckets """
+def vbucketOf(key,numVbuckets=NUM_VBUCKETS):
+    if isinstance(key,unicode):
+        key=key.encode('utf-8')
+    return ((zlib.crc32(key) & 0xffffffff) >> 16 & 0x7fff) & (numVbuckets-1)
+
+""" Partition of a key, every partition holds whole vBuckets """
+def partitionOf(key,partitions=DEFAULT_PARTITIONS):
+    return vbucketOf(key) % partitions
+
+def partitionPath(workDir,side,fileId,partition):
+    return os.path.join(workDir,"%s-%d-%d.part"%(side,fileId,partition))
+
+""" Bytes a partition buffers in memory before they are appended to its spill file """
+PARTITION_BUFFER_SIZE=64*1024
+
+""" Writes the records of one input file into one spill file per partition
+    Records are buffered per partition and appended in batches, so no spill
+    file is held open and any number of partitions stays within the open
+    file limit
+"""
+class PartitionWriter(object):
+
+    def __init__(self,workDir,side,fileId,partitions=DEFAULT_PARTITIONS):
+        self.paths=[partitionPath(workDir,side,fileId,p) for p in range(partitions)]
+        for path in self.paths:
+            open(path,'wb').close()
+        self.buffers=[[] for p in range(partitions)]
+        self.sizes=[0]*partitions
+        self.partitions=partitions
+        self.count=0
+
+    def add(self,key,payload):
+        partition=partitionOf(key,self.partitions)
+        data=marshal.dumps((key,payload))
+        self.buffers[partition].append(data)
+        self.sizes[partition]+=len(data)
+        if self.sizes[partition] >= PARTITION_BUFFER_SIZE:
+            self.flush(partition)
+        self.count+=1
+
+    def flush(self,partition):
+        if self.buffers[partition]:
+            with open(self.paths[partition],'ab') as f:
+                f.write("".join(self.buffers[partition]))
+            self.buffers[partition]=[]
+            self.sizes[partition]=0
+
+    def close(self):
+        for partition in range(self.partitions):
+            self.flush(partition)
+
+""" Yield (key, payload) of one partition of one input file in write order """
+def readPartition(workDir,side,fileId,partition):
+    path=partitionPath(workDir,side,fileId,partition)
+    with open(path,'rb',64*1024) as f:
+        while True:
+            try:
+                yield marshal.load(f)
+            except EOFError:
+                break
+
+""" Count src-only, tgt-only and changed keys per vBucket """
+def countByVbucket(diff1,diff2,diff3):
+    result={}
+    for index,diff in enumerate((diff1,diff2,diff3)):
+        for key in diff:
+            vb=vbucketOf(key)
+            if vb not in result:
+                result[vb]=[0,0,0]
+            result[vb][index]+=1
+    return result
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+import sys
+import operator
+
+from csv_scanner import CSVScanner, decodeValue
+
+""" Columns of a cbtransfer CSV record, as named by --fields """
+FIELD_NAMES=("key","exp","flag","cas","rev","value")
+
+""" Labels of the record fields in a changed key report, by record position,
+    as used by DataComparator.differenceInValuesInCSVFormat
+"""
+FIELD_LABELS=('Exp','Flag','CAS','Rev','Value')
+
+""" Parser and comparator of cbt dumps restricted to some fields
+    fields is a comma separated list of FIELD_NAMES; the key is always
+    kept. Parsing a file keeps key -> tuple of the requested fields only, or
+    key -> None when only keys are requested, and the value is only read
+    and decoded when it is requested. compare checks the requested fields only and
+    expand turns a projected record back into the [Exp, Flag, CAS, Rev id,
+    Value] layout, with None for the fields that were not read, for the
+    reports. Instances are picklable so that they can be used as the
+    parser of worker processes.
+"""
+class Projection(object):
+
+    def __init__(self,fields):
+        names=[name.strip().lower() for name in fields.split(",") if name.strip()]
+        for name in names:
+            if name not in FIELD_NAMES:
+                raise ValueError("Unknown field ::"+name+", expected some of "+",".join(FIELD_NAMES))
+        self.positions=tuple(sorted(set(FIELD_NAMES.index(name)-1 for name in names if name != "key")))
+        self.__name__="parseCSVFileFields_"+"_".join(FIELD_NAMES[p+1] for p in self.positions)
+
+    def names(self):
+        return ["key"]+[FIELD_NAMES[p+1] for p in self.positions]
+
+    def keysOnly(self):
+        return not self.positions
+
+    """ Parse a CSV dump into key -> projected record """
+    def __call__(self,filePath):
+        info={}
+        try:
+            if self.keysOnly():
+                return dict.fromkeys(CSVScanner(filePath).keys())
+            columns=[p+1 for p in self.positions]
+            decode=columns[-1] == len(FIELD_NAMES)-1
+            # without the value only the fields up to the last requested one are split
+            records=CSVScanner(filePath) if decode else CSVScanner(filePath).fields(columns[-1]+1)
+            if len(columns) == 1:
+                column=columns[0]
+                for record in records:
+                    info[record[0]]=(decodeValue(record[column]) if decode else record[column],)
+                return info
+            get=operator.itemgetter(*columns)
+            for record in records:
+                fields=get(record)
+                if decode:
+                    fields=fields[:-1]+(decodeValue(fields[-1]),)
+                info[record[0]]=fields
+        except Exception, err:
+            sys.stderr.write('ERROR: %s\n' % str(err))
+        return info
+
+    """ Compare two projected records like differenceInValuesInCSVFormat """
+    def compare(self,val1,val2):
+        message={}
+        if val1 == val2:
+            return False,message
+        for i,p in enumerate(self.positions):
+            if val1[i] != val2[i]:
+                message[FIELD_LABELS[p]]=[val1[i]],[val2[i]]
+        return True,message
+
+    """ [Exp, Flag, CAS, Rev id, Value] of a projected record """
+    def expand(self,record):
+        full=[None]*len(FIELD_LABELS)
+        for i,p in enumerate(self.positions):
+            full[p]=record[i]
+        return full
@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+import itertools
+from array import array
+
+from digest_tree import valueDigest
+
+try:
+    import numpy
+except ImportError:
+    numpy=None
+
+""" Type code of an unsigned 64 bit array """
+UINT64=array('L').itemsize == 8 and 'L' or 'Q'
+
+""" Columns of a record store, index into a {Key, Exp, Flag, CAS, Rev id, Value} record """
+COLUMNS=(("exp",'I'),("flag",'I'),("cas",UINT64),("rev",UINT64),("value",UINT64))
+
+""" Compact columnar store of cbtransfer records
+    Exp, Flag, CAS and Rev are parsed once into fixed width integer arrays,
+    the value is kept as a 64 bit digest plus the (file, offset, length) of
+    the body so that changed bodies can be read back for the report.
+    A metadata field whose text is not the canonical decimal form of an
+    integer of its column width ("010", "1e3", "x") is kept as text in a
+    sparse map of the column instead, 0 in the array, so fields compare
+    like their text does in memory.
+    Keys are appended to one character arena with start and length arrays
+    and a 64 bit digest per key; no per key object is held while loading.
+    finish() orders the rows by (digest, key), keeps the last record of
+    every key and reorders the arrays, so two stores can be aligned by a
+    merge walk and their columns compared as a whole (with numpy when
+    installed).
+"""
+class RecordStore(object):
+
+    def __init__(self):
+        self.arena=array('c')
+        self.keyStarts=array(UINT64)
+        self.keyLengths=array('I')
+        self.hashes=array(UINT64)
+        self.columns=dict((name,array(code)) for name,code in COLUMNS)
+        self.fileIds=array('I')
+        self.offsets=array(UINT64)
+        self.lengths=array('I')
+        self.files=[]
+        self.text=dict((name,{}) for name,code in COLUMNS[:4])
+
+    def addFile(self,name):
+        self.files.append(name)
+        return len(self.files)-1
+
+    """ Add a record as read by iterCSVRecords with digestValues """
+    def add(self,key,record,fileId):
+        row=len(self.hashes)
+        for n,(name,code) in enumerate(COLUMNS[:4]):
+            text=record[n]
+            if text.isdigit() and (text[0] != "0" or len(text) == 1):
+                try:
+                    self.columns[name].append(int(text))
+                    continue
+                except OverflowError:
+                    pass
+            self.columns[name].append(0)
+            self.text[name][row]=text
+        self.columns["value"].append(record[4])
+        self.keyStarts.append(len(self.arena))
+        self.keyLengths.append(len(key))
+        self.arena.fromstring(key)
+        self.hashes.append(valueDigest(key))
+        self.fileIds.append(fileId)
+        self.offsets.append(record[5][1])
+        self.lengths.append(record[5][2])
+
+    """ Order the rows by (digest, key) and keep the last record of every key """
+    def finish(self):
+        hashes=self.hashes
+        if numpy is not None:
+            order=array('L',numpy.frombuffer(hashes,dtype=numpy.uint64).argsort(kind="mergesort").tostring())
+        else:
+            order=array('L',sorted(xrange(len(hashes)),key=hashes.__getitem__))
+        self.arena=self.arena.tostring()
+        last=array('L')
+        n=len(order)
+        i=0
+        while i < n:
+            j=i+1
+            while j < n and hashes[order[j]] == hashes[order[i]]:
+                j+=1
+            if j == i+1:
+                last.append(order[i])
+            else:
+                # duplicate keys, rarely a digest collision: last row of each key, by key
+                rows={}
+                for r in order[i:j]:
+                    rows[self.key(r)]=r
+                for key in sorted(rows):
+                    last.append(rows[key])
+            i=j
+        order=None
+        for name,code in COLUMNS:
+            column=self.columns[name]
+            self.columns[name]=array(code,(column[r] for r in last))
+        for name in ("keyStarts","keyLengths","hashes","fileIds","offsets","lengths"):
+            column=getattr(self,name)
+            setattr(self,name,array(column.typecode,(column[r] for r in last)))
+        if any(self.text.itervalues()):
+            position=dict((r,n) for n,r in enumerate(last))
+            for name in self.text:
+                self.text[name]=dict((position[r],v) for r,v in self.text[name].iteritems() if r in position)
+
+    def key(self,i):
+        start=self.keyStarts[i]
+        if isinstance(self.arena,array):
+            return self.arena[start:start+self.keyLengths[i]].tostring()
+        return self.arena[start:start+self.keyLengths[i]]
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def location(self,i):
+        return (self.files[self.fileIds[i]],self.offsets[i],self.lengths[i])
+
+    """ Metadata field of record i as the text read from the dump """
+    def field(self,name,i):
+        text=self.text[name].get(i)
+        if text is None:
+            return str(self.columns[name][i])
+        return text
+
+    """ Record i in the list form used by the in memory comparison """
+    def record(self,i):
+        return [self.field(name,i) for name,code in COLUMNS[:4]]+[self.columns["value"][i],self.location(i)]
+
+    """ Align two finished stores by (digest, key)
+        Returns the src only indexes, the tgt only indexes and the paired
+        indexes of the common keys
+    """
+    def align(self,other):
+        srcOnly=array('L')
+        tgtOnly=array('L')
+        srcCommon=array('L')
+        tgtCommon=array('L')
+        i=j=0
+        n=len(self)
+        m=len(other)
+        while i < n and j < m:
+            a=self.hashes[i]
+            b=other.hashes[j]
+            if a == b:
+                a=self.key(i)
+                b=other.key(j)
+            if a < b:
+                srcOnly.append(i)
+                i+=1
+            elif a > b:
+                tgtOnly.append(j)
+                j+=1
+            else:
+                srcCommon.append(i)
+                tgtCommon.append(j)
+                i+=1
+                j+=1
+        srcOnly.extend(xrange(i,n))
+        tgtOnly.extend(xrange(j,m))
+        return srcOnly,tgtOnly,srcCommon,tgtCommon
+
+    """ Positions (into the common index arrays) where a column differs from
+        the column of another store, fields kept as text compared as text
+    """
+    def differingPositions(self,other,name,srcCommon,tgtCommon):
+        positions=RecordStore.differingRows(self.columns[name],other.columns[name],srcCommon,tgtCommon)
+        srcText=self.text.get(name)
+        tgtText=other.text.get(name)
+        if not srcText and not tgtText:
+            return positions
+        positions=set(positions)
+        for n,(i,j) in enumerate(itertools.izip(srcCommon,tgtCommon)):
+            if i in srcText or j in tgtText:
+                if self.field(name,i) != other.field(name,j):
+                    positions.add(n)
+                else:
+                    positions.discard(n)
+        return sorted(positions)
+
+    """ Positions (into the common index arrays) where a column differs """
+    @staticmethod
+    def differingRows(srcColumn,tgtColumn,srcCommon,tgtCommon):
+        if numpy is not None:
+            src=numpy.frombuffer(srcColumn,dtype=srcColumn.typecode)[numpy.frombuffer(srcCommon,dtype=srcCommon.typecode)]
+            tgt=numpy.frombuffer(tgtColumn,dtype=tgtColumn.typecode)[numpy.frombuffer(tgtCommon,dtype=tgtCommon.typecode)]
+            return numpy.flatnonzero(src != tgt).tolist()
+        src=itertools.imap(srcColumn.__getitem__,srcCommon)
+        tgt=itertools.imap(tgtColumn.__getitem__,tgtCommon)
+        return [n for n,(a,b) in enumerate(itertools.izip(src,tgt)) if a != b]
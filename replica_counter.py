@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+import itertools
+from array import array
+
+""" Per key replica accounting for view dumps
+    Every key gets a slot in a dict, the number of copies seen and the
+    first file the key came from are kept in flat arrays indexed by slot.
+    Further files are only recorded for the (rare) keys that show up in
+    more than one file, so the common case costs a dict entry and two
+    array cells per key. Counts are accumulated across all added files.
+"""
+class ReplicaCounter(object):
+
+    def __init__(self):
+        self.index={}
+        self.counts=array('I')
+        self.firstFile=array('I')
+        self.otherFiles={}
+        self.files=[]
+
+    """ Counter of a single file from its keys and the copies of each key """
+    @staticmethod
+    def ofFile(name,keys,counts):
+        counter=ReplicaCounter()
+        fileId=counter.addFile(name)
+        counter.index=dict(itertools.izip(keys,xrange(len(keys))))
+        counter.counts=array('I',counts)
+        counter.firstFile=array('I',[fileId])*len(keys)
+        return counter
+
+    """ Register an input file (or node) and return its id """
+    def addFile(self,name):
+        self.files.append(name)
+        return len(self.files)-1
+
+    """ Record one copy of key read from the file with the given id """
+    def add(self,key,fileId):
+        slot=self.index.get(key)
+        if slot is None:
+            self.index[key]=len(self.counts)
+            self.counts.append(1)
+            self.firstFile.append(fileId)
+            return
+        self.counts[slot]+=1
+        if self.firstFile[slot] == fileId:
+            return
+        others=self.otherFiles.get(slot)
+        if others is None:
+            self.otherFiles[slot]=[fileId]
+        elif fileId not in others:
+            others.append(fileId)
+
+    """ Add all the copies and files recorded by another counter """
+    def merge(self,other):
+        fileIds=[self.addFile(name) for name in other.files]
+        for key,slot in other.index.iteritems():
+            files=other.fileIdsOfSlot(slot)
+            for fileId in files:
+                self.add(key,fileIds[fileId])
+            self.counts[self.index[key]]+=other.counts[slot]-len(files)
+
+    def fileIdsOfSlot(self,slot):
+        return [self.firstFile[slot]]+self.otherFiles.get(slot,[])
+
+    """ Number of copies seen for key """
+    def count(self,key):
+        slot=self.index.get(key)
+        if slot is None:
+            return 0
+        return self.counts[slot]
+
+    """ Names of the files key was seen in """
+    def filesOf(self,key):
+        slot=self.index.get(key)
+        if slot is None:
+            return []
+        return [self.files[f] for f in self.fileIdsOfSlot(slot)]
+
+    """ Map of key to [count, files] for every key whose count is not expected """
+    def mismatches(self,expected=1):
+        result={}
+        counts=self.counts
+        for key,slot in self.index.iteritems():
+            if counts[slot] != expected:
+                result[key]=[int(counts[slot]),[self.files[f] for f in self.fileIdsOfSlot(slot)]]
+        return result
+
+    def __len__(self):
+        return len(self.counts)
+
+    def __contains__(self,key):
+        return key in self.index
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+import sys
+import csv
+import json
+import random
+
+from partition import vbucketOf
+
+""" Diff categories in report order """
+CATEGORIES=("srcOnly","tgtOnly","changed","srcReplicaCount","tgtReplicaCount")
+
+""" Size of the output buffer of a report file """
+REPORT_BUFFER_SIZE=1024*1024
+
+""" Base class of the structured report writers
+    Discrepancies are handed to add() while the comparison runs. Counts per
+    category and per vBucket are always kept; examples are written as they
+    arrive up to maxExamples per category, or with sample=True a uniform
+    random sample of maxExamples per category is kept (reservoir sampling)
+    and written by close(). maxExamples=0 writes only the summary.
+    Without a path the report goes to out (default stdout).
+"""
+class ReportWriter(object):
+
+    def __init__(self,path=None,maxExamples=None,sample=False,seed=1,out=None):
+        self.path=path
+        self.out=open(path,'w',REPORT_BUFFER_SIZE) if path else out or sys.stdout
+        self.maxExamples=maxExamples
+        self.sample=sample and maxExamples
+        self.random=random.Random(seed)
+        self.counts=dict((c,0) for c in CATEGORIES)
+        self.byVbucket={}
+        self.samples=dict((c,[]) for c in CATEGORIES)
+
+    def add(self,category,key,detail):
+        self.counts[category]+=1
+        vb=vbucketOf(key)
+        if vb not in self.byVbucket:
+            self.byVbucket[vb]=dict((c,0) for c in CATEGORIES)
+        self.byVbucket[vb][category]+=1
+        seen=self.counts[category]
+        if self.sample:
+            if seen <= self.maxExamples:
+                self.samples[category].append((key,vb,detail))
+            else:
+                slot=self.random.randint(0,seen-1)
+                if slot < self.maxExamples:
+                    self.samples[category][slot]=(key,vb,detail)
+        elif self.maxExamples is None or seen <= self.maxExamples:
+            self.writeExample(category,key,vb,detail)
+
+    def summary(self):
+        return {"counts":self.counts,"byVbucket":dict((str(vb),c) for vb,c in sorted(self.byVbucket.items()))}
+
+    def close(self):
+        if self.sample:
+            for category in CATEGORIES:
+                for key,vb,detail in self.samples[category]:
+                    self.writeExample(category,key,vb,detail)
+        self.writeSummary()
+        if self.path:
+            self.out.close()
+        else:
+            self.out.flush()
+
+    def writeExample(self,category,key,vb,detail):
+        pass
+
+    def writeSummary(self):
+        json.dump(self.summary(),self.out,indent=2,sort_keys=True)
+        self.out.write("\n")
+
+""" One JSON object per discrepancy, followed by a summary object """
+class JsonlReportWriter(ReportWriter):
+
+    def writeExample(self,category,key,vb,detail):
+        self.out.write(json.dumps({"category":category,"key":key,"vbucket":vb,"detail":detail}))
+        self.out.write("\n")
+
+    def writeSummary(self):
+        self.out.write(json.dumps({"summary":self.summary()},sort_keys=True))
+        self.out.write("\n")
+
+""" category,key,vbucket,field,source,target rows, one row per changed field """
+class CsvReportWriter(ReportWriter):
+
+    def __init__(self,path=None,maxExamples=None,sample=False,seed=1,out=None):
+        ReportWriter.__init__(self,path,maxExamples,sample,seed,out)
+        self.writer=csv.writer(self.out)
+        self.writer.writerow(("category","key","vbucket","field","source","target"))
+
+    def writeExample(self,category,key,vb,detail):
+        if isinstance(key,unicode):
+            key=key.encode('utf-8')
+        if category == "changed" and isinstance(detail,dict):
+            for field in sorted(detail):
+                self.writer.writerow((category,key,vb,field,json.dumps(detail[field][0]),json.dumps(detail[field][1])))
+        elif category == "changed":
+            self.writer.writerow((category,key,vb,"value",json.dumps(detail[0]),json.dumps(detail[1])))
+        elif category in ("srcOnly","srcReplicaCount"):
+            self.writer.writerow((category,key,vb,"",json.dumps(detail),""))
+        else:
+            self.writer.writerow((category,key,vb,"","",json.dumps(detail)))
+
+    def writeSummary(self):
+        for category in CATEGORIES:
+            self.writer.writerow(("summary",category,"","count",self.counts[category],""))
+
+""" Only the counts per category and per vBucket """
+class SummaryReportWriter(ReportWriter):
+
+    def __init__(self,path=None,maxExamples=None,sample=False,seed=1,out=None):
+        ReportWriter.__init__(self,path,0,False,seed,out)
+
+REPORT_WRITERS={"jsonl":JsonlReportWriter,"csv":CsvReportWriter,"summary":SummaryReportWriter}
+
+""" Create the report writer for a format name """
+def createReportWriter(format,path=None,maxExamples=None,sample=False,seed=1,out=None):
+    if format not in REPORT_WRITERS:
+        raise ValueError("Unknown report format ::"+format)
+    return REPORT_WRITERS[format](path,maxExamples,sample,seed,out)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+import sys
+import os
+import time
+import json
+import resource
+import contextlib
+
+""" Peak resident set size of this process in bytes """
+def peakRss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss*1024
+
+def cpuTime():
+    t=os.times()
+    return t[0]+t[1]
+
+""" Collects per stage and per file metrics of a comparison run
+    - stages: wall time, cpu time, the process peak RSS at the end of each
+      stage and how much the stage raised that peak
+    - files: records parsed and bytes read per dump file
+    - discrepancies: count of every diff category
+    Cpu time and RSS are of this process only, -j worker processes are
+    not included (the JSON document says so in its scope field).
+    The metrics are written as one JSON document, and a progress line with
+    an ETA based on the bytes parsed so far can be shown on stderr.
+"""
+class RunMetrics(object):
+
+    def __init__(self,progress=False):
+        self.start=time.time()
+        self.stages=[]
+        self.files=[]
+        self.discrepancies={}
+        self.progress=progress
+        self.expectedBytes=0
+        self.parsedBytes=0
+        self.parseStart=None
+
+    """ Time a named stage of the run """
+    @contextlib.contextmanager
+    def stage(self,name):
+        wall=time.time()
+        cpu=cpuTime()
+        peak=peakRss()
+        try:
+            yield
+        finally:
+            processPeak=peakRss()
+            self.stages.append({"stage":name,"wallSeconds":time.time()-wall,"cpuSeconds":cpuTime()-cpu,
+                                "processPeakRssBytes":processPeak,"peakRssGrowthBytes":processPeak-peak})
+
+    """ Announce the files about to be parsed, used for the progress ETA """
+    def expectFiles(self,files):
+        for file in files:
+            try:
+                self.expectedBytes+=os.path.getsize(file)
+            except OSError:
+                pass
+        if self.parseStart is None:
+            self.parseStart=time.time()
+
+    def fileParsed(self,path,records):
+        try:
+            size=os.path.getsize(path)
+        except OSError:
+            size=0
+        self.files.append({"file":path,"records":records,"bytes":size})
+        self.parsedBytes+=size
+        if self.progress:
+            self.showProgress()
+
+    def showProgress(self):
+        elapsed=time.time()-(self.parseStart or self.start)
+        rate=self.parsedBytes/elapsed if elapsed > 0 else 0
+        remaining=max(0,self.expectedBytes-self.parsedBytes)
+        eta=remaining/rate if rate else 0
+        sys.stderr.write("\rParsed %d file(s) :: %.1f of %.1f MB :: %.1f MB/s :: ETA %ds   "%(
+            len(self.files),self.parsedBytes/1048576.0,self.expectedBytes/1048576.0,rate/1048576.0,eta))
+        if remaining == 0:
+            sys.stderr.write("\n")
+        sys.stderr.flush()
+
+    def countDiscrepancies(self,category,count):
+        self.discrepancies[category]=count
+
+    def toDict(self):
+        return {"scope":"main process, -j worker processes not included",
+                "wallSeconds":time.time()-self.start,"cpuSeconds":cpuTime(),
+                "recordsParsed":sum(f["records"] for f in self.files),
+                "bytesRead":sum(f["bytes"] for f in self.files),
+                "processPeakRssBytes":peakRss(),"stages":self.stages,"files":self.files,"discrepancies":self.discrepancies}
+
+    def write(self,path):
+        with open(path,'w') as f:
+            json.dump(self.toDict(),f,indent=2)
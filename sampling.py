@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+import math
+
+from digest_tree import digest64
+
+""" Standard normal quantile of the confidence intervals of sampled estimates (95%) """
+SAMPLE_CONFIDENCE_Z=1.96
+
+HASH_SPACE=1 << 64
+
+""" Deterministic sample of the keys of a bucket
+    A key is in the sample when its 64 bit digest is below rate * 2^64, so
+    every side and every process picks the same keys without coordinating
+    and a key is either sampled on both sides or on none. The digest is the
+    fixed digest64 and not valueDigest, whose hash depends on whether
+    xxhash is installed, so hosts with different modules sample alike. Counts of the
+    sample are scaled up by 1/rate with a confidence interval at
+    SAMPLE_CONFIDENCE_Z from the binomial variance of the sampling.
+    sampledRecords holds the number of sampled records of each side once
+    a comparison has set it.
+"""
+class KeySampler(object):
+
+    def __init__(self,rate,z=SAMPLE_CONFIDENCE_Z):
+        if not 0 < rate <= 1:
+            raise ValueError("Sample rate must be in (0, 1] ::"+str(rate))
+        self.rate=rate
+        self.z=z
+        self.threshold=int(rate*HASH_SPACE)
+        self.sampledRecords=(0,0)
+
+    def accepts(self,key):
+        return digest64(key) < self.threshold
+
+    """ (low, estimate, high) of the count in the whole bucket of a count
+        observed in the sample; the low bound is never below the observed
+        count, which is certain
+    """
+    def scale(self,observed):
+        estimate=observed/self.rate
+        spread=self.z*math.sqrt(max(observed,1)*(1-self.rate))/self.rate
+        return (max(observed,estimate-spread),estimate,estimate+spread)
+
+    """ (low, estimate, high) of the fraction observed / total of the sample,
+        Wilson score interval narrowed by the finite population correction,
+        so that a sample of every key gives the exact fraction
+    """
+    def fraction(self,observed,total):
+        if total == 0:
+            return (0.0,0.0,1.0)
+        z2=self.z*self.z
+        p=observed/float(total)
+        center=(p+z2/(2*total))/(1+z2/total)
+        spread=self.z*math.sqrt(p*(1-p)/total+z2/(4.0*total*total))/(1+z2/total)
+        correction=math.sqrt(1-self.rate)
+        low=max(0.0,center-spread)
+        high=min(1.0,center+spread)
+        return (p-(p-low)*correction,p,p+(high-p)*correction)
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+import re
+import ast
+import json
+
+from dump_reader import openDump
+
+""" Size of each read from the view dump """
+READ_CHUNK_SIZE=1024*1024
+
+ROWS_PATTERN=re.compile(r'["\']rows["\']\s*:\s*\[')
+STRUCTURE_PATTERN=re.compile(r'["\'{}\[\]]')
+VALUE_START_PATTERN=re.compile(r'[^\s,]')
+
+""" Streaming reader for view dumps in the format
+        {total_rows: xxx, rows: [{id: <key>, key: <key>, value: <rev meta data>}, ...]}
+    The dump is read in chunks and the rows array is cut into one row
+    object at a time, so only a single row is ever parsed and held in memory.
+    Rows are accepted both as strict JSON and as python literals
+    (single quotes, u'' strings, True/False/None) like the view output
+    previously parsed with ast.literal_eval
+"""
+class ViewRowReader(object):
+
+    def __init__(self,f,chunkSize=READ_CHUNK_SIZE):
+        self.f=f
+        self.chunkSize=chunkSize
+        self.buffer=""
+        self.pos=0
+        self.eof=False
+
+    """ Read the next chunk, dropping the consumed part of the buffer """
+    def fill(self):
+        if self.eof:
+            return False
+        chunk=self.f.read(self.chunkSize)
+        if not chunk:
+            self.eof=True
+            return False
+        self.buffer=self.buffer[self.pos:]+chunk
+        self.pos=0
+        return True
+
+    """ Position the reader just after the opening bracket of the rows array """
+    def seekRows(self):
+        while True:
+            m=ROWS_PATTERN.search(self.buffer,self.pos)
+            if m:
+                self.pos=m.end()
+                return True
+            # keep a short tail in case the token is split across chunks
+            self.pos=max(self.pos,len(self.buffer)-32)
+            if not self.fill():
+                return False
+
+    """ Return the end offset of the string literal starting at start """
+    def endOfString(self,start):
+        quote=self.buffer[start]
+        i=start+1
+        while True:
+            j=self.buffer.find(quote,i)
+            if j < 0:
+                return -1
+            k=j-1
+            while self.buffer[k] == "\\":
+                k-=1
+            if (j-k)%2 == 1:
+                return j+1
+            i=j+1
+
+    """ Return the text of the next row object, or None at the end of the rows """
+    def nextRowText(self):
+        while True:
+            m=VALUE_START_PATTERN.search(self.buffer,self.pos)
+            if m:
+                break
+            self.pos=len(self.buffer)
+            if not self.fill():
+                return None
+        self.pos=m.start()
+        if self.buffer[self.pos] == "]":
+            return None
+        if self.buffer[self.pos] != "{":
+            raise ValueError("Unexpected view row at ::"+self.buffer[self.pos:self.pos+40])
+        depth=0
+        i=self.pos
+        while True:
+            m=STRUCTURE_PATTERN.search(self.buffer,i)
+            if not m:
+                i=len(self.buffer)-self.pos
+                if not self.fill():
+                    raise ValueError("Truncated view dump")
+                i+=self.pos
+                continue
+            c=m.group()
+            if c == '"' or c == "'":
+                end=self.endOfString(m.start())
+                if end < 0:
+                    i=m.start()-self.pos
+                    if not self.fill():
+                        raise ValueError("Truncated view dump")
+                    i+=self.pos
+                    # rescan the string from its opening quote
+                    continue
+                i=end
+            elif c == "{" or c == "[":
+                depth+=1
+                i=m.end()
+            else:
+                depth-=1
+                i=m.end()
+                if depth == 0:
+                    text=self.buffer[self.pos:i]
+                    self.pos=i
+                    return text
+
+    """ Parse one row, as JSON first and as a python literal otherwise """
+    @staticmethod
+    def parseRow(text):
+        try:
+            return json.loads(text)
+        except ValueError:
+            return ast.literal_eval(text)
+
+    def __iter__(self):
+        if not self.seekRows():
+            return
+        while True:
+            text=self.nextRowText()
+            if text is None:
+                return
+            yield ViewRowReader.parseRow(text)
+
+""" Yield (key, value) for every row of the view dump at filePath """
+def iterViewRows(filePath):
+    with openDump(filePath) as f:
+        for r in ViewRowReader(f):
+            yield r['key'],r['value']